@@ -0,0 +1,247 @@
+#-------------------------------------------------------------------------------
+# Name:        NetCdfUtilsBatch.py
+# Purpose:     headless command line and batch job entry point for the NetCdfUtilsGUI operations
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Description: a JobSettings object stands in for the GUI form so that the operations can run on compute nodes
+#              without Qt; a JSON job file lists many (scenario, GCM, operation) combinations
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+__prog__ = 'NetCdfUtilsBatch.py'
+__version__ = '0.0.0'
+__author__ = 's03mm5'
+
+from argparse import ArgumentParser
+from os.path import join
+from multiprocessing import Pool, current_process
+from time import time
+import json
+import sys
+
+from initialise_netcdf_utils import initiation
+from weather_aggregation import wthr_aggreg
+from eclips_reorg import make_empty_eclips_dsets, populate_eclips_dsets
+from jinfeng_reorg import concat_jinfeng_dsets
+from grazing_reorg import integrate_grazing_dsets
+from make_chess_lookup_fns import make_chess_lookup_table
+from post_process_funcs import subtract_turkey
+from profiling_fns import profiled_job
+from spec_utilities import JobCancelled
+
+ERROR_STR = '*** Error *** '
+PROFILE_FN = 'netcdf_utils_timings.jsonl'
+
+OPERATIONS = {'make_empty_eclips': make_empty_eclips_dsets, 'populate_eclips': populate_eclips_dsets,
+              'concat_jinfeng': concat_jinfeng_dsets, 'integrate_grazing': integrate_grazing_dsets,
+              'wthr_aggreg': None, 'chess_lookup': make_chess_lookup_table, 'subtract_turkey': subtract_turkey}
+
+# settings which start process pools - forced to 1 when a job runs in a worker of the job file pool
+# ==================================================================================================
+NESTED_NPROCS = ['sweep_nprocs', 'backend_nprocs', 'qa_nprocs']
+
+# job keys and defaults - names follow the user_settings of the GUI configuration file
+# ====================================================================================
+JOB_DEFAULTS = {'scenario': 'RCP45', 'gcm': 'CLMcom_CCLM', 'overwrite': True, 'pop_hist_flag': True,
+                'pop_fut_flag': True, 'tave_only': False, 'sweep': False, 'fert_dir': '', 'out_dir': '',
+                'results_dir': '', 'sims_dir': '', 'regions_fname': '', 'profile': False}
+
+class _Setting(object, ):
+    '''
+    stands in for the Qt widget from which an operation reads a single value
+    '''
+    def __init__(self, value):
+        self.value = value
+
+    def currentText(self):
+        return str(self.value)
+
+    def isChecked(self):
+        return bool(self.value)
+
+    def text(self):
+        return str(self.value)
+
+class JobSettings(object, ):
+    '''
+    replaces the GUI form for headless runs: exposes the attributes the operations read from the form
+    '''
+    def __init__(self, job, form = None):
+        """
+        job is a dictionary of JOB_DEFAULTS keys plus the operation name
+        when a GUI form is supplied its settings and logger are reused instead of rereading the setup file
+        """
+        for key in job:
+            if key != 'operation' and key not in JOB_DEFAULTS:
+                print(ERROR_STR + 'unrecognised job key: ' + key)
+
+        parms = dict(JOB_DEFAULTS)
+        parms.update(job)
+        self.operation = job['operation']
+        self.parms = parms
+
+        # settings from the setup file and logger
+        # =======================================
+        if form is None:
+            initiation(self)
+        else:
+            self.settings = dict(form.settings)
+            self.lgr = form.lgr
+
+        # daemonic worker processes are not allowed to have children
+        # ===========================================================
+        if current_process().daemon:
+            for key in NESTED_NPROCS:
+                self.settings[key] = 1
+
+        self.w_combo10 = _Setting(parms['scenario'])
+        self.w_combo11 = _Setting(parms['gcm'])
+        self.w_del_nc = _Setting(parms['overwrite'])
+        self.w_pop_hist = _Setting(parms['pop_hist_flag'])
+        self.w_pop_fut = _Setting(parms['pop_fut_flag'])
+        self.w_tave_only = _Setting(parms['tave_only'])
+        self.w_sweep = _Setting(parms['sweep'])
+        self.w_lbl_fertdir = _Setting(parms['fert_dir'])
+        self.w_lbl_outdir = _Setting(parms['out_dir'])
+        self.w_lbl_src = _Setting(parms['results_dir'])
+
+    def describe(self):
+        """
+        one line summary used in reports
+        """
+        return '{} scenario: {} GCM: {}'.format(self.operation, self.parms['scenario'], self.parms['gcm'])
+
+def job_from_form(form, operation):
+    '''
+    snapshot the current state of the GUI form as a job so that it can run away from the GUI thread
+    '''
+    job = {'operation': operation,
+           'scenario': form.w_combo10.currentText(),
+           'gcm': form.w_combo11.currentText(),
+           'overwrite': form.w_del_nc.isChecked(),
+           'pop_hist_flag': form.w_pop_hist.isChecked(),
+           'pop_fut_flag': form.w_pop_fut.isChecked(),
+           'tave_only': form.w_tave_only.isChecked(),
+           'sweep': form.w_sweep.isChecked(),
+           'fert_dir': form.w_lbl_fertdir.text(),
+           'out_dir': form.w_lbl_outdir.text(),
+           'results_dir': form.w_lbl_src.text()}
+
+    return job
+
+def run_job(job, form = None):
+    '''
+    run a single job and return its description, success flag and elapsed time - called in worker processes
+    or, with the GUI form supplied, in a background thread of the GUI
+    operations return True on success and None on failure; an exception fails only the job which raised it
+    '''
+    strt_time = time()
+    if job.get('operation') not in OPERATIONS:
+        print(ERROR_STR + 'operation {} must be one of: {}'.format(job.get('operation'), ', '.join(OPERATIONS)))
+        return str(job.get('operation')), False, 0.0
+
+    try:
+        settings = JobSettings(job, form)
+    except Exception as err:
+        print(ERROR_STR + 'settings of job {} failed: {}: {}'.format(job['operation'], type(err).__name__, err))
+        return job['operation'], False, time() - strt_time
+
+    print('\nStarting job: ' + settings.describe())
+
+    # per stage timing is opt-in from the job or the setup file
+    # =========================================================
+    profile_flag = settings.parms['profile'] or settings.settings.get('profile', False)
+    profile_fname = join(settings.settings['log_dir'], PROFILE_FN) if 'log_dir' in settings.settings else None
+    try:
+        with profiled_job(settings.describe(), profile_flag, profile_fname):
+            if settings.operation == 'wthr_aggreg':
+                rslt = wthr_aggreg(settings.parms['sims_dir'], settings.parms['regions_fname'])
+            else:
+                rslt = OPERATIONS[settings.operation](settings)
+        ret_code = rslt is True
+    except JobCancelled:
+        raise
+    except Exception as err:
+        print(ERROR_STR + 'job ' + settings.describe() + ' failed: {}: {}'.format(type(err).__name__, err))
+        ret_code = False
+
+    return settings.describe(), ret_code, time() - strt_time
+
+def expand_jobs(job_defns):
+    '''
+    a job may list several scenarios and/or GCMs - expand into one job per combination
+    '''
+    jobs = []
+    for job_defn in job_defns:
+        scenarios = job_defn.get('scenarios', [job_defn.get('scenario', JOB_DEFAULTS['scenario'])])
+        gcms = job_defn.get('gcms', [job_defn.get('gcm', JOB_DEFAULTS['gcm'])])
+        for scenario in scenarios:
+            for gcm in gcms:
+                job = {key: val for key, val in job_defn.items() if key not in ('scenarios', 'gcms')}
+                job['scenario'] = scenario
+                job['gcm'] = gcm
+                jobs.append(job)
+
+    return jobs
+
+def run_job_file(job_fname, nprocs = None):
+    '''
+    job file is JSON of form: {"nprocs": 2, "jobs": [{"operation": "populate_eclips", "scenarios": [...], ...}]}
+    '''
+    with open(job_fname, 'r') as fjobs:
+        job_file = json.load(fjobs)
+
+    jobs = expand_jobs(job_file['jobs'])
+    if nprocs is None:
+        nprocs = job_file.get('nprocs', 1)
+
+    print('Read {} jobs from {} - will run with {} processes'.format(len(jobs), job_fname, nprocs))
+
+    if nprocs <= 1:
+        rslts = [run_job(job) for job in jobs]
+    else:
+        with Pool(processes=nprocs) as pool:
+            rslts = pool.map(run_job, jobs, chunksize=1)
+
+    # report
+    # ======
+    nfailed = 0
+    print('\nSummary of {} jobs:'.format(len(rslts)))
+    for descr, ret_code, elapsed in rslts:
+        print('\t{:<60s}{:>8s}{:>10.1f}s'.format(descr, 'ok' if ret_code else 'FAILED', elapsed))
+        if not ret_code:
+            nfailed += 1
+
+    return nfailed
+
+def main():
+    '''
+    either run a single operation with settings from the command line or a job file
+    '''
+    parser = ArgumentParser(description='Run NetCdfUtils operations without the GUI')
+    parser.add_argument('operation', nargs='?', choices=list(OPERATIONS), help='single operation to run')
+    parser.add_argument('--job-file', help='JSON file listing jobs')
+    parser.add_argument('--nprocs', type=int, help='number of jobs to run in parallel')
+    for key, default in JOB_DEFAULTS.items():
+        if isinstance(default, bool):
+            parser.add_argument('--' + key.replace('_', '-'), type=lambda val: val.lower() in ('1', 'true', 'yes'))
+        else:
+            parser.add_argument('--' + key.replace('_', '-'))
+
+    args = parser.parse_args()
+    if args.job_file is not None:
+        nfailed = run_job_file(args.job_file, args.nprocs)
+    elif args.operation is not None:
+        job = {key: val for key, val in vars(args).items() if key in JOB_DEFAULTS and val is not None}
+        job['operation'] = args.operation
+        descr, ret_code, elapsed = run_job(job)
+        nfailed = 0 if ret_code else 1
+    else:
+        parser.print_help()
+        nfailed = 1
+
+    sys.exit(nfailed)
+
+if __name__ == '__main__':
+    main()
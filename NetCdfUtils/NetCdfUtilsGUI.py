@@ -13,19 +13,15 @@ __author__ = 's03mm5'
 
 from os.path import normpath, split, join, isfile, isdir
 import sys
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThreadPool
 from PyQt5.QtGui import QPixmap
 from PyQt5.QtWidgets import QLabel, QWidget, QApplication, QHBoxLayout, QVBoxLayout, QGridLayout, \
-                                QPushButton, QCheckBox, QFileDialog, QComboBox
+                                QPushButton, QCheckBox, QFileDialog, QComboBox, QProgressBar
 
 from initialise_netcdf_utils import initiation, read_config_file, write_config_file, report_nc_files
-from weather_aggregation import wthr_aggreg
-from eclips_reorg import make_empty_eclips_dsets, populate_eclips_dsets
-from jinfeng_reorg import concat_jinfeng_dsets
-from grazing_reorg import integrate_grazing_dsets
-from post_process_funcs import subtract_turkey
 
-from make_chess_lookup_fns import make_chess_lookup_table
+from NetCdfUtilsBatch import job_from_form
+from gui_workers import JobWorker
 
 WDGT_SIZE_60 = 60
 WDGT_SIZE_90 = 90
@@ -120,6 +116,12 @@ class Form(QWidget):
         grid.addWidget(w_tave_only, irow, 0, 1, 2)
         self.w_tave_only = w_tave_only
 
+        w_sweep = QCheckBox('Sweep all scenarios and GCMs')
+        helpText = 'Populate ECLIPS NCs for every scenario and GCM combination in one run'
+        w_sweep.setToolTip(helpText)
+        grid.addWidget(w_sweep, irow, 2, 1, 3)
+        self.w_sweep = w_sweep
+
         # ==========
         irow += 1
         w_lbl10 = QLabel('Climate Scenarios: ')
@@ -247,6 +249,34 @@ class Form(QWidget):
         w_clip_csvs.clicked.connect(self.subtractTurkey)
         grid.addWidget(w_clip_csvs, irow, 3)
 
+        # progress of queued operations which run in a background thread
+        # ===============================================================
+        irow += 1
+        w_prgrss = QProgressBar()
+        w_prgrss.setRange(0, 100)
+        w_prgrss.setValue(0)
+        grid.addWidget(w_prgrss, irow, 0, 1, 5)
+        self.w_prgrss = w_prgrss
+
+        w_cancel = QPushButton('Cancel')
+        helpText = 'Cancel running operation and any queued operations'
+        w_cancel.setToolTip(helpText)
+        w_cancel.setEnabled(False)
+        w_cancel.clicked.connect(self.cancelClicked)
+        grid.addWidget(w_cancel, irow, 5)
+        self.w_cancel = w_cancel
+
+        irow += 1
+        w_lbl_prgrss = QLabel('')
+        grid.addWidget(w_lbl_prgrss, irow, 0, 1, 7)
+        self.w_lbl_prgrss = w_lbl_prgrss
+
+        # single thread: netCDF4/HDF5 is not thread safe so further operations are queued
+        # ================================================================================
+        self.threadpool = QThreadPool()
+        self.threadpool.setMaxThreadCount(1)
+        self.workers = []
+
         # add grid to RH vertical box
         rh_vbox.addLayout(grid)
 
@@ -266,37 +296,95 @@ class Form(QWidget):
         """
 
         """
-        subtract_turkey(self)
+        self.queueJob('subtract_turkey')
+
+    def queueJob(self, operation, **parms):
+        """
+        snapshot widget settings and queue operation on the thread pool so the event loop is not blocked
+        parms are job settings which are not read from widgets
+        """
+        job = job_from_form(self, operation)
+        job.update(parms)
+        worker = JobWorker(job, self)
+        worker.signals.started.connect(self.jobStarted)
+        worker.signals.progress.connect(self.jobProgress)
+        worker.signals.finished.connect(self.jobFinished)
+        self.workers.append(worker)
+        self.w_cancel.setEnabled(True)
+        self.threadpool.start(worker)
+        self.w_lbl_prgrss.setText('Queued: {}\tjobs waiting or running: {}'.format(operation, len(self.workers)))
+
+    def jobStarted(self, operation):
+        """
+
+        """
+        self.w_prgrss.setValue(0)
+        self.w_lbl_prgrss.setText('Running: ' + operation)
+
+    def jobProgress(self, prgrss):
+        """
+        prgrss is the ProgressMeter report dictionary
+        """
+        ntotal = prgrss['completed'] + prgrss['remaining']
+        if ntotal > 0:
+            self.w_prgrss.setValue(int(100*prgrss['completed']/ntotal))
+
+        mess = prgrss['descr'] + '  Complete: {:,}  Remaining: {:,}  Rate: {:,.1f} {}/s'\
+                        .format(prgrss['completed'], prgrss['remaining'], prgrss['throughput'], prgrss['unit'])
+        if prgrss['eta'] is not None:
+            mess += '  ETA: {:.0f} minutes'.format(prgrss['eta']/60)
+        self.w_lbl_prgrss.setText(mess)
+
+    def jobFinished(self, descr, ret_code, elapsed):
+        """
+
+        """
+        self.workers = [worker for worker in self.workers if worker.signals is not self.sender()]
+        if ret_code:
+            self.w_prgrss.setValue(100)
+        self.w_lbl_prgrss.setText('{} {} after {:.1f} seconds\tjobs remaining: {}'
+                                .format(descr, 'completed' if ret_code else 'failed', elapsed, len(self.workers)))
+        if len(self.workers) == 0:
+            self.w_cancel.setEnabled(False)
+
+    def cancelClicked(self):
+        """
+        remove queued jobs which have not started and ask the running job to stop
+        """
+        self.threadpool.clear()
+        self.workers = [worker for worker in self.workers if worker.strt_time is not None]
+        for worker in self.workers:
+            worker.cancel()
 
     def reorganiseEclips(self):
         """
 
         """
-        make_empty_eclips_dsets(self)
+        self.queueJob('make_empty_eclips')
 
     def makeChessLookup(self):
         """
 
         """
-        make_chess_lookup_table(self)
+        self.queueJob('chess_lookup')
 
     def aggregateNcs(self):
         """
 
         """
-        populate_eclips_dsets(self)
+        self.queueJob('populate_eclips')
 
     def concatGrazeClicked(self):
         '''
 
         '''
-        integrate_grazing_dsets(self)
+        self.queueJob('integrate_grazing')
 
     def concatFertClicked(self):
         '''
 
         '''
-        concat_jinfeng_dsets(self)
+        self.queueJob('concat_jinfeng')
 
     def gatherWthrClicked(self):
         '''
@@ -307,7 +395,9 @@ class Form(QWidget):
         prgrm_dir = self.settings['fname_png'].split('GlobalEcosseSuite')[0]
         regions_fname = join(prgrm_dir, 'GlblEcosseSiteSpecSv\Docs', 'world_divisions.xlsx')
         if isfile(regions_fname):
-            regions = wthr_aggreg(sims_dir, regions_fname)
+            self.queueJob('wthr_aggreg', sims_dir = sims_dir, regions_fname = regions_fname)
+        else:
+            print('Regions file ' + regions_fname + ' does not exist')
 
     def fetchFertDir(self):
         '''
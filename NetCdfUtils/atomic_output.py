@@ -0,0 +1,247 @@
+#-------------------------------------------------------------------------------
+# Name:        atomic_output.py
+# Purpose:     build outputs in temporary files and publish them, with a completion marker, by atomic rename
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Description: an output is complete if its marker file, <output>.done, records the size and modification time
+#              of the output; a crashed build leaves a temporary file and an interrupted in-place modification
+#              leaves a marker flagged in progress, both of which a rerun detects cheaply
+#              outputs without a marker predate markers and are treated as complete
+#              temporary files are named with the process id so that worker processes building different
+#              outputs in the same directory do not collide
+#              outputs may also be directories e.g. Zarr stores; these are marked without a checksum
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+__prog__ = 'atomic_output.py'
+__version__ = '0.0.0'
+__author__ = 's03mm5'
+
+from os.path import isfile, isdir, lexists, split, join, getsize, getmtime
+from os import remove, replace, getpid
+from glob import glob, escape
+from shutil import rmtree
+from time import strftime
+from zlib import crc32
+import json
+
+MARKER_EXT = '.done'
+BLOCK_SIZE = 8*1024*1024
+
+ERROR_STR = '*** Error *** '
+WARNING_STR = '*** Warning *** '
+
+def temp_fname(out_fname):
+    '''
+    hidden temporary file in the directory of the output so that the rename is atomic
+    '''
+    out_dir, short_fn = split(out_fname)
+    return join(out_dir, '.' + short_fn + '.' + str(getpid()) + '.tmp')
+
+def _remove(fname):
+    """
+    remove a file or a directory tree
+    """
+    if isdir(fname):
+        rmtree(fname)
+    else:
+        remove(fname)
+
+def marker_fname(out_fname):
+    '''
+
+    '''
+    return out_fname + MARKER_EXT
+
+def file_checksum(fname):
+    '''
+    CRC32 of the file read in blocks - cheap enough for multi-GB outputs
+    '''
+    checksum = 0
+    with open(fname, 'rb') as fobj:
+        while True:
+            block = fobj.read(BLOCK_SIZE)
+            if not block:
+                break
+            checksum = crc32(block, checksum)
+
+    return '{:08x}'.format(checksum)
+
+def read_marker(out_fname):
+    '''
+    return marker contents or None if absent or unreadable
+    '''
+    marker_fn = marker_fname(out_fname)
+    if not isfile(marker_fn):
+        return None
+
+    try:
+        with open(marker_fn, 'r') as fmarker:
+            return json.load(fmarker)
+    except (OSError, ValueError):
+        return None
+
+def write_marker(out_fname, checksum_flag = True):
+    '''
+    record size, modification time and optionally checksum of a finished output
+    '''
+    checksum_flag = checksum_flag and not isdir(out_fname)
+    marker = {'size': getsize(out_fname), 'mtime': getmtime(out_fname), 'completed': strftime('%Y-%m-%dT%H:%M:%S'),
+              'checksum': file_checksum(out_fname) if checksum_flag else None}
+
+    _write_json(marker, marker_fname(out_fname))
+
+    return marker
+
+def _write_json(marker, marker_fn):
+    """
+    replace the marker file in one step
+    """
+    marker_tmp = temp_fname(marker_fn)
+    with open(marker_tmp, 'w') as fmarker:
+        json.dump(marker, fmarker)
+    replace(marker_tmp, marker_fn)
+
+    return
+
+def mark_in_progress(out_fname):
+    '''
+    call before modifying a finished output in place so that an interrupted modification is detected
+    '''
+    marker = {'in_progress': True, 'started': strftime('%Y-%m-%dT%H:%M:%S')}
+    _write_json(marker, marker_fname(out_fname))
+
+    return marker
+
+def remove_marker(out_fname):
+    '''
+
+    '''
+    marker_fn = marker_fname(out_fname)
+    if isfile(marker_fn):
+        remove(marker_fn)
+
+    return
+
+def stale_temps(out_fname):
+    '''
+    temporary files of out_fname left by builds which did not finish
+    '''
+    out_dir, short_fn = split(out_fname)
+    return glob(join(escape(out_dir), escape('.' + short_fn + '.') + '*.tmp'))
+
+def output_state(out_fname):
+    '''
+    one of:
+        'absent'        no output
+        'complete'      output matches its marker
+        'unmarked'      output without a marker, typically built before markers were introduced
+        'incomplete'    marker flagged in progress, unreadable or not matching the output
+    '''
+    if not lexists(out_fname):
+        return 'absent'
+
+    if not isfile(marker_fname(out_fname)):
+        return 'unmarked'
+
+    marker = read_marker(out_fname)
+    if marker is None or marker.get('in_progress', False):
+        return 'incomplete'
+
+    try:
+        if marker['size'] != getsize(out_fname) or abs(marker['mtime'] - getmtime(out_fname)) > 1.0e-3:
+            return 'incomplete'
+    except (KeyError, TypeError):
+        return 'incomplete'
+
+    return 'complete'
+
+def is_complete(out_fname, verify = False):
+    '''
+    output exists and is not known to be incomplete; outputs without a marker count as complete
+    with verify set the checksum, where recorded, is also recomputed
+    '''
+    state = output_state(out_fname)
+    if state not in ('complete', 'unmarked'):
+        return False
+
+    if verify and state == 'complete':
+        checksum = read_marker(out_fname).get('checksum')
+        if checksum is not None:
+            return checksum == file_checksum(out_fname)
+
+    return True
+
+def discard_output(out_fname):
+    '''
+    remove an output and its marker - returns False if the output could not be removed
+    '''
+    try:
+        if lexists(out_fname):
+            _remove(out_fname)
+        remove_marker(out_fname)
+    except PermissionError as err:
+        print(ERROR_STR + 'could not remove ' + out_fname + ' ' + str(err))
+        return False
+
+    return True
+
+def discard_temp(tmp_fname):
+    '''
+    remove the temporary file of a failed build
+    '''
+    if lexists(tmp_fname):
+        try:
+            _remove(tmp_fname)
+        except PermissionError as err:
+            print(WARNING_STR + 'could not remove temporary file ' + tmp_fname + ' ' + str(err))
+
+    return
+
+def finalise_output(tmp_fname, out_fname, checksum_flag = True):
+    '''
+    publish a fully written temporary file as out_fname and mark it complete
+    '''
+    remove_marker(out_fname)
+    if isdir(out_fname):
+        rmtree(out_fname)       # a directory cannot be replaced in one step
+    replace(tmp_fname, out_fname)
+    write_marker(out_fname, checksum_flag)
+    print('Finalised: ' + out_fname)
+
+    return out_fname
+
+def check_existing_output(out_fname, delete_flag):
+    '''
+    decide whether out_fname must be built:
+        returns False if an existing output is to be kept, True otherwise having removed any existing
+        output, and None if an existing output could not be removed
+    existing outputs, including those without a marker, are kept unless delete_flag is set; only an output
+    known to be incomplete is removed irrespective of delete_flag
+    temporary files left by an interrupted build are removed
+    '''
+    for tmp_fname in stale_temps(out_fname):
+        print(WARNING_STR + 'removing ' + tmp_fname + ' left by an interrupted run')
+        discard_temp(tmp_fname)
+
+    state = output_state(out_fname)
+    if state == 'absent':
+        remove_marker(out_fname)
+        return True
+
+    if state == 'incomplete':
+        print(WARNING_STR + 'NC file: ' + out_fname + ' is incomplete, probably from an interrupted run')
+    elif not delete_flag:
+        if state == 'unmarked':
+            print(WARNING_STR + 'NC file: ' + out_fname + ' already exists but has no completion marker - '
+                                                                                        'will assume complete')
+        else:
+            print(WARNING_STR + 'NC file: ' + out_fname + ' already exists and is complete')
+        return False
+
+    if not discard_output(out_fname):
+        return None
+
+    print('Deleted: ' + out_fname)
+    return True
@@ -0,0 +1,275 @@
+#-------------------------------------------------------------------------------
+# Name:        bench_fixtures.py
+# Purpose:     generate synthetic inputs, at configurable sizes, for each of the reorganisation pipelines
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Description: layouts mimic the real datasets closely enough for the pipelines to run unaltered:
+#              ECLIPS Band1 monthly files, HARMONIE-like templates with lsmask, Jinfeng era*.nc annual files
+#              with 2-D LAT/LON, FAO n_available_*.nc grids, CHESS meteogrid CSVs, met2*s.txt trees and
+#              populated (time, lat, lon) products with point locations for the extraction benchmarks
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+__prog__ = 'bench_fixtures.py'
+__version__ = '0.0.0'
+__author__ = 's03mm5'
+
+from os.path import join, isdir
+from os import makedirs
+from netCDF4 import Dataset
+from numpy import arange, cos, float32, float64, int16, meshgrid, radians
+from numpy.random import default_rng
+
+from osgb_fns import wgs84_to_osgb
+
+FILL_VALUE = -9999.0
+SEED = 1961
+OSGB_DELTA = 1.0e-5     # degrees, step for derivatives of the OSGB projection
+
+def _rng(seed = None):
+    """
+    fixtures are reproducible so that timings of successive runs are comparable
+    """
+    return default_rng(SEED if seed is None else seed)
+
+def _create_lat_lon(nc_dset, lat0, lon0, resol, nlats, nlons):
+    """
+    cell centres in ascending order, as written by gdal_translate
+    """
+    nc_dset.createDimension('lat', nlats)
+    nc_dset.createDimension('lon', nlons)
+
+    lats = nc_dset.createVariable('lat', 'f8', ('lat',))
+    lats.units = 'degrees_north'
+    lats[:] = lat0 + resol/2 + arange(nlats)*resol
+
+    lons = nc_dset.createVariable('lon', 'f8', ('lon',))
+    lons.units = 'degrees_east'
+    lons[:] = lon0 + resol/2 + arange(nlons)*resol
+
+    return
+
+def make_eclips_band1_file(nc_fname, nlats, nlons, resol = 0.025, lat0 = 50.0, lon0 = 0.0, land_frac = 0.8,
+                                                                                                        seed = None):
+    '''
+    single month of an ECLIPS 2.0 input: a Band1 (lat, lon) grid with sea cells set to the fill value
+    '''
+    rng = _rng(seed)
+    nc_dset = Dataset(nc_fname, 'w', format='NETCDF4_CLASSIC')
+    _create_lat_lon(nc_dset, lat0, lon0, resol, nlats, nlons)
+
+    band1 = nc_dset.createVariable('Band1', 'f4', ('lat', 'lon'), fill_value=FILL_VALUE)
+    vals = (rng.random((nlats, nlons))*100.0).astype(float32)
+    vals[rng.random((nlats, nlons)) > land_frac] = FILL_VALUE
+    band1[:] = vals
+    nc_dset.close()
+
+    return nc_fname
+
+def make_eclips_input_dir(inp_dir, metric_inp, yr_rng, nlats, nlons, nmonths = 12, **kwargs):
+    '''
+    monthly files named as the pipeline expects e.g. PPT04_196190.nc
+    '''
+    if not isdir(inp_dir):
+        makedirs(inp_dir)
+
+    nc_fnames = []
+    for imnth in range(1, nmonths + 1):
+        nc_fname = join(inp_dir, '{}{:0>2d}_{}.nc'.format(metric_inp, imnth, yr_rng))
+        nc_fnames.append(make_eclips_band1_file(nc_fname, nlats, nlons, seed = imnth, **kwargs))
+
+    return nc_fnames
+
+def make_harmonie_template(nc_fname, metric, nlats, nlons, nyears, resol = 0.125, lat0 = 50.0, lon0 = 0.0,
+                                                                                land_frac = 0.7, seed = None):
+    '''
+    HARMONIE-like monthly output dataset with an lsmask variable and an empty (time, lat, lon) metric
+    '''
+    rng = _rng(seed)
+    nc_dset = Dataset(nc_fname, 'w', format='NETCDF4_CLASSIC')
+    _create_lat_lon(nc_dset, lat0, lon0, resol, nlats, nlons)
+    nc_dset.createDimension('time', nyears*12)
+
+    times = nc_dset.createVariable('time', 'f4', ('time',))
+    times.units = 'days since 1961-01-01'
+    times.calendar = 'standard'
+    times[:] = arange(nyears*12)*30.4375 + 15.0
+
+    lsmask = nc_dset.createVariable('lsmask', 'i2', ('lat', 'lon'))
+    lsmask[:] = (rng.random((nlats, nlons)) < land_frac).astype(int16)
+
+    nc_dset.createVariable(metric, 'f4', ('time', 'lat', 'lon'), fill_value=FILL_VALUE)
+    nc_dset.close()
+
+    return nc_fname
+
+def make_populated_product(nc_fname, metric, nlats, nlons, nyears, chunksizes = (1, 32, 560), resol = 0.125,
+                                                    lat0 = 50.0, lon0 = 0.0, land_frac = 0.7, seed = None):
+    '''
+    populated monthly (time, lat, lon) product, chunked map by map as create_eclips_nc writes it
+    '''
+    rng = _rng(seed)
+    nc_dset = Dataset(nc_fname, 'w', format='NETCDF4_CLASSIC')
+    _create_lat_lon(nc_dset, lat0, lon0, resol, nlats, nlons)
+    nc_dset.createDimension('time', nyears*12)
+
+    chunksizes = tuple(min(chunk, size) for chunk, size in zip(chunksizes, (nyears*12, nlats, nlons)))
+    var = nc_dset.createVariable(metric, 'f4', ('time', 'lat', 'lon'), fill_value=FILL_VALUE, zlib=True,
+                                                                                        chunksizes=chunksizes)
+    sea = rng.random((nlats, nlons)) > land_frac
+    for itime in range(nyears*12):
+        vals = (rng.random((nlats, nlons))*100.0).astype(float32)
+        vals[sea] = FILL_VALUE
+        var[itime, :, :] = vals
+    nc_dset.close()
+
+    return nc_fname
+
+def make_points(npoints, nlats, nlons, resol = 0.125, lat0 = 50.0, lon0 = 0.0, seed = None):
+    '''
+    random point locations within the extent of a grid
+    '''
+    rng = _rng(seed)
+    lats = lat0 + rng.random(npoints)*nlats*resol
+    lons = lon0 + rng.random(npoints)*nlons*resol
+
+    return lats, lons
+
+def make_jinfeng_era_files(fert_dir, nyears, nlats, nlons, strt_year = 1961, resol = 0.5, lat_ur = 60.0,
+                                                                            lon_ll = -10.0, seed = None):
+    '''
+    annual Jinfeng files, each in its own sub-directory, with 2-D LAT/LON coordinates running north to south
+    and (1, 1, lat, lon) Ndep, Nmanure and Nmineral variables
+    '''
+    rng = _rng(seed)
+    lats = lat_ur - arange(nlats)*resol
+    lons = lon_ll + arange(nlons)*resol
+    lon_grid, lat_grid = meshgrid(lons, lats)
+
+    nc_fnames = []
+    for year in range(strt_year, strt_year + nyears):
+        year_dir = join(fert_dir, str(year))
+        if not isdir(year_dir):
+            makedirs(year_dir)
+
+        nc_fname = join(year_dir, 'era_nfert_{}.nc'.format(year))
+        nc_dset = Dataset(nc_fname, 'w', format='NETCDF4_CLASSIC')
+        nc_dset.createDimension('time', 1)
+        nc_dset.createDimension('depth', 1)
+        nc_dset.createDimension('y', nlats)
+        nc_dset.createDimension('x', nlons)
+
+        nc_dset.createVariable('LAT', 'f4', ('y', 'x'))[:] = lat_grid
+        nc_dset.createVariable('LON', 'f4', ('y', 'x'))[:] = lon_grid
+
+        for var_name in ['Ndep', 'Nmanure', 'Nmineral']:
+            var = nc_dset.createVariable(var_name, 'f4', ('time', 'depth', 'y', 'x'), fill_value=FILL_VALUE)
+            var.units = 'kg N/ha'
+            var.missing_value = FILL_VALUE
+            vals = (rng.random((1, 1, nlats, nlons))*50.0).astype(float32)
+            vals[:, :, rng.random((nlats, nlons)) > 0.6] = 0.0      # cells with no data are all zero
+            var[:] = vals
+
+        nc_dset.close()
+        nc_fnames.append(nc_fname)
+
+    return nc_fnames
+
+def make_fao_grazing_files(graze_dir, nlats, nlons, anml_types = ('cattle', 'goats', 'sheep'), resol = 0.1,
+                                                                    lat0 = -60.0, lon0 = -180.0, seed = None):
+    '''
+    FAO GLEAM style n_available_<animal>.nc grids of kg N per cell in a Band1 variable
+    '''
+    if not isdir(graze_dir):
+        makedirs(graze_dir)
+
+    nc_fnames = []
+    for indx, anml_type in enumerate(anml_types):
+        rng = _rng(None if seed is None else seed + indx)
+        nc_fname = join(graze_dir, 'n_available_' + anml_type + '.nc')
+        nc_dset = Dataset(nc_fname, 'w', format='NETCDF4_CLASSIC')
+        _create_lat_lon(nc_dset, lat0, lon0, resol, nlats, nlons)
+
+        band1 = nc_dset.createVariable('Band1', 'f4', ('lat', 'lon'), fill_value=FILL_VALUE)
+        vals = (rng.random((nlats, nlons))*1000.0).astype(float32)
+        vals[rng.random((nlats, nlons)) > 0.5] = FILL_VALUE
+        band1[:] = vals
+        nc_dset.close()
+        nc_fnames.append(nc_fname)
+
+    return nc_fnames
+
+def _osgb_to_wgs84(eastings, northings, niters = 6):
+    """
+    WGS84 latitudes and longitudes of OSGB eastings and northings by Newton iteration of wgs84_to_osgb from a
+    linear first guess about the false origin, derivatives being taken by finite differences
+    """
+    eastings = eastings.astype(float64)
+    northings = northings.astype(float64)
+    lats = 49.766 + northings/111200.0
+    lons = -7.557 + eastings/(111200.0*cos(radians(lats)))
+
+    for dummy in range(niters):
+        esting0, nrthng0 = wgs84_to_osgb(lats, lons)
+        esting_lat, nrthng_lat = wgs84_to_osgb(lats + OSGB_DELTA, lons)
+        esting_lon, nrthng_lon = wgs84_to_osgb(lats, lons + OSGB_DELTA)
+        de_dlat, dn_dlat = (esting_lat - esting0)/OSGB_DELTA, (nrthng_lat - nrthng0)/OSGB_DELTA
+        de_dlon, dn_dlon = (esting_lon - esting0)/OSGB_DELTA, (nrthng_lon - nrthng0)/OSGB_DELTA
+
+        det = de_dlat*dn_dlon - de_dlon*dn_dlat
+        de = eastings - esting0
+        dn = northings - nrthng0
+        lats = lats + (dn_dlon*de - de_dlon*dn)/det
+        lons = lons + (de_dlat*dn - dn_dlat*de)/det
+
+    return lats, lons
+
+def make_chess_csvs(meteo_fname, aoi_fname, nrows, ncols, npoints, resol = 1000, seed = None):
+    '''
+    CHESS meteogrid CSV of cell centres on the 1 km OSGB grid and a headerless HWSD AOI CSV of points to look up
+    lat/lon of cell centres and points are those of their eastings and northings so that both the search and
+    the osgb lookup modes find the same cells
+    '''
+    rng = _rng(seed)
+    yindx, xindx = meshgrid(arange(nrows), arange(ncols), indexing='ij')
+    eastings = xindx*resol + resol/2
+    northings = yindx*resol + resol/2
+    cell_lats, cell_lons = _osgb_to_wgs84(eastings, northings)
+
+    with open(meteo_fname, 'w') as fmeteo:
+        fmeteo.write('xindx,yindx,easting,northing,cell_lat,cell_lon\n')
+        for rec in zip(xindx.ravel(), yindx.ravel(), eastings.ravel(), northings.ravel(),
+                                                                        cell_lats.ravel(), cell_lons.ravel()):
+            fmeteo.write('{},{},{:.1f},{:.1f},{:.6f},{:.6f}\n'.format(*rec))
+
+    lats, lons = _osgb_to_wgs84(rng.uniform(0, ncols*resol, npoints), rng.uniform(0, nrows*resol, npoints))
+    with open(aoi_fname, 'w') as faoi:
+        for indx, (lat, lon) in enumerate(zip(lats, lons)):
+            faoi.write('{},{},{},{:.6f},{:.6f}\n'.format(indx, indx, 10000 + indx % 50, lat, lon))
+
+    return meteo_fname, aoi_fname
+
+def make_met_tree(clim_dir, ncells, nyears, fut_start_year = 2000, seed = None):
+    '''
+    one sub-directory per weather cell, named gran_lat_gran_lon, holding annual met<year>s.txt files of
+    12 tab separated lines: month, precipitation, PET, mean air temperature
+    '''
+    rng = _rng(seed)
+    sub_dirs = []
+    for icell in range(ncells):
+        sub_dir = '{}_{}'.format(4800 + icell // 100, 21600 + icell % 100)
+        cell_dir = join(clim_dir, sub_dir)
+        if not isdir(cell_dir):
+            makedirs(cell_dir)
+
+        for year in range(fut_start_year, fut_start_year + nyears):
+            precips = rng.random(12)*150.0
+            tairs = rng.random(12)*25.0 - 5.0
+            with open(join(cell_dir, 'met{}s.txt'.format(year)), 'w') as fmet:
+                for imnth in range(12):
+                    fmet.write('{}\t{:.1f}\t{:.1f}\t{:.1f}\n'.format(imnth + 1, precips[imnth], 0.0, tairs[imnth]))
+
+        sub_dirs.append(sub_dir)
+
+    return sub_dirs
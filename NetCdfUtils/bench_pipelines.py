@@ -0,0 +1,351 @@
+#-------------------------------------------------------------------------------
+# Name:        bench_pipelines.py
+# Purpose:     time each reorganisation pipeline on synthetic fixtures and keep a JSON history of throughputs
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Description: fixtures are generated by bench_fixtures.py in a scratch directory so that no multi-GB input
+#              is required; a run is compared with the previous run of the same size on the same host and
+#              any pipeline whose throughput has dropped by more than the tolerance is reported as a regression
+#              e.g.   python bench_pipelines.py --size medium --pipelines eclips_band eclips_cell
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+__prog__ = 'bench_pipelines.py'
+__version__ = '0.0.0'
+__author__ = 's03mm5'
+
+from argparse import ArgumentParser
+from os.path import join, isfile
+from os import sep
+from shutil import rmtree, copyfile
+from tempfile import mkdtemp
+from logging import getLogger
+from platform import node
+from time import perf_counter, strftime
+import json
+import sys
+
+import bench_fixtures as fixtures
+
+HISTORY_FN = 'bench_history.json'
+TOLERANCE = 0.2         # fractional drop in throughput reported as a regression
+
+# nlats and nlons refer to the input grid for ECLIPS (output grid is five times coarser)
+# =====================================================================================
+SIZES = {
+    'small':  {'eclips': {'nlats': 200, 'nlons': 300, 'nmonths': 2, 'nyears': 30},
+               'jinfeng': {'nlats': 40, 'nlons': 60, 'nyears': 3},
+               'grazing': {'nlats': 60, 'nlons': 90},
+               'chess': {'nrows': 60, 'ncols': 40, 'npoints': 100},
+               'wthr_aggreg': {'ncells': 50, 'nyears': 5},
+               'points': {'nlats': 80, 'nlons': 120, 'nyears': 5, 'npoints': 200}},
+    'medium': {'eclips': {'nlats': 800, 'nlons': 1200, 'nmonths': 4, 'nyears': 30},
+               'jinfeng': {'nlats': 120, 'nlons': 180, 'nyears': 10},
+               'grazing': {'nlats': 180, 'nlons': 360},
+               'chess': {'nrows': 200, 'ncols': 120, 'npoints': 500},
+               'wthr_aggreg': {'ncells': 400, 'nyears': 20},
+               'points': {'nlats': 320, 'nlons': 480, 'nyears': 20, 'npoints': 500}},
+    'large':  {'eclips': {'nlats': 2400, 'nlons': 3600, 'nmonths': 12, 'nyears': 30},
+               'jinfeng': {'nlats': 360, 'nlons': 720, 'nyears': 30},
+               'grazing': {'nlats': 900, 'nlons': 1800},
+               'chess': {'nrows': 1000, 'ncols': 600, 'npoints': 2000},
+               'wthr_aggreg': {'ncells': 2000, 'nyears': 101},
+               'points': {'nlats': 640, 'nlons': 960, 'nyears': 30, 'npoints': 2000}}
+}
+
+def _bench_eclips(work_dir, parms, band_nlats):
+    """
+    regrid monthly ECLIPS Band1 files onto a HARMONIE-like template - band_nlats of zero selects the
+    cell by cell method
+    """
+    from weather_datasets import _fetch_weather_nc_parms
+    from eclips_classes import read_land_sea_mask, RegridIndexMap
+    from eclips_reorg import _slice_resize
+
+    nlats, nlons, nyears = parms['nlats'], parms['nlons'], parms['nyears']
+    inp_fns = fixtures.make_eclips_input_dir(join(work_dir, 'ECLIPS2_0_196190'), 'Tave', '196190',
+                                                                        nlats, nlons, parms['nmonths'])
+    out_fn = fixtures.make_harmonie_template(join(work_dir, 'Tairalign_1961_2100.nc'), 'Tairalign',
+                                                                            nlats//5, nlons//5, nyears)
+    inpt_wthr_dict = _fetch_weather_nc_parms(inp_fns[0], 'ECLIPS2', 'ECLIPS2TMPLT', 'Monthly')[0]
+    eclips_wthr_dict = _fetch_weather_nc_parms(out_fn, 'HARMONIE', 'ECLIPS2', 'Monthly')[0]
+    eclips_wthr_dict['fn_tas'] = out_fn
+
+    strt_time = perf_counter()
+    lsmask = read_land_sea_mask(out_fn)
+    index_map = RegridIndexMap(inpt_wthr_dict['grid'], eclips_wthr_dict['grid'])
+    for imnth, inp_fn in enumerate(inp_fns, 1):
+        _slice_resize(getLogger(__prog__), inpt_wthr_dict, inp_fn, eclips_wthr_dict, 'fn_tas', 'Tairalign', imnth,
+                            1961, 1961, 1961 + nyears - 1, process_data_flag = True, band_nlats = band_nlats,
+                                                                        lsmask = lsmask, index_map = index_map)
+    elapsed = perf_counter() - strt_time
+
+    return elapsed, lsmask.nland*len(inp_fns), 'cells'
+
+def bench_eclips_band(work_dir, parms):
+    '''
+    out-of-core band method
+    '''
+    from eclips_reorg import BAND_NLATS
+
+    return _bench_eclips(work_dir, parms, BAND_NLATS)
+
+def bench_eclips_cell(work_dir, parms):
+    '''
+    cell by cell method
+    '''
+    return _bench_eclips(work_dir, parms, 0)
+
+def bench_jinfeng(work_dir, parms):
+    '''
+    concatenate annual era files and identify all zero cells
+    '''
+    from jinfeng_classes import NcFileDefn, create_fert_nc
+    from jinfeng_reorg import _sort_fname_and_start_year, _concatenate_fert_files
+
+    fert_dir = join(work_dir, 'jinfeng') + sep
+    fixtures.make_jinfeng_era_files(fert_dir, parms['nyears'], parms['nlats'], parms['nlons'])
+
+    strt_time = perf_counter()
+    nc_fname, strt_year, nyears, fert_ncs = _sort_fname_and_start_year(fert_dir, True)
+    create_fert_nc(nc_fname, NcFileDefn(fert_ncs[-1]), strt_year, nyears)
+    _concatenate_fert_files(nc_fname, sorted(fert_ncs))
+    elapsed = perf_counter() - strt_time
+
+    return elapsed, parms['nlats']*parms['nlons']*3, 'cells'
+
+def bench_grazing(work_dir, parms):
+    '''
+    integrate FAO grazing datasets into a single livestock dataset
+    '''
+    from grazing_classes import GrazeNcDefn, create_graze_nc
+    from grazing_reorg import _create_grid_cell_area_array, _integrate_grazing_dsets, GRAZE_FN
+
+    graze_ncs = fixtures.make_fao_grazing_files(join(work_dir, 'grazing'), parms['nlats'], parms['nlons'])
+    lvstck_nc_fn = join(work_dir, 'grazing', GRAZE_FN + 'livestock.nc')
+
+    strt_time = perf_counter()
+    clone_defn = GrazeNcDefn(graze_ncs[-1])
+    create_graze_nc(lvstck_nc_fn, clone_defn)
+    areas = _create_grid_cell_area_array(graze_ncs[0], clone_defn)
+    _integrate_grazing_dsets(lvstck_nc_fn, graze_ncs, areas)
+    elapsed = perf_counter() - strt_time
+
+    return elapsed, parms['nlats']*parms['nlons']*len(graze_ncs), 'cells'
+
+def bench_chess(work_dir, parms):
+    '''
+    nearest CHESS cell lookup for a set of HWSD points by search, the chess_lookup_mode setting search
+    '''
+    from pandas import read_csv
+    import make_chess_lookup_fns
+
+    meteo_fn, aoi_fn = fixtures.make_chess_csvs(join(work_dir, 'meteogrid.csv'), join(work_dir, 'aoi_hwsd.csv'),
+                                                            parms['nrows'], parms['ncols'], parms['npoints'])
+    make_chess_lookup_fns.AOI_FN = aoi_fn
+
+    strt_time = perf_counter()
+    meteogrid_df = read_csv(meteo_fn, sep=',')
+    meteogrid_df['point'] = [(lat, lon) for lat, lon in zip(meteogrid_df['cell_lat'], meteogrid_df['cell_lon'])]
+    make_chess_lookup_fns._make_lookup_table_from_meteogrid_csv(meteogrid_df)
+    elapsed = perf_counter() - strt_time
+
+    return elapsed, parms['npoints'], 'points'
+
+def bench_chess_osgb(work_dir, parms):
+    '''
+    CHESS cell of each HWSD point computed from its OSGB easting and northing, the default chess_lookup_mode
+    '''
+    from pandas import read_csv
+    import make_chess_lookup_fns
+
+    meteo_fn, aoi_fn = fixtures.make_chess_csvs(join(work_dir, 'meteogrid.csv'), join(work_dir, 'aoi_hwsd.csv'),
+                                                            parms['nrows'], parms['ncols'], parms['npoints'])
+    make_chess_lookup_fns.AOI_FN = aoi_fn
+
+    strt_time = perf_counter()
+    meteogrid_df = read_csv(meteo_fn, sep=',')
+    make_chess_lookup_fns._make_lookup_table_from_osgb(make_chess_lookup_fns.ChessGrid(meteogrid_df))
+    elapsed = perf_counter() - strt_time
+
+    return elapsed, parms['npoints'], 'points'
+
+def bench_wthr_aggreg(work_dir, parms):
+    '''
+    gather met2*s.txt files of each weather cell into per metric tab separated files
+    '''
+    import weather_aggregation
+
+    clim_dir = join(work_dir, 'wthr', 'RegionCruA1B')
+    sub_dirs = fixtures.make_met_tree(clim_dir, parms['ncells'], parms['nyears'])
+    weather_aggregation.WRT_TO_DIR = work_dir
+
+    strt_time = perf_counter()
+    weather_aggregation._process_wthr_dir(clim_dir, 'RegionCruA1B', sub_dirs, 'A1B',
+                                                                        2000, 2000 + parms['nyears'] - 1)
+    elapsed = perf_counter() - strt_time
+
+    return elapsed, parms['ncells'], 'dirs'
+
+def _points_fixture(work_dir, parms):
+    """
+    populated product and point locations shared by the point extraction benchmarks
+    """
+    nc_fname = fixtures.make_populated_product(join(work_dir, 'Tairalign_points.nc'), 'Tairalign',
+                                                                    parms['nlats'], parms['nlons'], parms['nyears'])
+    lats, lons = fixtures.make_points(parms['npoints'], parms['nlats'], parms['nlons'])
+
+    return nc_fname, lats, lons
+
+def bench_points_batched(work_dir, parms):
+    '''
+    series of many points grouped by chunk, each chunk read once
+    '''
+    from point_extraction import extract_points
+
+    nc_fname, lats, lons = _points_fixture(work_dir, parms)
+
+    strt_time = perf_counter()
+    extract_points(nc_fname, 'Tairalign', lats, lons)
+    elapsed = perf_counter() - strt_time
+
+    return elapsed, parms['npoints'], 'points'
+
+def bench_points_by_cell(work_dir, parms):
+    '''
+    series of many points read one point at a time, for comparison with points_batched
+    '''
+    from weather_datasets import _fetch_weather_nc_parms
+    from point_extraction import extract_points_by_cell
+
+    nc_fname, lats, lons = _points_fixture(work_dir, parms)
+
+    strt_time = perf_counter()
+    wthr_dict = _fetch_weather_nc_parms(nc_fname, 'HARMONIE', 'ECLIPS2', 'Monthly')[0]
+    extract_points_by_cell(getLogger(__prog__), wthr_dict, nc_fname, 'Tairalign', lats, lons)
+    elapsed = perf_counter() - strt_time
+
+    return elapsed, parms['npoints'], 'points'
+
+BENCHMARKS = {'eclips_band': (bench_eclips_band, 'eclips'), 'eclips_cell': (bench_eclips_cell, 'eclips'),
+              'jinfeng': (bench_jinfeng, 'jinfeng'), 'grazing': (bench_grazing, 'grazing'),
+              'chess': (bench_chess, 'chess'), 'chess_osgb': (bench_chess_osgb, 'chess'),
+              'wthr_aggreg': (bench_wthr_aggreg, 'wthr_aggreg'),
+              'points_batched': (bench_points_batched, 'points'), 'points_by_cell': (bench_points_by_cell, 'points')}
+
+def run_benchmarks(size = 'small', pipelines = None, keep_flag = False):
+    '''
+    each pipeline runs in its own scratch directory - returns a list of result records
+    '''
+    if pipelines is None:
+        pipelines = list(BENCHMARKS)
+
+    rslts = []
+    for pipeline in pipelines:
+        bench_fn, size_key = BENCHMARKS[pipeline]
+        work_dir = mkdtemp(prefix = 'bench_' + pipeline + '_')
+        print('\nBenchmark ' + pipeline + ' size: ' + size + ' in ' + work_dir)
+        try:
+            elapsed, nitems, unit = bench_fn(work_dir, SIZES[size][size_key])
+            rslt = {'pipeline': pipeline, 'seconds': round(elapsed, 4), 'nitems': nitems, 'unit': unit,
+                    'rate': round(nitems/elapsed, 2) if elapsed > 0 else 0.0, 'ok': True}
+        except (ImportError, OSError, KeyError, ValueError, RuntimeError) as err:
+            print('*** Error *** benchmark ' + pipeline + ' failed: ' + str(err))
+            rslt = {'pipeline': pipeline, 'ok': False, 'error': str(err)}
+        finally:
+            if not keep_flag:
+                rmtree(work_dir, ignore_errors = True)
+
+        rslts.append(rslt)
+
+    return rslts
+
+def read_history(history_fn):
+    '''
+    history is a JSON list of runs, oldest first
+    '''
+    if not isfile(history_fn):
+        return []
+
+    with open(history_fn, 'r') as fhist:
+        return json.load(fhist)
+
+def write_history(history_fn, history):
+    '''
+    write to a temporary file first so that an interrupted write does not lose the history
+    '''
+    tmp_fn = history_fn + '.tmp'
+    with open(tmp_fn, 'w') as fhist:
+        json.dump(history, fhist, indent=2)
+
+    if isfile(history_fn):
+        copyfile(history_fn, history_fn + '.bak')
+    copyfile(tmp_fn, history_fn)
+
+    return
+
+def find_regressions(history, run, tolerance = TOLERANCE):
+    '''
+    compare throughputs of run with those of the most recent previous run of the same size on the same host
+    '''
+    prev_rates = {}
+    for prev_run in history:
+        if prev_run['size'] == run['size'] and prev_run['host'] == run['host']:
+            for rslt in prev_run['results']:
+                if rslt['ok']:
+                    prev_rates[rslt['pipeline']] = rslt['rate']
+
+    regressions = []
+    for rslt in run['results']:
+        prev_rate = prev_rates.get(rslt['pipeline'])
+        if rslt['ok'] and prev_rate:
+            rslt['change'] = round(rslt['rate']/prev_rate - 1.0, 3)
+            if rslt['rate'] < (1.0 - tolerance)*prev_rate:
+                regressions.append(rslt['pipeline'])
+
+    return regressions
+
+def report_run(run, regressions):
+    '''
+    tabulate results of a run
+    '''
+    print('\nBenchmarks of size {} on {} at {}'.format(run['size'], run['host'], run['time']))
+    print('\t{:<16s}{:>10s}{:>12s}{:>22s}{:>10s}'.format('pipeline', 'seconds', 'items', 'rate', 'change'))
+    for rslt in run['results']:
+        if not rslt['ok']:
+            print('\t{:<16s}{:>10s}'.format(rslt['pipeline'], 'FAILED'))
+            continue
+
+        change = '{:+.1%}'.format(rslt['change']) if 'change' in rslt else ''
+        flag = '  <<< regression' if rslt['pipeline'] in regressions else ''
+        print('\t{:<16s}{:>10.2f}{:>12,d}{:>22s}{:>10s}{}'.format(rslt['pipeline'], rslt['seconds'], rslt['nitems'],
+                                            '{:,.1f} {}/s'.format(rslt['rate'], rslt['unit']), change, flag))
+    return
+
+def main():
+    '''
+    run benchmarks, append to the history and exit with the number of regressions
+    '''
+    parser = ArgumentParser(description='Time the NetCdfUtils pipelines on synthetic fixtures')
+    parser.add_argument('--size', choices=list(SIZES), default='small')
+    parser.add_argument('--pipelines', nargs='+', choices=list(BENCHMARKS), help='default is all pipelines')
+    parser.add_argument('--history', default=HISTORY_FN, help='JSON history file')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='fractional drop in throughput')
+    parser.add_argument('--keep', action='store_true', help='keep fixtures and outputs')
+    args = parser.parse_args()
+
+    run = {'time': strftime('%Y-%m-%dT%H:%M:%S'), 'host': node(), 'size': args.size,
+                                            'results': run_benchmarks(args.size, args.pipelines, args.keep)}
+    history = read_history(args.history)
+    regressions = find_regressions(history, run, args.tolerance)
+    report_run(run, regressions)
+
+    history.append(run)
+    write_history(args.history, history)
+    print('\nAppended run to ' + args.history)
+
+    sys.exit(len(regressions))
+
+if __name__ == '__main__':
+    main()
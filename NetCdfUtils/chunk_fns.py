@@ -0,0 +1,76 @@
+#-------------------------------------------------------------------------------
+# Name:        chunk_fns.py
+# Purpose:     hand-rolled chunk iterators and block reductions for out-of-core processing of large grids
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Description: large (lat, lon) and (time, lat, lon) variables are processed in bands of latitude rows
+#              so that memory is bounded by the band size rather than the size of the grid
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+__prog__ = 'chunk_fns.py'
+__version__ = '0.0.0'
+__author__ = 's03mm5'
+
+from numpy import zeros, float64, int64, minimum, maximum
+from numpy.ma import getmaskarray, masked_invalid
+
+def generate_bands(nrows, band_nrows):
+    '''
+    yield start and end (exclusive) row indices of successive bands
+    '''
+    band_nrows = max(1, int(band_nrows))
+    for row_strt in range(0, nrows, band_nrows):
+        yield row_strt, min(row_strt + band_nrows, nrows)
+
+def window_indices(grid, centres, half_width, axis = 'lat'):
+    '''
+    for each centre return the lower and upper (exclusive) indices on grid of the window centre +/- half_width
+    indices are clipped to the grid and ordered so that grids stored in descending order are handled
+    '''
+    if axis == 'lat':
+        indx_a, dummy = grid.indices(centres - half_width, grid.lon0)
+        indx_b, dummy = grid.indices(centres + half_width, grid.lon0)
+    else:
+        dummy, indx_a = grid.indices(grid.lat0, centres - half_width)
+        dummy, indx_b = grid.indices(grid.lat0, centres + half_width)
+
+    return minimum(indx_a, indx_b).astype(int64), maximum(indx_a, indx_b).astype(int64)
+
+def _summed_area(vals):
+    '''
+    summed area table padded with a leading row and column of zeros
+    '''
+    nrows, ncols = vals.shape
+    table = zeros((nrows + 1, ncols + 1), dtype=float64)
+    table[1:, 1:] = vals.cumsum(axis=0).cumsum(axis=1)
+
+    return table
+
+def box_means(data, row_lo, row_hi, col_lo, col_hi):
+    '''
+    mean of the valid values of data within each box [row_lo:row_hi, col_lo:col_hi] for every combination
+    of row window and column window - result has shape (len(row_lo), len(col_lo))
+    returns the means and the number of valid values contributing to each; means are zero where count is zero
+    '''
+    data = masked_invalid(data)
+    valid = ~getmaskarray(data)
+
+    sum_table = _summed_area(data.filled(0.0).astype(float64))
+    cnt_table = _summed_area(valid.astype(float64))
+
+    r_lo = row_lo[:, None]
+    r_hi = row_hi[:, None]
+    c_lo = col_lo[None, :]
+    c_hi = col_hi[None, :]
+
+    sums = sum_table[r_hi, c_hi] - sum_table[r_lo, c_hi] - sum_table[r_hi, c_lo] + sum_table[r_lo, c_lo]
+    counts = cnt_table[r_hi, c_hi] - cnt_table[r_lo, c_hi] - cnt_table[r_hi, c_lo] + cnt_table[r_lo, c_lo]
+    counts = counts.round().astype(int64)
+
+    means = zeros(sums.shape, dtype=float64)
+    has_data = counts > 0
+    means[has_data] = sums[has_data] / counts[has_data]
+
+    return means, counts
@@ -0,0 +1,351 @@
+#-------------------------------------------------------------------------------
+# Name:        climatology.py
+# Purpose:     monthly climatologies by period, 40 and 90 year differences and annual values of populated
+#              monthly (time, lat, lon) products such as the ECLIPS and HARMONIE datasets
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Description: each variable is read once in bands of latitude rows and blocks of whole years; running sums and
+#              counts per period and month and per year are accumulated for the band so that the full series is
+#              never held in memory; results are written to a new file, by default the source name with suffix
+#              _clim, which holds for each variable:
+#                   <var>_clim      (period, month, lat, lon)   mean of each calendar month over each period
+#                   <var>_annual    (year, lat, lon)            annual total for fluxes, annual mean otherwise
+#                   <var>_diff40    (month, lat, lon)           climatology of the period 40 years after the
+#                                                               first less that of the first, likewise _diff90;
+#                                                               written only when that period is complete
+#              annual values of years with missing months are masked
+#              e.g.   python climatology.py Tairalign_RCP45_CLMcom_CCLM_1961_2100.nc --period 10
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+__prog__ = 'climatology.py'
+__version__ = '0.0.0'
+__author__ = 's03mm5'
+
+from argparse import ArgumentParser
+from os.path import splitext
+
+from netCDF4 import Dataset, num2date
+from numpy import arange, column_stack, zeros, float64, int16, int32, unique
+from numpy.ma import masked_array, masked_invalid, getmaskarray
+
+from nc_schema_writer import NcSchema
+from atomic_output import temp_fname, finalise_output, discard_temp, check_existing_output
+from chunk_fns import generate_bands
+from spec_utilities import ProgressMeter
+from profiling_fns import stage
+
+CLIM_NYEARS = 10            # years in each climatology period
+DIFF_NYEARS = (40, 90)      # offsets, in years, of the periods compared with the first period
+SUM_VARS = ['Precipalign', 'precip', 'pp', 'pr']    # fluxes whose annual values are totals rather than means
+MAX_MB = 512
+OUT_SUFFIX = '_clim'
+MISSING_VALUE = -999.0
+
+ERROR_STR = '*** Error *** '
+WARNING_STR = '*** Warning *** '
+
+def clim_targets(nc_dset):
+    '''
+    names of the (time, lat, lon) variables of a dataset
+    '''
+    return [var_name for var_name, nc_var in nc_dset.variables.items() if nc_var.ndim == 3
+                                                                        and nc_var.dimensions[0] == 'time']
+
+def series_start(nc_dset, time_var = 'time'):
+    '''
+    year and month of the first time step, from the units and calendar of the time variable
+    '''
+    if time_var not in nc_dset.variables:
+        return None
+
+    nc_var = nc_dset.variables[time_var]
+    calendar = nc_var.calendar if 'calendar' in nc_var.ncattrs() else 'standard'
+    strt_date = num2date(nc_var[0], nc_var.units, calendar)
+
+    return strt_date.year, strt_date.month
+
+class ClimAccumulator(object, ):
+    '''
+    running sums and counts of valid values of a band of rows: per period and calendar month and per year
+    monthly time steps are identified by their year index, from zero, and month, from zero
+    '''
+    def __init__(self, nperiods, nyears, nrows, nlons, period_nyears = CLIM_NYEARS):
+        """
+
+        """
+        self.period_nyears = period_nyears
+        self.sums = zeros((nperiods, 12, nrows, nlons), dtype=float64)
+        self.counts = zeros((nperiods, 12, nrows, nlons), dtype=int32)
+        self.annual_sums = zeros((nyears, nrows, nlons), dtype=float64)
+        self.annual_counts = zeros((nyears, nrows, nlons), dtype=int16)
+
+    def add(self, vals, year_indx, months):
+        """
+        add a block of shape (nsteps, nrows, nlons); within a year months are unique so each year is added
+        with a single indexed addition
+        """
+        vals = masked_invalid(vals)
+        valid = ~getmaskarray(vals)
+        filled = vals.filled(0.0).astype(float64)
+
+        for year in unique(year_indx):
+            steps = year_indx == year
+            period = year // self.period_nyears
+            self.sums[period, months[steps]] += filled[steps]
+            self.counts[period, months[steps]] += valid[steps]
+            self.annual_sums[year] += filled[steps].sum(axis=0)
+            self.annual_counts[year] += valid[steps].sum(axis=0, dtype=int16)
+
+    def climatology(self):
+        """
+        mean of each calendar month over each period, masked where there are no values
+        """
+        has_data = self.counts > 0
+        means = zeros(self.sums.shape, dtype=float64)
+        means[has_data] = self.sums[has_data] / self.counts[has_data]
+
+        return masked_array(means, mask = ~has_data)
+
+    def annual(self, method = 'mean'):
+        """
+        annual totals or means, masked for years without all 12 months
+        """
+        vals = self.annual_sums if method == 'sum' else self.annual_sums/12.0
+
+        return masked_array(vals, mask = self.annual_counts < 12)
+
+    def difference(self, clim, period):
+        """
+        climatology of period less that of the first period
+        """
+        return clim[period] - clim[0]
+
+def _band_plan(src_var, nperiods, nyears, max_bytes):
+    """
+    rows per band, aligned to the chunks of the source where memory allows, and time steps, whole years, per read
+    half of the memory is given to the accumulators and half to the blocks read
+    """
+    ntime, nlats, nlons = src_var.shape
+    chunking = src_var.chunking()
+    nrows = nlats if chunking == 'contiguous' or chunking is None else chunking[1]
+
+    acc_row_nbytes = (nperiods*12*(8 + 4) + nyears*(8 + 2))*nlons
+    nrows = max(1, min(nrows, (max_bytes // 2) // acc_row_nbytes))
+
+    step_nbytes = nrows*nlons*(src_var.dtype.itemsize + 8 + 1)    # values read plus filled copy and mask
+    nsteps = max(12, ((max_bytes // 2) // step_nbytes // 12)*12)
+
+    return nrows, min(ntime, nsteps)
+
+def _declare_outputs(schema, src_var, dims, period_nyears, diff_nyears, method, chunks):
+    """
+    climatology, annual and difference variables of one source variable
+    """
+    var_name = src_var.name
+    units = src_var.units if 'units' in src_var.ncattrs() else ''
+    fill_value = src_var._FillValue if '_FillValue' in src_var.ncattrs() else MISSING_VALUE
+    lat_dim, lon_dim = dims
+    band_nrows, nlons = chunks
+
+    schema.add_variable(var_name + '_clim', 'f4', ('period', 'month', lat_dim, lon_dim), fill_value = fill_value,
+                        chunksizes = (1, 1, band_nrows, nlons), compress = True,
+                        attrs = {'long_name': 'monthly climatology of ' + var_name, 'units': units,
+                                 'cell_methods': 'time: mean within years time: mean over years',
+                                 'missing_value': fill_value})
+
+    schema.add_variable(var_name + '_annual', 'f4', ('year', lat_dim, lon_dim), fill_value = fill_value,
+                        chunksizes = (1, band_nrows, nlons), compress = True,
+                        attrs = {'long_name': 'annual ' + ('total' if method == 'sum' else 'mean') + ' of ' + var_name,
+                                 'units': units, 'cell_methods': 'time: ' + method, 'missing_value': fill_value})
+
+    for nyears in diff_nyears:
+        schema.add_variable(var_name + '_diff{}'.format(nyears), 'f4', ('month', lat_dim, lon_dim),
+                        fill_value = fill_value, chunksizes = (1, band_nrows, nlons), compress = True,
+                        attrs = {'long_name': 'change in monthly climatology of {} over {} years'.format(var_name, nyears),
+                                 'comment': 'climatology of period {} less that of period 0'
+                                                                        .format(nyears // period_nyears),
+                                 'units': units, 'missing_value': fill_value})
+    return
+
+def climatology_nc(src_fname, out_fname = None, var_names = None, period_nyears = CLIM_NYEARS,
+                   diff_nyears = DIFF_NYEARS, sum_vars = SUM_VARS, strt_year = None, strt_month = 1,
+                                                                        max_mb = MAX_MB, delete_flag = True):
+    '''
+    write the climatologies, differences and annual values of var_names, by default every (time, lat, lon)
+    variable, of the monthly product src_fname; returns the output file name or None
+    the start of the series is taken from the time variable unless strt_year is given
+    '''
+    if out_fname is None:
+        root, ext = splitext(src_fname)
+        out_fname = root + OUT_SUFFIX + ext
+
+    build_flag = check_existing_output(out_fname, delete_flag)
+    if not build_flag:
+        return out_fname if build_flag is False else None
+
+    src_dset = Dataset(src_fname, 'r')
+    if var_names is None:
+        var_names = clim_targets(src_dset)
+
+    if strt_year is None:
+        series_strt = series_start(src_dset)
+        if series_strt is None:
+            print(ERROR_STR + src_fname + ' has no time variable - supply the start year of the series')
+            src_dset.close()
+            return None
+        strt_year, strt_month = series_strt
+
+    # periods and years covered; offsets must be whole numbers of periods and the period compared must be
+    # complete, a truncated final period would give a difference from fewer years than the first period
+    # =====================================================================================================
+    ntime = src_dset.variables[var_names[0]].shape[0]
+    nyears = -(-(strt_month - 1 + ntime) // 12)
+    nperiods = -(-nyears // period_nyears)
+
+    diffs = []
+    for nyears_diff in diff_nyears:
+        if nyears_diff % period_nyears != 0:
+            print(WARNING_STR + 'difference over {} years is not a whole number of {} year periods - will skip'
+                                                                                .format(nyears_diff, period_nyears))
+        elif nyears_diff + period_nyears > nyears:
+            print(WARNING_STR + 'series of {} years is too short for a difference over {} years of complete {} '
+                                        'year periods - will skip'.format(nyears, nyears_diff, period_nyears))
+        else:
+            diffs.append(nyears_diff)
+
+    # declare output
+    # ==============
+    src_var = src_dset.variables[var_names[0]]
+    lat_dim, lon_dim = src_var.dimensions[1:]
+    nlats, nlons = src_var.shape[1:]
+    max_bytes = int(max_mb*1024*1024)
+    band_nrows = _band_plan(src_var, nperiods, nyears, max_bytes)[0]
+
+    history = 'climatologies of {} year periods by {} from {}'.format(period_nyears, __prog__, src_fname)
+    schema = NcSchema({'history': history, 'source': src_fname, 'period_years': period_nyears})
+    schema.add_dimension('period', nperiods)
+    schema.add_dimension('month', 12)
+    schema.add_dimension('year', nyears)
+    schema.add_dimension(lat_dim, nlats)
+    schema.add_dimension(lon_dim, nlons)
+    schema.add_dimension('bnds', 2)
+
+    for coord_name in (lat_dim, lon_dim):
+        if coord_name in src_dset.variables:
+            coord_var = src_dset.variables[coord_name]
+            schema.add_variable(coord_name, coord_var.dtype, (coord_name,), values = coord_var[:],
+                                    attrs = {attr: coord_var.getncattr(attr) for attr in coord_var.ncattrs()})
+
+    period_strts = strt_year + arange(nperiods)*period_nyears
+    period_ends = period_strts + period_nyears - 1
+    period_ends[-1] = strt_year + nyears - 1
+    schema.add_variable('period', 'i2', ('period',), values = period_strts,
+                                    attrs = {'long_name': 'first year of period', 'bounds': 'period_bnds'})
+    schema.add_variable('period_bnds', 'i2', ('period', 'bnds'), values = column_stack((period_strts, period_ends)),
+                                    attrs = {'long_name': 'first and last years of period'})
+    schema.add_variable('month', 'i2', ('month',), values = arange(1, 13), attrs = {'long_name': 'calendar month'})
+    schema.add_variable('year', 'i2', ('year',), values = strt_year + arange(nyears), attrs = {'long_name': 'year'})
+
+    for var_name in var_names:
+        method = 'sum' if var_name in sum_vars else 'mean'
+        _declare_outputs(schema, src_dset.variables[var_name], (lat_dim, lon_dim), period_nyears, diffs, method,
+                                                                                            (band_nrows, nlons))
+    tmp_fname = temp_fname(out_fname)
+    if schema.create(tmp_fname) is None:
+        src_dset.close()
+        return None
+
+    out_dset = Dataset(tmp_fname, 'a')
+    try:
+        for var_name in var_names:
+            method = 'sum' if var_name in sum_vars else 'mean'
+            _climatology_var(src_dset.variables[var_name], out_dset, strt_month, nperiods, nyears, period_nyears,
+                                                                                    diffs, method, max_bytes)
+    except (OSError, RuntimeError) as err:
+        print(ERROR_STR + 'computing climatologies of ' + src_fname + ' ' + str(err))
+        out_dset.close()
+        src_dset.close()
+        discard_temp(tmp_fname)
+        return None
+
+    out_dset.close()
+    src_dset.close()
+
+    return finalise_output(tmp_fname, out_fname)
+
+def _climatology_var(src_var, out_dset, strt_month, nperiods, nyears, period_nyears, diffs, method, max_bytes):
+    """
+    one pass over src_var, band by band, reading blocks of whole years
+    """
+    var_name = src_var.name
+    ntime, nlats, nlons = src_var.shape
+    nrows, nsteps = _band_plan(src_var, nperiods, nyears, max_bytes)
+
+    # year index and month of each time step
+    # ======================================
+    mnth_indx = strt_month - 1 + arange(ntime)
+    year_indx = mnth_indx // 12
+    months = mnth_indx % 12
+
+    nbands = -(-nlats // nrows)
+    meter = ProgressMeter('Climatologies of ' + var_name, nbands, 'bands', check_every = 1)
+    for row_strt, row_end in generate_bands(nlats, nrows):
+        accum = ClimAccumulator(nperiods, nyears, row_end - row_strt, nlons, period_nyears)
+
+        # first block ends at a year boundary so that later blocks hold whole years
+        # =========================================================================
+        time_strt = 0
+        while time_strt < ntime:
+            time_end = min(ntime, time_strt + nsteps - (strt_month - 1 if time_strt == 0 else 0))
+            with stage('read') as stg:
+                vals = src_var[time_strt:time_end, row_strt:row_end, :]
+                stg.nbytes = vals.nbytes
+
+            with stage('compute'):
+                accum.add(vals, year_indx[time_strt:time_end], months[time_strt:time_end])
+
+            meter.add_bytes(nread = vals.nbytes)
+            time_strt = time_end
+
+        with stage('compute'):
+            clim = accum.climatology()
+            annual = accum.annual(method)
+
+        with stage('write') as stg:
+            out_dset.variables[var_name + '_clim'][:, :, row_strt:row_end, :] = clim
+            out_dset.variables[var_name + '_annual'][:, row_strt:row_end, :] = annual
+            for nyears_diff in diffs:
+                diff = accum.difference(clim, nyears_diff // period_nyears)
+                out_dset.variables[var_name + '_diff{}'.format(nyears_diff)][:, row_strt:row_end, :] = diff
+            stg.nbytes = 4*(clim.size + annual.size + 12*(row_end - row_strt)*nlons*len(diffs))
+
+        meter.add_bytes(nwritten = stg.nbytes)
+        meter.tick()
+
+    meter.finish()
+
+    return
+
+def main():
+    '''
+
+    '''
+    parser = ArgumentParser(description='Monthly climatologies, differences and annual values of a monthly product')
+    parser.add_argument('src_fname', help='populated monthly NetCDF product')
+    parser.add_argument('--out_fname', help='default is the source name with suffix ' + OUT_SUFFIX)
+    parser.add_argument('--vars', nargs='+', help='default is every (time, lat, lon) variable')
+    parser.add_argument('--period', type=int, default=CLIM_NYEARS, help='years in each climatology period')
+    parser.add_argument('--diffs', type=int, nargs='*', default=list(DIFF_NYEARS),
+                                                        help='offsets in years of the periods compared with the first')
+    parser.add_argument('--sum_vars', nargs='*', default=SUM_VARS, help='variables whose annual values are totals')
+    parser.add_argument('--strt_year', type=int, help='first year of the series if there is no time variable')
+    parser.add_argument('--max_mb', type=float, default=MAX_MB, help='memory limit for accumulators and blocks read')
+    args = parser.parse_args()
+
+    climatology_nc(args.src_fname, args.out_fname, args.vars, args.period, args.diffs, args.sum_vars,
+                                                                    args.strt_year, max_mb = args.max_mb)
+
+if __name__ == '__main__':
+    main()
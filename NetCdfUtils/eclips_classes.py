@@ -17,9 +17,13 @@ from os.path import isfile, join, isdir
 from os import remove, makedirs
 from time import strftime
 from netCDF4 import Dataset
-from numpy import arange, float32
+from numpy import arange, float32, flatnonzero, unravel_index
+from numpy.ma import filled
 
-from nc_low_level_fns import generate_mnthly_atimes
+from time_axes import time_axis, TIME_UNITS
+from chunk_fns import window_indices, box_means
+from nc_schema_writer import NcSchema
+from atomic_output import temp_fname, finalise_output, discard_temp, is_complete, check_existing_output
 
 WARNING_STR = '*** Warning *** '
 
@@ -28,8 +32,10 @@ WARNING_STR = '*** Warning *** '
 HRMN_RESOL = 0.125  # degrees
 HARMONIE_BBOX =   [-24.9375, 35.0625, 45.0625, 73.0625]     #  lon_ll, lat_ll, lon_ur, lat_ur
 NYEARS = 41                                                 # should give 14,965 time steps if no leap years
+METRIC_CHUNKS = (1, 32, 560)                                # one month of a band of latitudes
 NDAY_STRT = 25202; NDAY_END = 43098     # take days extents from HARMONIE daily datasets 41 years 365 + 12 leap years
 MISSING_VALUE = -999.0
+CALENDAR = 'standard'
 
 def create_eclips_nc(eclips_defn, clone_fn, metric):
     """
@@ -38,30 +44,22 @@ def create_eclips_nc(eclips_defn, clone_fn, metric):
     func_name =  __prog__ + ' create_eclips_nc'
 
     eclips_fn = eclips_defn.nc_fname
-    if isfile(eclips_fn):
+    if is_complete(eclips_fn):
         print(WARNING_STR + eclips_fn + ' already exists - will skip reconstruction')
         return eclips_fn
 
-    # call the Dataset constructor to create file
-    # ===========================================
-    try:
-        nc_dset = Dataset(eclips_fn, 'w', format='NETCDF4_CLASSIC')
-    except PermissionError as err:
-        print(err)
-        return None
-
     clone_dset = Dataset(clone_fn, 'r')
+    lsmask_var = clone_dset.variables['lsmask']
+    metric_var = clone_dset.variables[metric]
+    missing_value = metric_var.missing_value
 
     # create global attributes
     # ========================
     date_stamp = strftime('%H:%M %d-%m-%Y')
-    nc_dset.attributation = 'Created at ' + date_stamp + ' from Spatial Ecosse'
-    nc_dset.history = 'SuperG'
-
     clim_dset = 'dummy'
-    data_used = 'Data used: HWSD soil and {} weather dataset'.format(clim_dset)
-    nc_dset.weather_dataset = clim_dset
-    nc_dset.dataUsed = data_used
+    schema = NcSchema({'attributation': 'Created at ' + date_stamp + ' from Spatial Ecosse', 'history': 'SuperG',
+                       'weather_dataset': clim_dset,
+                       'dataUsed': 'Data used: HWSD soil and {} weather dataset'.format(clim_dset)})
 
     # expand bounding box to make sure all results are included
     # =========================================================
@@ -74,76 +72,55 @@ def create_eclips_nc(eclips_defn, clone_fn, metric):
     alats = arange(lat_ll, lat_ur, resol, dtype=float32)
     num_alons = len(alons)
     num_alats = len(alats)
- 
-    # setup time dimension - asssume daily
-    # ====================================
-    atimes, atimes_strt, atimes_end = generate_mnthly_atimes(eclips_defn.strt_yr, eclips_defn.nmonths)  # create ndarrays
+
+    # monthly time axis with mid-month values and CF bounds
+    # =====================================================
+    atimes, time_bnds = time_axis(eclips_defn.strt_yr, eclips_defn.nmonths, 'monthly', TIME_UNITS, CALENDAR)
 
     mess = 'Number of longitudes: {}\tlatitudes: {}\tmonths: {}'.format(num_alons, num_alats, eclips_defn.nmonths)
     print(mess)
 
-    # create dimensions
-    # =================
-    nc_dset.createDimension('lat', num_alats)
-    nc_dset.createDimension('lon', num_alons)
-    nc_dset.createDimension('time', len(atimes))
-    nc_dset.createDimension('bnds', 2)
-
-    # create the variable (4 byte float in this case)
-    # createVariable method has arguments:
-    #   first: name of the , second: datatype, third: tuple with the name (s) of the dimension(s).
-    # ===================================
-    lats = nc_dset.createVariable('lat', 'f4', ('lat',))
-    lats.description = 'degrees of latitude North to South in ' + str(resol) + ' degree steps'
-    lats.units = 'degrees_north'
-    lats.long_name = 'latitude'
-    lats.axis = 'Y'
-    lats[:] = alats
-
-    lons = nc_dset.createVariable('lon', 'f4', ('lon',))
-    lons.description = 'degrees of longitude West to East in ' + str(resol) + ' degree steps'
-    lons.units = 'degrees_east'
-    lons.long_name = 'longitude'
-    lons.axis = 'X'
-    lons[:] = alons
-
-    times = nc_dset.createVariable('time', 'f4', ('time',))
-    times.units = 'days since 1900-01-01'
-    times.calendar = 'standard'
-    times.axis = 'T'
-    times.bounds = 'time_bnds'
-    times[:] = atimes
-
-    # create time_bnds variable
-    # =========================
-    time_bnds = nc_dset.createVariable('time_bnds', 'f4', ('time', 'bnds'), fill_value=MISSING_VALUE)
-    time_bnds._ChunkSizes = 1, 2
-    time_bnds[:, 0] = atimes_strt
-    time_bnds[:, 1] = atimes_end
-
-    # create land-sea mask variable
-    # =============================
-    var_name = 'lsmask'
-    lsmask = nc_dset.createVariable(var_name, 'i2', ('lat', 'lon'), fill_value=MISSING_VALUE)
-    lsmask.long_name = clone_dset.variables[var_name].long_name
-    lsmask.units = clone_dset.variables[var_name].units
-    lsmask.comment = clone_dset.variables[var_name].comment
-
-    # create the time dependent metrics and assign default data
-    # =========================================================
-    missing_value = clone_dset.variables[metric].missing_value
-    var_metric = nc_dset.createVariable(metric, 'f4', ('time', 'lat', 'lon'), fill_value=missing_value)
-    var_metric.long_name = 'Average temperature at surface'
-    var_metric.units = 'Degrees C'
-    var_metric.alignment = clone_dset.variables[metric].alignment
-    var_metric.missing_value = missing_value
-
-    # close netCDF file
-    # ================
-    nc_dset.sync()
-    nc_dset.close()
+    # dimensions and variables
+    # ========================
+    schema.add_dimension('lat', num_alats)
+    schema.add_dimension('lon', num_alons)
+    schema.add_dimension('time', len(atimes))
+    schema.add_dimension('bnds', 2)
+
+    schema.add_variable('lat', 'f4', ('lat',), values = alats,
+                        attrs = {'description': 'degrees of latitude North to South in ' + str(resol) + ' degree steps',
+                                 'units': 'degrees_north', 'long_name': 'latitude', 'axis': 'Y'})
+    schema.add_variable('lon', 'f4', ('lon',), values = alons,
+                        attrs = {'description': 'degrees of longitude West to East in ' + str(resol) + ' degree steps',
+                                 'units': 'degrees_east', 'long_name': 'longitude', 'axis': 'X'})
+    schema.add_variable('time', 'f4', ('time',), values = atimes,
+                        attrs = {'units': TIME_UNITS, 'calendar': CALENDAR, 'axis': 'T', 'bounds': 'time_bnds'})
+    schema.add_variable('time_bnds', 'f4', ('time', 'bnds'), fill_value = MISSING_VALUE, chunksizes = (1, 2),
+                                                                                            values = time_bnds)
+
+    # land-sea mask is filled later from the clone
+    # ============================================
+    schema.add_variable('lsmask', 'i2', ('lat', 'lon'), fill_value = MISSING_VALUE,
+                        attrs = {'long_name': lsmask_var.long_name, 'units': lsmask_var.units,
+                                 'comment': lsmask_var.comment})
+
+    # time dependent metric is written a month of a band of latitudes at a time
+    # =========================================================================
+    schema.add_variable(metric, 'f4', ('time', 'lat', 'lon'), fill_value = missing_value,
+                        chunksizes = METRIC_CHUNKS, compress = True,
+                        attrs = {'long_name': 'Average temperature at surface', 'units': 'Degrees C',
+                                 'alignment': metric_var.alignment, 'missing_value': missing_value})
     clone_dset.close()
 
+    # build in a temporary file which is renamed when complete
+    # ========================================================
+    tmp_fn = temp_fname(eclips_fn)
+    if schema.create(tmp_fn) is None:
+        discard_temp(tmp_fn)
+        return None
+
+    finalise_output(tmp_fn, eclips_fn)
+
     print('Created: ' + eclips_fn + '\n')
     # form.lgr.info()
 
@@ -160,19 +137,16 @@ class EclipsNcDefn(object, ):
         if not isdir(out_dir):
             makedirs(out_dir)
 
+        # incomplete files left by an interrupted run are always removed
+        # ==============================================================
         nc_fname =  join(out_dir, metric_out + '_' + scenario + year_range + '.nc')
-        if isfile(nc_fname):
-            if delete_flag:
-                try:
-                    remove(nc_fname)
-                    print('Deleted: ' + nc_fname)
-                except PermissionError:
-                    print('File: {} already exists but could not delete'.format(nc_fname))
-                    nc_fname = None
-            else:
-                print('File ' + nc_fname + ' already exists')
+        build_flag = check_existing_output(nc_fname, delete_flag)
+        if build_flag is None:
+            print('File: {} already exists but could not delete'.format(nc_fname))
+            nc_fname = None
 
         self.nc_fname = nc_fname
+        self.build_flag = bool(build_flag)
 
         # deconstruct year range
         # ======================
@@ -203,3 +177,61 @@ class EclipsNcDefn(object, ):
             lat_ur = harmonie_dict['lat_ur']
 
         self.bbox = list([lon_ll, lat_ll, lon_ur, lat_ur])
+
+class LandSeaMask(object, ):
+    '''
+    land-sea mask held as a boolean array together with the flat and 2-D indices of the land cells
+    '''
+    def __init__(self, lsmask_vals):
+        """
+        lsmask_vals is the (lat, lon) content of an lsmask variable, land cells have value 1
+        """
+        self.land = filled(lsmask_vals == 1, False)
+        self.nlats, self.nlons = self.land.shape
+        self.land_indices = flatnonzero(self.land)
+        self.lat_indices, self.lon_indices = unravel_index(self.land_indices, self.land.shape)
+        self.nland = len(self.land_indices)
+
+def read_land_sea_mask(nc_fname, var_name = 'lsmask'):
+    """
+    read the land-sea mask of a dataset once
+    """
+    nc_dset = Dataset(nc_fname, 'r')
+    lsmask = LandSeaMask(nc_dset.variables[var_name][:])
+    nc_dset.close()
+
+    print('Read land-sea mask from {} with {} land cells'.format(nc_fname, lsmask.nland))
+
+    return lsmask
+
+class RegridIndexMap(object, ):
+    '''
+    windows on the input grid covering each row and column of the output grid, computed once and shared
+    upper indices are exclusive
+    '''
+    def __init__(self, inpt_grid, out_grid):
+        """
+        both grids are WeatherGrid instances
+        """
+        resol_d2 = abs(out_grid.resol_lon)/2.0
+        self.lat_lo, self.lat_hi = window_indices(inpt_grid, out_grid.lats, resol_d2)
+        self.lon_lo, self.lon_hi = window_indices(inpt_grid, out_grid.lons, resol_d2, axis = 'lon')
+
+    def input_rows(self, lat_strt, lat_end):
+        """
+        range of input rows, upper exclusive, read to regrid output rows lat_strt to lat_end
+        """
+        return int(self.lat_lo[lat_strt:lat_end].min()), int(self.lat_hi[lat_strt:lat_end].max())
+
+    def in_area(self, lat_strt, lat_end):
+        """
+        output rows of the band which have any input rows
+        """
+        return self.lat_hi[lat_strt:lat_end] > self.lat_lo[lat_strt:lat_end]
+
+    def regrid_band(self, inpt_band, row_min, lat_strt, lat_end):
+        """
+        unweighted mean of the input window of each cell of the band, and the number of valid values
+        """
+        return box_means(inpt_band, self.lat_lo[lat_strt:lat_end] - row_min, self.lat_hi[lat_strt:lat_end] - row_min,
+                                                                                        self.lon_lo, self.lon_hi)
@@ -13,21 +13,37 @@ __version__ = '0.0.1'
 __author__ = 's03mm5'
 
 from os.path import join, isfile, isdir, split
+from os import makedirs
+from shutil import copyfile
+from multiprocessing import Pool
+from logging import getLogger
 from netCDF4 import Dataset, date2index, date2num, num2date
 from glob import glob
 from copy import copy
-from numpy.ma import masked as MaskedConstant
-from time import time
+from numpy import float32, broadcast_to, zeros
+from numpy.ma import masked as MaskedConstant, masked_array
 from _datetime import datetime
 
 from locale import format_string, setlocale, LC_ALL
 setlocale(LC_ALL, '')
 
-from spec_utilities import update_progress_post
+from spec_utilities import ProgressMeter, pool_map
 from weather_datasets import read_wthr_dsets_detail, get_nc_coords
-from eclips_classes import create_eclips_nc, EclipsNcDefn
+from eclips_classes import create_eclips_nc, EclipsNcDefn, LandSeaMask, RegridIndexMap, read_land_sea_mask
+from chunk_fns import generate_bands
+from regrid_fns import ConservativeRegridder
+from profiling_fns import stage
+from nc_low_level_fns import GCMS
+from atomic_output import temp_fname, finalise_output, discard_temp, is_complete, mark_in_progress, write_marker
+from nc_schema_writer import schema_from_dset
+from zarr_backend import open_dataset, nc_to_zarr, backend_fname, OUTPUT_BACKEND, BACKEND_NPROCS
+from qa_scan import run_qa
 
 sleepTime = 5
+BAND_NLATS = 32     # rows of the output grid processed per band in out-of-core mode, 0 for cell by cell
+SWEEP_NPROCS = 4    # worker processes used in sweep mode, overridden by the sweep_nprocs setting
+HIST_DIR = 'historic'   # sub-directory of the datasets populated once with the historic years in sweep mode
+REGRID_METHOD = 'box'   # box: unweighted mean of input cells centred in each output cell, or conservative
 
 HECTARES_TO_M2 = 0.0001
 
@@ -60,18 +76,71 @@ del(WTHR_SET_DEFNS['EObs_v23'])
 
 def populate_eclips_dsets(form):
     """
-
+    populate the ECLIPS datasets for the selected scenario and GCM or, in sweep mode, for every scenario and GCM
+    returns True if every dataset was populated, otherwise None
     """
     scenario = form.w_combo10.currentText()
     gcm = form.w_combo11.currentText()
-    populate_hist_flag = form.w_pop_hist.isChecked()
-    populate_fut_flag = form.w_pop_fut.isChecked()
+
+    shared = _load_shared_state(form)
+    if shared is None:
+        return None
+
+    if form.w_sweep.isChecked():
+        out_fnames, nfailed = _sweep_eclips_dsets(form, shared)
+    else:
+        nprocs = form.settings.get('backend_nprocs', BACKEND_NPROCS)
+        out_fnames = []
+        nfailed = 1
+        if _populate_scenario_gcm(form.lgr, shared, scenario, gcm, shared['eclips_wthr_dict'], nprocs):
+            out_fnames = _output_fnames(shared, shared['eclips_wthr_dict'])
+            nfailed = 0
+
+    run_qa(form.settings, out_fnames)
+
+    return True if nfailed == 0 else None
+
+def _output_fnames(shared, eclips_wthr_dict):
+    """
+    datasets populated for a scenario and GCM - Zarr stores with the zarr backend
+    """
+    fn_metrics = ['fn_tas'] if shared['tave_only_flag'] else ['fn_precip', 'fn_tas']
+    if shared.get('backend', OUTPUT_BACKEND) == 'zarr':
+        return [backend_fname(eclips_wthr_dict[fn_metric], 'zarr') for fn_metric in fn_metrics]
+
+    return [eclips_wthr_dict[fn_metric] for fn_metric in fn_metrics]
+
+def _product_stores(eclips_wthr_dict, fn_metrics, delete_flag = True):
+    """
+    with the zarr backend the products are Zarr stores beside the NetCDF files; a store is created from its
+    NetCDF file, with the metric chunked by single months, if it is absent, not marked complete or the delete
+    flag is set - as with the NetCDF files an existing store would otherwise hold data of an earlier run
+    """
+    store_dict = copy(eclips_wthr_dict)
+    for fn_metric in fn_metrics:
+        store_path = backend_fname(eclips_wthr_dict[fn_metric], 'zarr')
+        if delete_flag or not is_complete(store_path):
+            metric = 'Tairalign' if fn_metric == 'fn_tas' else 'Precipalign'
+            if nc_to_zarr(eclips_wthr_dict[fn_metric], store_path, step_vars = [metric]) is None:
+                return None
+
+        store_dict[fn_metric] = store_path
+
+    return store_dict
+
+def _load_shared_state(form):
+    """
+    weather set details, land-sea masks and the regrid index map are loaded once and shared by all
+    scenario and GCM combinations
+    """
+    shared = {'populate_hist_flag': form.w_pop_hist.isChecked(), 'populate_fut_flag': form.w_pop_fut.isChecked(),
+              'band_nlats': form.settings.get('band_nlats', BAND_NLATS), 'tave_only_flag': False,
+              'delete_flag': form.w_del_nc.isChecked(),
+              'backend': form.settings.get('output_backend', OUTPUT_BACKEND)}
 
     if form.w_tave_only.isChecked():
-        tave_only_flag = True
+        shared['tave_only_flag'] = True
         print(WARNING_STR + 'only temperature will be processed')
-    else:
-        tave_only_flag = False
 
     # reduce time taken for reading weatherset details
     # ================================================
@@ -86,12 +155,203 @@ def populate_eclips_dsets(form):
     for wthr_set in ['ECLIPS2_Mnth', 'ECLIPS2TMPLT_Mnth']:
         if wthr_set not in form.wthr_sets:
             print(wthr_set + ' must be present in weather sets')
-            return
+            return None
 
     eclips_wthr_dict = form.wthr_sets['ECLIPS2_Mnth']
     tmplt_wthr_dict = form.wthr_sets['ECLIPS2TMPLT_Mnth']
+    shared['eclips_wthr_dict'] = eclips_wthr_dict
+    shared['tmplt_wthr_dict'] = tmplt_wthr_dict
+
+    shared['strt_yr_data'], end_yr = _fetch_decades(HIST_YR_RNG_LIST[0])      # start year expected to be 1961
+
+    # land-sea mask is read once per output file
+    # ==========================================
+    shared['lsmasks'] = {}
+    for fn_metric in ['fn_precip', 'fn_tas']:
+        shared['lsmasks'][fn_metric] = read_land_sea_mask(eclips_wthr_dict[fn_metric])
+
+    with stage('coords'):
+        shared['index_map'] = RegridIndexMap(tmplt_wthr_dict['grid'], eclips_wthr_dict['grid'])
+
+    # overlap weights for conservative regridding are computed once for all input files
+    # ==================================================================================
+    shared['regridder'] = None
+    regrid_method = form.settings.get('regrid_method', REGRID_METHOD)
+    if regrid_method == 'conservative':
+        with stage('coords'):
+            shared['regridder'] = ConservativeRegridder(tmplt_wthr_dict['grid'], eclips_wthr_dict['grid'])
+    elif regrid_method != 'box':
+        print(WARNING_STR + 'regrid_method ' + regrid_method + ' not recognised - will use box')
+
+    return shared
 
-    strt_yr_data, end_yr = _fetch_decades(HIST_YR_RNG_LIST[0])      # start year expected to be 1961
+def _empty_clone(src_fn, out_fn, metric):
+    """
+    copy of src_fn, which shares the grid, time axis and land-sea mask of the outputs, in which metric holds only
+    fill values so that no data of the GCM last populated into src_fn is carried over
+    """
+    src_dset = Dataset(src_fn, 'r')
+    chunking = src_dset.variables[metric].chunking()
+    schema = schema_from_dset(src_dset, {metric: None if chunking == 'contiguous' else chunking})
+    src_dset.close()
+
+    tmp_fn = temp_fname(out_fn)
+    if schema.create(tmp_fn) is None:
+        discard_temp(tmp_fn)
+        return None
+
+    return finalise_output(tmp_fn, out_fn, checksum_flag = False)
+
+def _historic_wthr_dict(lggr, shared):
+    """
+    the historic years are common to every scenario and GCM so in sweep mode they are populated once, into
+    datasets in a historic sub-directory created empty from the ECLIPS2 weather set datasets; complete
+    datasets of a previous sweep are reused unless the delete flag is set
+    returns the weather dictionary of the historic datasets or None
+    """
+    eclips_wthr_dict = shared['eclips_wthr_dict']
+    fn_metrics = ['fn_tas'] if shared['tave_only_flag'] else ['fn_precip', 'fn_tas']
+
+    hist_dict = copy(eclips_wthr_dict)
+    for fn_metric in fn_metrics:
+        root_dir, short_fn = split(eclips_wthr_dict[fn_metric])
+        makedirs(join(root_dir, HIST_DIR), exist_ok = True)
+        hist_dict[fn_metric] = join(root_dir, HIST_DIR, short_fn)
+
+    if not shared['delete_flag'] and all(is_complete(hist_dict[fn_metric]) for fn_metric in fn_metrics):
+        print('Will reuse historic datasets: ' + ', '.join(hist_dict[fn_metric] for fn_metric in fn_metrics))
+        return hist_dict
+
+    for fn_metric in fn_metrics:
+        metric = 'Tairalign' if fn_metric == 'fn_tas' else 'Precipalign'
+        if _empty_clone(eclips_wthr_dict[fn_metric], hist_dict[fn_metric], metric) is None:
+            return None
+
+    hist_shared = dict(shared, populate_fut_flag = False, backend = 'netcdf')     # cloned with copyfile
+    if not _populate_scenario_gcm(lggr, hist_shared, None, None, hist_dict):
+        return None
+
+    return hist_dict
+
+def _combination_wthr_dict(eclips_wthr_dict, clone_wthr_dict, scenario, gcm, fn_metrics, delete_flag = True):
+    """
+    output datasets of each scenario and GCM combination are placed in a scenario sub-directory, named after
+    the ECLIPS2 weather set datasets, and are cloned from the datasets of clone_wthr_dict, which hold the
+    historic years, if absent or if the delete flag is set
+    """
+    combo_dict = copy(eclips_wthr_dict)
+    for fn_metric in fn_metrics:
+        root_dir, short_fn = split(eclips_wthr_dict[fn_metric])
+        metric_out = short_fn.split('_')[0]
+        out_dir = join(root_dir, scenario)
+        makedirs(out_dir, exist_ok = True)     # workers of other GCMs may create it concurrently
+
+        combo_fn = join(out_dir, metric_out + '_' + scenario + '_' + gcm + YEAR_RANGE + '.nc')
+        if delete_flag or not is_complete(combo_fn):
+            tmp_fn = temp_fname(combo_fn)
+            copyfile(clone_wthr_dict[fn_metric], tmp_fn)
+            finalise_output(tmp_fn, combo_fn, checksum_flag = False)
+            print('Cloned ' + combo_fn)
+
+        combo_dict[fn_metric] = combo_fn
+
+    return combo_dict
+
+def _sweep_eclips_dsets(form, shared):
+    """
+    process every scenario in SCENARIOS and every GCM in GCMS, scheduling combinations over a pool of
+    worker processes - each combination writes to its own datasets, cloned from the historic datasets, and
+    is populated with its future years
+    returns the datasets of the combinations which completed and the number of combinations which failed
+    """
+    combos = [(scenario, gcm) for scenario in SCENARIOS for gcm in GCMS]
+
+    # every year of every combination is populated so that no data survives from the dataset cloned
+    # ==============================================================================================
+    if not (shared['populate_hist_flag'] and shared['populate_fut_flag']):
+        print(ERROR_STR + 'sweep mode requires both the populate historic and populate future flags to be set')
+        return [], len(combos)
+
+    hist_dict = _historic_wthr_dict(form.lgr, shared)
+    if hist_dict is None:
+        print(ERROR_STR + 'could not populate the historic datasets - sweep abandoned')
+        return [], len(combos)
+
+    sweep_shared = dict(shared, populate_hist_flag = False, clone_wthr_dict = hist_dict)
+    nprocs = form.settings.get('sweep_nprocs', SWEEP_NPROCS)
+    print('Sweep of {} scenario and GCM combinations using {} processes'.format(len(combos), nprocs))
+
+    if nprocs <= 1:
+        _init_sweep_worker(sweep_shared, form.lgr)
+        rslts = [_sweep_worker(combo) for combo in combos]
+    else:
+        with Pool(processes=nprocs, initializer=_init_sweep_worker, initargs=(sweep_shared,)) as pool:
+            rslts = pool_map(pool, _sweep_worker, combos)
+
+    out_fnames = []
+    nfailed = 0
+    for (scenario, gcm), combo_fnames in zip(combos, rslts):
+        print('\tscenario: {}\tGCM: {:<20s}{}'.format(scenario, gcm, 'ok' if combo_fnames else 'FAILED'))
+        if combo_fnames:
+            out_fnames += combo_fnames
+        else:
+            nfailed += 1
+
+    return out_fnames, nfailed
+
+def _init_sweep_worker(shared, lggr = None):
+    """
+    shared state is sent once to each worker process rather than with each combination or month
+    """
+    global _sweep_shared, _sweep_lggr
+    _sweep_shared = shared
+    _sweep_lggr = getLogger(__prog__) if lggr is None else lggr
+
+def _sweep_worker(combo):
+    """
+    returns the datasets of the combination or None if it failed
+    """
+    scenario, gcm = combo
+    fn_metrics = ['fn_tas'] if _sweep_shared['tave_only_flag'] else ['fn_precip', 'fn_tas']
+    combo_dict = _combination_wthr_dict(_sweep_shared['eclips_wthr_dict'], _sweep_shared['clone_wthr_dict'],
+                                                    scenario, gcm, fn_metrics, _sweep_shared['delete_flag'])
+    if not _populate_scenario_gcm(_sweep_lggr, _sweep_shared, scenario, gcm, combo_dict):
+        return None
+
+    return _output_fnames(_sweep_shared, combo_dict)
+
+def _populate_scenario_gcm(lggr, shared, scenario, gcm, eclips_wthr_dict, nprocs = 1):
+    """
+    populate the output datasets described by eclips_wthr_dict with historic and future data for one
+    scenario and GCM
+    with the zarr backend the Zarr stores of the datasets are populated month by month by nprocs worker
+    processes, each month being written to separate chunks; the stores are the products and may be
+    converted to NetCDF as a separate step with zarr_backend.py
+    """
+    tmplt_wthr_dict = shared['tmplt_wthr_dict']
+    strt_yr_data = shared['strt_yr_data']
+    populate_hist_flag = shared['populate_hist_flag']
+    populate_fut_flag = shared['populate_fut_flag']
+    tave_only_flag = shared['tave_only_flag']
+    backend = shared.get('backend', OUTPUT_BACKEND)
+
+    fn_metrics = ['fn_tas'] if tave_only_flag else ['fn_precip', 'fn_tas']
+    out_wthr_dict = eclips_wthr_dict
+    if backend == 'zarr':
+        out_wthr_dict = _product_stores(eclips_wthr_dict, fn_metrics, shared.get('delete_flag', True))
+        if out_wthr_dict is None:
+            return False
+
+    # outputs are marked incomplete while being populated so that an interrupted run is detected
+    # ==========================================================================================
+    for fn_metric in fn_metrics:
+        if not is_complete(out_wthr_dict[fn_metric]):
+            print(WARNING_STR + out_wthr_dict[fn_metric] + ' was not marked complete by a previous run')
+        mark_in_progress(out_wthr_dict[fn_metric])
+
+    # each task regrids one monthly input file: fn_metric, metric, input file, month, start and end year
+    # ===================================================================================================
+    tasks = []
 
     # ========================= historic data ========================
     if not populate_hist_flag:
@@ -115,7 +375,7 @@ def populate_eclips_dsets(form):
 
                 # loop to step through sets of 12 months
                 # ======================================
-                mess = 'Populating dataset ' + eclips_wthr_dict[fn_metric] + '\n\tmetric: ' + metric_inp
+                mess = 'Populating dataset ' + out_wthr_dict[fn_metric] + '\n\tmetric: ' + metric_inp
                 mess += '\twith historic data for year range ' + yr_rng
                 print(mess + '\n')
                 if not populate_hist_flag:
@@ -127,10 +387,7 @@ def populate_eclips_dsets(form):
                     if imnth is None:
                         break
 
-                    ret_code = _slice_resize(form.lgr, tmplt_wthr_dict, nc_fname, eclips_wthr_dict, fn_metric, metric,
-                                                        imnth, strt_yr_data, strt_yr, end_yr, process_data_flag = True)
-                    if not ret_code:
-                        return None
+                    tasks.append((fn_metric, metric, nc_fname, imnth, strt_yr, end_yr))
 
             print('End of historic data for metric ' + metric_inp + '\n')
 
@@ -143,7 +400,7 @@ def populate_eclips_dsets(form):
         nc_dir = join(ECLIPS_INP_DIR, PREFIX + scenario, gcm + SCENARIOS[scenario])
         if not isdir(nc_dir):
             print(nc_dir + ' does not exist')
-            return None
+            return False
 
         print('Processing future data from: ' + nc_dir + ' scenario: ' + scenario + ' GCM: ' + gcm)
 
@@ -154,7 +411,7 @@ def populate_eclips_dsets(form):
             if tave_only_flag and metric == 'Precipalign':
                 continue
 
-            print('Populating dataset ' + eclips_wthr_dict[fn_metric] + ' with future data')
+            print('Populating dataset ' + out_wthr_dict[fn_metric] + ' with future data')
 
             for yr_rng in FUT_YR_RNG_LIST:
 
@@ -171,98 +428,213 @@ def populate_eclips_dsets(form):
                     mess = 'Will copy ' + metric_inp + ' data from: ' + nc_fname + '\n\t'
                     mess += ' covering year range ' + yr_rng + ' and scenario ' + scenario
                     print(mess + '\n')
-                    ret_code = _slice_resize(form.lgr, tmplt_wthr_dict, nc_fname, eclips_wthr_dict, fn_metric,
-                                            metric, imnth, strt_yr_data, strt_yr, end_yr, process_data_flag=True)
-                    if not ret_code:
-                        return None
+                    tasks.append((fn_metric, metric, nc_fname, imnth, strt_yr, end_yr))
 
             print('End of future data for scenario: ' + scenario + ' metric: ' + metric_inp + '\n')
 
-    return None
+    # months are written concurrently only to Zarr stores
+    # ===================================================
+    if backend == 'zarr' and nprocs > 1:
+        print('Regridding {} monthly files using {} processes'.format(len(tasks), nprocs))
+        with Pool(processes=nprocs, initializer=_init_sweep_worker, initargs=(shared,)) as pool:
+            rslts = pool_map(pool, _slice_worker, [(out_wthr_dict,) + task for task in tasks])
+        if not all(rslts):
+            return False
+    else:
+        for task in tasks:
+            if not _populate_slice(lggr, shared, out_wthr_dict, *task):
+                return False
+
+    for fn_metric in fn_metrics:
+        write_marker(out_wthr_dict[fn_metric])
+
+    return True
+
+def _populate_slice(lggr, shared, eclips_wthr_dict, fn_metric, metric, nc_fname, imnth, strt_yr, end_yr):
+    """
+    regrid one monthly input file into the output dataset
+    """
+    return _slice_resize(lggr, shared['tmplt_wthr_dict'], nc_fname, eclips_wthr_dict, fn_metric, metric, imnth,
+                shared['strt_yr_data'], strt_yr, end_yr, process_data_flag = True, band_nlats = shared['band_nlats'],
+                    lsmask = shared['lsmasks'][fn_metric], index_map = shared['index_map'],
+                                                                                regridder = shared['regridder'])
 
-def _slice_resize(lggr, inpt_wthr_dict, inpt_fname, eclips_wthr_dict, fn_metric, metric,
-                                                imnth, strt_yr_data, strt_yr, end_yr, process_data_flag = False):
+def _slice_worker(task):
+    """
+    task is the output weather dictionary followed by the arguments of _populate_slice
     """
-    step through each lat, lon from new weather dataset
+    return _populate_slice(_sweep_lggr, _sweep_shared, *task)
+
+def _slice_resize(lggr, inpt_wthr_dict, inpt_fname, eclips_wthr_dict, fn_metric, metric, imnth,
+            strt_yr_data, strt_yr, end_yr, process_data_flag = False, band_nlats = None, lsmask = None, index_map = None,
+                                                                                                regridder = None):
+    """
+    step through each land cell of the new weather dataset
     create a lat lon bbox for each grid point
     retrieve mini-slice from band_lice and average the mini-slice values and record in
 
     after creating one-mini slice copy to next 30 (or however many years) metric variable timesteps
+    if band_nlats is set the output grid is processed out-of-core in bands of latitude rows instead
+    lsmask is the LandSeaMask of the output file, read once by the caller; it is read here if not supplied
+    index_map is the RegridIndexMap between the two grids, computed here if not supplied
+    regridder, a ConservativeRegridder, selects conservative regridding which is always done in bands
     """
     eclips_fn = eclips_wthr_dict[fn_metric]
+    with stage('open'):
+        try:
+            eclips_dset = open_dataset(eclips_fn, 'a')
+        except TypeError as err:
+            print('Unable to open output file {} error: {}'.format(eclips_fn, err))
+            return False
+
+        inpt_dset = Dataset(inpt_fname, 'r')
+
+    # datasets are closed however the slice ends, including cancellation of a job from the GUI
+    # ========================================================================================
     try:
-        eclips_dset = Dataset(eclips_fn, 'a')
-    except TypeError as err:
-        print('Unable to open output file {} error: {}'.format(eclips_fn, err))
-        return False
-
-    inpt_dset = Dataset(inpt_fname, 'r')
-
-    strt_date = datetime(strt_yr, imnth, 15)
-    mnth_name = strt_date.strftime("%B")
-    mess = 'Generating ' + METRIC_DESCR[metric]
-    print(mess + ' slices for {} for years {} to {}'.format(mnth_name, strt_yr, end_yr))
-    nyears = end_yr - strt_yr + 1
-
-    resol_d2 = eclips_wthr_dict['resol_lon']/ 2.0
-
-    strt_time = time()
-    last_time = time()
-    nmasked = 0
-    nout_of_area = 0
-    nvalid = 0
-    nwarns = 0
-    lats = eclips_wthr_dict['latitudes']
-    lons = eclips_wthr_dict['longitudes']
-    nsize_grid = len(lats)*len(lons)
-    time_indx = imnth - 1 + (strt_yr - strt_yr_data)*12
-
-    # main loop to create a metric slice for this month
-    # =================================================
-    if process_data_flag:
-        for lat in eclips_wthr_dict['latitudes']:
-            for lon in eclips_wthr_dict['longitudes']:
-
-                # check mask
-                # ==========
-                lat_indx, lon_indx = get_nc_coords(lggr, eclips_wthr_dict, lat, lon)
-                if eclips_dset.variables['lsmask'][lat_indx,lon_indx] == 1:
-
-                    lat_ll_indx, lon_ll_indx = get_nc_coords(lggr, inpt_wthr_dict, lat - resol_d2, lon - resol_d2)
-                    lat_ur_indx, lon_ur_indx = get_nc_coords(lggr, inpt_wthr_dict, lat + resol_d2, lon + resol_d2)
-                    if lat_ll_indx == 0 and lat_ur_indx == 0:
-                        nout_of_area += 1
-
-                    mini_slice = inpt_dset.variables['Band1'][lat_ll_indx:lat_ur_indx, lon_ll_indx:lon_ur_indx]
-                    if mini_slice is MaskedConstant:
-                        nmasked += 1
-                    else:
-                        val = mini_slice.mean()
-                        eclips_dset.variables[metric][time_indx, lat_indx, lon_indx] = val
-                        nvalid += 1
-
-                    last_time = update_progress_post(last_time, strt_time, nvalid, nsize_grid, nout_of_area, nmasked, nwarns)
-
-    inpt_dset.close()
-
-    # copy slice for each of years
-    # ============================
-    print('\nreplicating slice for year {} to each of years from {} to {}'.format(strt_yr, strt_yr + 1, end_yr))
-    if process_data_flag:
-        this_slice = eclips_dset.variables[metric][time_indx, :, :]
-        time_tmp_indx = time_indx
-        for yr in range(strt_yr + 1, end_yr + 1):
-            time_tmp_indx += 12
-            eclips_dset.variables[metric][time_tmp_indx, :, :] = this_slice
-
-    valid_str = format_string("%d", nvalid, grouping=True)
-    mess = 'populated {}\twith {} years of '.format(split(eclips_fn)[1], nyears) + METRIC_DESCR[metric] + ' data'
-    print('\n*** ' + mess + ' with ' + valid_str + ' valid values for each slice ***\n')
+        if lsmask is None:
+            with stage('read'):
+                lsmask = LandSeaMask(eclips_dset.variables['lsmask'][:])
+
+        strt_date = datetime(strt_yr, imnth, 15)
+        mnth_name = strt_date.strftime("%B")
+        mess = 'Generating ' + METRIC_DESCR[metric]
+        print(mess + ' slices for {} for years {} to {}'.format(mnth_name, strt_yr, end_yr))
+        nyears = end_yr - strt_yr + 1
+
+        nmasked = 0
+        nout_of_area = 0
+        nvalid = 0
+        eclips_grid = eclips_wthr_dict['grid']
+        inpt_grid = inpt_wthr_dict['grid']
+        time_indx = imnth - 1 + (strt_yr - strt_yr_data)*12
+        if index_map is None:
+            with stage('coords'):
+                index_map = RegridIndexMap(inpt_grid, eclips_grid)
+
+        # out-of-core: regrid and write each band of rows to every year in one operation
+        # ===============================================================================
+        if process_data_flag and regridder is not None:
+            nvalid, nmasked, nout_of_area = _slice_resize_bands(eclips_dset, inpt_dset, eclips_grid, regridder, lsmask,
+                                                                metric, time_indx, nyears, band_nlats or BAND_NLATS)
+
+        elif process_data_flag and band_nlats:
+            nvalid, nmasked, nout_of_area = _slice_resize_bands(eclips_dset, inpt_dset, eclips_grid, index_map, lsmask,
+                                                                                metric, time_indx, nyears, band_nlats)
+
+        # main loop to create a metric slice for this month - ocean cells are skipped
+        # ===========================================================================
+        elif process_data_flag:
+            lat_lo = index_map.lat_lo[lsmask.lat_indices]
+            lat_hi = index_map.lat_hi[lsmask.lat_indices]
+            lon_lo = index_map.lon_lo[lsmask.lon_indices]
+            lon_hi = index_map.lon_hi[lsmask.lon_indices]
+            nout_of_area = int((lat_lo == lat_hi).sum())
+
+            band1 = inpt_dset.variables['Band1']
+            land_vals = zeros(lsmask.nland, dtype=float32)
+            has_data = zeros(lsmask.nland, dtype=bool)
+
+            # cells are read one at a time so reads are timed with the computation
+            # =====================================================================
+            meter = ProgressMeter('Regridding ' + METRIC_DESCR[metric] + ' land cells', lsmask.nland)
+            with stage('compute') as stg:
+                for icell in range(lsmask.nland):
+                    meter.tick()
+                    if lat_lo[icell] == lat_hi[icell] or lon_lo[icell] == lon_hi[icell]:
+                        continue
+
+                    mini_slice = band1[lat_lo[icell]:lat_hi[icell], lon_lo[icell]:lon_hi[icell]]
+                    stg.nbytes += mini_slice.nbytes
+                    meter.add_bytes(nread = mini_slice.nbytes)
+
+                    val = mini_slice.mean()
+                    if val is not MaskedConstant:
+                        land_vals[icell] = val
+                        has_data[icell] = True
+
+            meter.finish()
+            nvalid = int(has_data.sum())
+            nmasked = lsmask.nland - nvalid
+
+            # scatter land values into the slice and copy to each of years
+            # ============================================================
+            print('\nwriting slice for year {} to each of years from {} to {}'.format(strt_yr, strt_yr + 1, end_yr))
+            slice_vals = zeros(lsmask.nlats*lsmask.nlons, dtype=float32)
+            slice_has_data = zeros(lsmask.nlats*lsmask.nlons, dtype=bool)
+            slice_vals[lsmask.land_indices] = land_vals
+            slice_has_data[lsmask.land_indices] = has_data
+            _write_slice_years(eclips_dset.variables[metric], time_indx, nyears, 0,
+                                    slice_vals.reshape(lsmask.land.shape), slice_has_data.reshape(lsmask.land.shape))
+
+        valid_str = format_string("%d", nvalid, grouping=True)
+        mess = 'populated {}\twith {} years of '.format(split(eclips_fn)[1], nyears) + METRIC_DESCR[metric] + ' data'
+        print('\n*** ' + mess + ' with ' + valid_str + ' valid values for each slice ***')
+        print('\tland cells without data: {}\tout of area: {}\n'.format(nmasked, nout_of_area))
+
+        eclips_dset.sync()
+
+        return True
+    finally:
+        inpt_dset.close()
+        eclips_dset.close()
+
+def _write_slice_years(out_var, time_indx, nyears, lat_strt, vals, has_data):
+    """
+    write rows of a slice, masked where there is no data, to the same month of every year in one strided write
+    """
+    nrows = vals.shape[0]
+    out_shape = (nyears,) + vals.shape
+    with stage('write') as stg:
+        out_var[time_indx:time_indx + 12*nyears:12, lat_strt:lat_strt + nrows, :] = \
+            masked_array(broadcast_to(vals.astype(float32), out_shape), mask = broadcast_to(~has_data, out_shape))
+        stg.nbytes = nyears*vals.size*4
 
-    eclips_dset.sync()
-    eclips_dset.close()
+    return
 
-    return True
+def _slice_resize_bands(eclips_dset, inpt_dset, eclips_grid, index_map, lsmask, metric, time_indx, nyears,
+                                                                                                    band_nlats):
+    """
+    regrid Band1 to the output grid one band of latitude rows at a time:
+        read the input rows covering the band in one hyperslab
+        average each output cell's window using summed area tables or, if index_map is a ConservativeRegridder,
+        the overlap weighted mean
+        write the band to the time step of every year with a single strided write
+    memory is bounded by the band size, not the grid size
+    """
+    band1 = inpt_dset.variables['Band1']
+    out_var = eclips_dset.variables[metric]
+
+    meter = ProgressMeter('Regridding ' + METRIC_DESCR[metric] + ' in bands', eclips_grid.nlats*eclips_grid.nlons,
+                                                                                                check_every = 1)
+    nvalid, nmasked, nout_of_area = 3*[0]
+    for lat_strt, lat_end in generate_bands(eclips_grid.nlats, band_nlats):
+        meter.tick((lat_end - lat_strt)*eclips_grid.nlons)
+        land = lsmask.land[lat_strt:lat_end, :]
+        if not land.any():
+            continue    # all ocean - output remains at fill value
+
+        row_min, row_max = index_map.input_rows(lat_strt, lat_end)
+
+        with stage('read') as stg:
+            inpt_band = band1[row_min:row_max, :]
+            stg.nbytes = inpt_band.nbytes
+
+        with stage('compute'):
+            means, counts = index_map.regrid_band(inpt_band, row_min, lat_strt, lat_end)
+            has_data = land & (counts > 0)
+
+        nvalid += int(has_data.sum())
+        nmasked += int((land & (counts == 0)).sum())
+        nout_of_area += int((land & ~index_map.in_area(lat_strt, lat_end)[:, None]).sum())
+
+        _write_slice_years(out_var, time_indx, nyears, lat_strt, means, has_data)
+        meter.add_bytes(nread = inpt_band.nbytes, nwritten = nyears*means.size*4)
+
+    meter.counters = {'valid': nvalid, 'masked': nmasked, 'out of area': nout_of_area}
+    meter.finish()
+
+    return nvalid, nmasked, nout_of_area
 
 def _fetch_decades(yr_rng):
     """
@@ -296,7 +668,7 @@ def _fetch_imnth(nc_fname, metric):
     return imnth
 def _copy_land_sea_mask(lggr, fn_metric, eclips_wthr_dict, clone_wthr_dict):
     """
-
+    returns True if the mask was copied, otherwise None
     """
     # open the newly created and clone NC files
     # =========================================
@@ -305,14 +677,17 @@ def _copy_land_sea_mask(lggr, fn_metric, eclips_wthr_dict, clone_wthr_dict):
         eclips_dset = Dataset(eclips_fn, 'a', format='NETCDF4')
     except TypeError as err:
         print('Unable to open output file {} error: {}'.format(eclips_fn, err))
-        return
+        return None
 
     clone_fn = clone_wthr_dict[fn_metric]
     try:
         clone_dset = Dataset(clone_fn, 'r', format='NETCDF4')
     except TypeError as err:
         print('Unable to open clone file {} error: {}'.format(clone_fn, err))
-        return
+        eclips_dset.close()
+        return None
+
+    mark_in_progress(eclips_fn)     # marked complete again once the mask is copied
 
     # locate origin from where mask will be copied from clone dataset (HARMONIE)
     # =========================================================================
@@ -334,18 +709,22 @@ def _copy_land_sea_mask(lggr, fn_metric, eclips_wthr_dict, clone_wthr_dict):
         eclips_dset.variables['lsmask'][:,:] = slice
     except (KeyError, ValueError) as err:
         print(ERROR_STR + 'copying land-sea mask: ' + str(err))
+        clone_dset.close()
+        eclips_dset.close()
+        return None     # left marked in progress
 
     clone_dset.close()
     eclips_dset.sync()
     eclips_dset.close()
+    write_marker(eclips_fn)
 
     print('\n*** Finished - having copied land-sea mask to NC file: ' + eclips_fn + '\n')
 
-    return
+    return True
 
 def make_empty_eclips_dsets(form):
     """
-
+    returns True if both datasets were created, or already existed, and their land-sea masks copied, otherwise None
     """
     delete_flag = form.w_del_nc.isChecked()
     scenario = form.w_combo10.currentText()
@@ -357,7 +736,7 @@ def make_empty_eclips_dsets(form):
     required_rsces = ['ECLIPS2TMPLT', 'HARMONIE_V2']
     wthr_set_defns = {rsrc: WTHR_SET_DEFNS[rsrc] for rsrc in required_rsces}
     if not read_wthr_dsets_detail(form, wthr_set_defns):
-        return
+        return None
 
     '''
         for wthr_rsce in required_rsces:
@@ -369,21 +748,24 @@ def make_empty_eclips_dsets(form):
     
     # main loop
     # =========
+    ret_code = True
     for fn_metric, metric_out, metric in zip(['fn_precip', 'fn_tas'], ['PPT', 'Tave'], ['Precipalign', 'Tairalign']):
 
         # deletes existing NC file if requested
         # =====================================
         eclips_defn = EclipsNcDefn(form.wthr_sets, metric_out, scenario, YEAR_RANGE, out_dir, delete_flag)
         if eclips_defn.nc_fname is None:
+            ret_code = None
             continue    # applies when nc file already exists but could not delete
 
-        if delete_flag or not isfile(eclips_defn.nc_fname):
+        if eclips_defn.build_flag:
 
             # remake nc file and copy land-sea mask from HARMONIE dataset
             # ===========================================================
             clone_fn = clone_wthr_dict[fn_metric]
             nc_fname = create_eclips_nc(eclips_defn, clone_fn, metric)
             if nc_fname is None:
+                ret_code = None
                 continue
 
     # reload weather set definitions
@@ -394,17 +776,19 @@ def make_empty_eclips_dsets(form):
 
     # reread definitions TODO: improve
     # ================================
-    if read_wthr_dsets_detail(form, wthr_set_defns):
+    if not read_wthr_dsets_detail(form, wthr_set_defns):
+        return None
 
-        # copy land-sea mask
-        # ==================
-        for fn_metric in ['fn_precip', 'fn_tas']:
-            try:
-                eclips_wthr_dict = form.wthr_sets['ECLIPS2']
-            except KeyError as err:
-                print(ERROR_STR + 'key ' + err + ' not present')
-                break
+    # copy land-sea mask
+    # ==================
+    for fn_metric in ['fn_precip', 'fn_tas']:
+        try:
+            eclips_wthr_dict = form.wthr_sets['ECLIPS2']
+        except KeyError as err:
+            print(ERROR_STR + 'key ' + str(err) + ' not present')
+            return None
 
-            _copy_land_sea_mask(form.lgr, fn_metric, eclips_wthr_dict, clone_wthr_dict)
+        if _copy_land_sea_mask(form.lgr, fn_metric, eclips_wthr_dict, clone_wthr_dict) is None:
+            ret_code = None
 
-    return
\ No newline at end of file
+    return ret_code
\ No newline at end of file
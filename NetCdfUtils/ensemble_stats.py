@@ -0,0 +1,271 @@
+#-------------------------------------------------------------------------------
+# Name:        ensemble_stats.py
+# Purpose:     ensemble statistics of the ECLIPS products of every GCM of a scenario
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Description: the products of all GCMs are opened together and read in aligned blocks of the metric, one
+#              member at a time; mean and standard deviation are accumulated with Welford's method, minimum and
+#              maximum alongside, so that memory is bounded by the block size rather than the number of GCMs
+#              percentiles need the values of every member and the block is reduced accordingly
+#              output has the coordinates, time axis and land-sea mask of the members and, for metric m:
+#                   m_mean, m_std, m_min, m_max, m_p10, m_p50, m_p90 and m_count, the number of members with data
+#              e.g.   python ensemble_stats.py E:\GlobalEcosseData\ECLIPS2_GlEc\Monthly\RCP45 Tairalign RCP45
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+__prog__ = 'ensemble_stats.py'
+__version__ = '0.0.0'
+__author__ = 's03mm5'
+
+from argparse import ArgumentParser
+from os.path import join, isfile
+
+from netCDF4 import Dataset
+from numpy import zeros, full, float64, int16, inf, minimum, maximum, sqrt, nan as NaN, nanpercentile
+from numpy.ma import masked_array, masked_invalid, getmaskarray, stack
+
+from nc_low_level_fns import GCMS, YEAR_RANGE
+from nc_schema_writer import schema_from_dset
+from atomic_output import temp_fname, finalise_output, discard_temp, check_existing_output, is_complete
+from chunk_fns import generate_bands
+from spec_utilities import ProgressMeter
+from profiling_fns import stage
+
+PERCENTILES = [10, 50, 90]
+DDOF = 1                # sample standard deviation
+MAX_MB = 512
+ENSEMBLE_NAME = 'ensemble'
+
+ERROR_STR = '*** Error *** '
+WARNING_STR = '*** Warning *** '
+
+def gcm_fnames(scen_dir, metric, scenario, gcms = GCMS, year_range = YEAR_RANGE):
+    '''
+    products of each GCM of a scenario, named as _combination_wthr_dict names them; products which are absent
+    or incomplete are omitted
+    '''
+    nc_fnames = []
+    for gcm in gcms:
+        nc_fname = join(scen_dir, metric + '_' + scenario + '_' + gcm + year_range + '.nc')
+        if not isfile(nc_fname):
+            print(WARNING_STR + nc_fname + ' does not exist - will omit GCM ' + gcm)
+        elif not is_complete(nc_fname):
+            print(WARNING_STR + nc_fname + ' is not marked complete - will omit GCM ' + gcm)
+        else:
+            nc_fnames.append(nc_fname)
+
+    return nc_fnames
+
+class EnsembleAccumulator(object, ):
+    '''
+    Welford running mean and sum of squared deviations, with minimum and maximum, of the members of an
+    ensemble added one at a time; masked values do not contribute
+    '''
+    def __init__(self, shape):
+        """
+
+        """
+        self.count = zeros(shape, dtype=int16)
+        self.mean = zeros(shape, dtype=float64)
+        self.m2 = zeros(shape, dtype=float64)
+        self.min = full(shape, inf)
+        self.max = full(shape, -inf)
+
+    def add(self, vals):
+        """
+        add the values of one member
+        """
+        vals = masked_invalid(vals)
+        valid = ~getmaskarray(vals)
+        vals = vals.filled(0.0).astype(float64)
+
+        self.count += valid
+        delta = vals - self.mean
+        self.mean += (delta / maximum(self.count, 1))*valid
+        self.m2 += delta*(vals - self.mean)*valid
+        self.min = minimum(self.min, vals, where = valid, out = self.min)
+        self.max = maximum(self.max, vals, where = valid, out = self.max)
+
+    def results(self, ddof = DDOF):
+        """
+        masked mean, standard deviation, minimum and maximum; standard deviation needs more than ddof members
+        """
+        no_data = self.count == 0
+        std = sqrt(self.m2 / maximum(self.count - ddof, 1))
+
+        return {'mean': masked_array(self.mean, mask = no_data), 'std': masked_array(std, mask = self.count <= ddof),
+                'min': masked_array(self.min, mask = no_data), 'max': masked_array(self.max, mask = no_data)}
+
+def member_percentiles(members, percentiles = PERCENTILES):
+    '''
+    percentiles across the first axis of a stack of masked member values, ignoring masked values
+    '''
+    vals = masked_invalid(members).astype(float64).filled(NaN)
+    no_data = getmaskarray(masked_invalid(members)).all(axis=0)
+    vals[:, no_data] = 0.0       # avoids warnings for cells without data, which are masked below
+
+    rslts = nanpercentile(vals, percentiles, axis=0)
+
+    return {'p{}'.format(pcntl): masked_array(rslt, mask = no_data) for pcntl, rslt in zip(percentiles, rslts)}
+
+def _block_plan(nc_var, nmembers, percentiles, max_bytes):
+    """
+    rows per band, the chunk rows of the members, and time steps per block such that the accumulators and the
+    values read, or the values of all members when percentiles are wanted, fit within max_bytes
+    """
+    ntime, nlats, nlons = nc_var.shape
+    chunking = nc_var.chunking()
+    nrows = nlats if chunking == 'contiguous' or chunking is None else chunking[1]
+    tchunk = 1 if chunking == 'contiguous' or chunking is None else chunking[0]
+
+    nheld = nmembers if percentiles else 1
+    step_nbytes = nrows*nlons*(4*8 + 2 + nheld*(8 + 1))     # accumulators plus values held and their masks
+    nsteps = max(tchunk, (max_bytes // step_nbytes // tchunk)*tchunk)
+
+    return nrows, min(ntime, nsteps)
+
+def ensemble_nc(nc_fnames, var_name, out_fname, percentiles = PERCENTILES, ddof = DDOF, max_mb = MAX_MB,
+                                                                                            delete_flag = True):
+    '''
+    write the ensemble statistics of var_name of the products nc_fnames, which must share a grid and time axis
+    returns the output file name or None
+    '''
+    build_flag = check_existing_output(out_fname, delete_flag)
+    if not build_flag:
+        return out_fname if build_flag is False else None
+
+    if len(nc_fnames) == 0:
+        print(ERROR_STR + 'no products for an ensemble of ' + var_name)
+        return None
+
+    nc_dsets = [Dataset(nc_fname, 'r') for nc_fname in nc_fnames]
+    nc_vars = [nc_dset.variables[var_name] for nc_dset in nc_dsets]
+    for nc_fname, nc_var in zip(nc_fnames, nc_vars):
+        if nc_var.shape != nc_vars[0].shape:
+            print(ERROR_STR + '{} in {} has shape {}, expected {}'.format(var_name, nc_fname, nc_var.shape,
+                                                                                            nc_vars[0].shape))
+            for nc_dset in nc_dsets:
+                nc_dset.close()
+            return None
+
+    # declare output: variables other than the metric as the first member, statistics chunked as the metric
+    # ======================================================================================================
+    nc_var = nc_vars[0]
+    chunking = nc_var.chunking()
+    chunks = None if chunking == 'contiguous' or chunking is None else chunking
+    schema = schema_from_dset(nc_dsets[0], {var_name: chunks})
+    schema.variables = [var_defn for var_defn in schema.variables if var_defn['name'] != var_name]
+    schema.global_attrs['history'] = 'ensemble statistics by {} of {} members: {}'.format(__prog__,
+                                                                                len(nc_fnames), ', '.join(nc_fnames))
+    units = nc_var.units if 'units' in nc_var.ncattrs() else ''
+    fill_value = nc_var._FillValue if '_FillValue' in nc_var.ncattrs() else None
+
+    stat_names = ['mean', 'std', 'min', 'max'] + ['p{}'.format(pcntl) for pcntl in percentiles]
+    for stat_name in stat_names:
+        attrs = {'long_name': 'ensemble {} of {}'.format(stat_name, var_name), 'units': units}
+        if fill_value is not None:
+            attrs['missing_value'] = fill_value
+        schema.add_variable(var_name + '_' + stat_name, 'f4', nc_var.dimensions, fill_value = fill_value,
+                                                            chunksizes = chunks, compress = True, attrs = attrs)
+    schema.add_variable(var_name + '_count', 'i2', nc_var.dimensions, chunksizes = chunks, compress = True,
+                            attrs = {'long_name': 'number of ensemble members with data'})
+
+    tmp_fname = temp_fname(out_fname)
+    if schema.create(tmp_fname) is None:
+        for nc_dset in nc_dsets:
+            nc_dset.close()
+        return None
+
+    out_dset = Dataset(tmp_fname, 'a')
+    try:
+        _ensemble_var(nc_vars, out_dset, var_name, percentiles, ddof, int(max_mb*1024*1024))
+    except (OSError, RuntimeError) as err:
+        print(ERROR_STR + 'computing ensemble statistics of ' + var_name + ' ' + str(err))
+        out_dset.close()
+        for nc_dset in nc_dsets:
+            nc_dset.close()
+        discard_temp(tmp_fname)
+        return None
+
+    out_dset.close()
+    for nc_dset in nc_dsets:
+        nc_dset.close()
+
+    return finalise_output(tmp_fname, out_fname)
+
+def _ensemble_var(nc_vars, out_dset, var_name, percentiles, ddof, max_bytes):
+    """
+    read each block of every member in turn and write the statistics of the block
+    """
+    ntime, nlats, nlons = nc_vars[0].shape
+    nrows, nsteps = _block_plan(nc_vars[0], len(nc_vars), percentiles, max_bytes)
+
+    nblocks = -(-nlats // nrows)*(-(-ntime // nsteps))
+    meter = ProgressMeter('Ensemble statistics of {} from {} members'.format(var_name, len(nc_vars)), nblocks,
+                                                                                        'blocks', check_every = 1)
+    for row_strt, row_end in generate_bands(nlats, nrows):
+        for time_strt in range(0, ntime, nsteps):
+            indx = (slice(time_strt, min(time_strt + nsteps, ntime)), slice(row_strt, row_end), slice(None))
+
+            accum = None
+            members = []
+            for nc_var in nc_vars:
+                with stage('read') as stg:
+                    vals = nc_var[indx]
+                    stg.nbytes = vals.nbytes
+                meter.add_bytes(nread = vals.nbytes)
+
+                with stage('compute'):
+                    if accum is None:
+                        accum = EnsembleAccumulator(vals.shape)
+                    accum.add(vals)
+                    if percentiles:
+                        members.append(vals)
+
+            with stage('compute'):
+                rslts = accum.results(ddof)
+                if percentiles:
+                    rslts.update(member_percentiles(stack(members), percentiles))
+
+            with stage('write') as stg:
+                for stat_name, rslt in rslts.items():
+                    out_dset.variables[var_name + '_' + stat_name][indx] = rslt
+                out_dset.variables[var_name + '_count'][indx] = accum.count
+                stg.nbytes = 4*len(rslts)*accum.count.size
+
+            meter.add_bytes(nwritten = stg.nbytes)
+            meter.tick()
+
+    meter.finish()
+
+    return
+
+def ensemble_scenario(scen_dir, metric, scenario, gcms = GCMS, percentiles = PERCENTILES, max_mb = MAX_MB,
+                                                                                            delete_flag = True):
+    '''
+    ensemble statistics of metric over the GCM products of a scenario, written alongside them
+    '''
+    nc_fnames = gcm_fnames(scen_dir, metric, scenario, gcms)
+    out_fname = join(scen_dir, metric + '_' + scenario + '_' + ENSEMBLE_NAME + YEAR_RANGE + '.nc')
+
+    return ensemble_nc(nc_fnames, metric, out_fname, percentiles, DDOF, max_mb, delete_flag)
+
+def main():
+    '''
+
+    '''
+    parser = ArgumentParser(description='Ensemble statistics of the ECLIPS products of the GCMs of a scenario')
+    parser.add_argument('scen_dir', help='scenario directory holding a product for each GCM')
+    parser.add_argument('metric', help='variable e.g. Tairalign or Precipalign')
+    parser.add_argument('scenario', help='scenario e.g. RCP45')
+    parser.add_argument('--gcms', nargs='+', default=GCMS, help='default is every GCM')
+    parser.add_argument('--percentiles', type=float, nargs='*', default=PERCENTILES)
+    parser.add_argument('--max_mb', type=float, default=MAX_MB, help='memory limit for accumulators and blocks read')
+    args = parser.parse_args()
+
+    percentiles = [int(pcntl) if pcntl == int(pcntl) else pcntl for pcntl in args.percentiles]
+    ensemble_scenario(args.scen_dir, args.metric, args.scenario, args.gcms, percentiles, args.max_mb)
+
+if __name__ == '__main__':
+    main()
@@ -18,9 +18,13 @@ from time import time, strftime
 from netCDF4 import Dataset
 from numpy import arange, float32
 
+from nc_schema_writer import NcSchema
+
 ERROR_STR = '*** Error *** '
 WARNING_STR = '*** Warning *** '
 
+GRAZE_CHUNKS = (64, 1024)       # bands of latitudes
+
 class GrazeNcDefn(object, ):
     '''
     instantiate new dataset based on Jinfeng lat/lon extents
@@ -67,88 +71,48 @@ def create_graze_nc(nc_fname, clone_defn):
     createVariable method has arguments:
                first: variable name, second: datatype, third: tuple with the name(s) of the dimension(s)
     '''
-    try:  # call the Dataset constructor to create file
-        nc_dset = Dataset(nc_fname, 'w', format='NETCDF4_CLASSIC')
-    except PermissionError as err:
-        print(err)
-        return None
-
     try:
         clone_dset = Dataset(clone_defn.nc_fname, 'r')
     except PermissionError as err:
         print(err)
         return None
 
+    missing_value = clone_dset.variables['Band1']._FillValue
+    clone_dset.close()
+
     # create global attributes
     # =======================
     date_stamp = strftime('%H:%M %d-%m-%Y')
-    nc_dset.attribution = 'Created at ' + date_stamp + ' for Spatial Ecosse SuperG grasslands project'
-    nc_dset.history = 'SuperG'
-    nc_dset.dataUsed = 'N added by grazing animals: https://www.fao.org/gleam/resources/en/'
+    schema = NcSchema({'attribution': 'Created at ' + date_stamp + ' for Spatial Ecosse SuperG grasslands project',
+                       'history': 'SuperG', 'dataUsed': 'Data used: from FAO May 2022'})
 
-    # ==========================================================================
-    data_used = 'Data used: from FAO May 2022'
-    nc_dset.dataUsed = data_used
+    resol = clone_defn.resol
 
-    # expand bounding box to make sure all results are included
-    # =========================================================
-    lon_ll, lat_ll, lon_ur, lat_ur = clone_defn.bbox
+    # create dimensions and the lat/lon variables (4 byte float in this case)
+    # =======================================================================
+    schema.add_dimension('lat', clone_defn.nlats)
+    schema.add_dimension('lon', clone_defn.nlons)
 
-    resol = clone_defn.resol
+    schema.add_variable('lat', 'f4', ('lat',), values = clone_defn.lats,
+                        attrs = {'description': 'degrees of latitude North to South in ' + str(resol) + ' degree steps',
+                                 'units': 'degrees_north', 'long_name': 'latitude', 'axis': 'Y'})
+    schema.add_variable('lon', 'f4', ('lon',), values = clone_defn.lons,
+                        attrs = {'description': 'degrees of longitude West to East in ' + str(resol) + ' degree steps',
+                                 'units': 'degrees_east', 'long_name': 'longitude', 'axis': 'X'})
 
-    # create dimensions
-    # =================
-    nc_dset.createDimension('lat', clone_defn.nlats)
-    nc_dset.createDimension('lon', clone_defn.nlons)
-
-    # create the lat/lon variables (4 byte float in this case)
-    # ========================================================
-    lats = nc_dset.createVariable('lat', 'f4', ('lat',))
-    lats.description = 'degrees of latitude North to South in ' + str(resol) + ' degree steps'
-    lats.units = 'degrees_north'
-    lats.long_name = 'latitude'
-    lats.axis = 'Y'
-    lats[:] = clone_defn.lats
-
-    lons = nc_dset.createVariable('lon', 'f4', ('lon',))
-    lons.description = 'degrees of longitude West to East in ' + str(resol) + ' degree steps'
-    lons.units = 'degrees_east'
-    lons.long_name = 'longitude'
-    lons.axis = 'X'
-    lons[:] = clone_defn.lons
-
-    # setup time dimension - asssume daily
-    # ====================================
     mess = 'Number of longitudes: {}\tlatitudes: {}'.format(clone_defn.nlons, clone_defn.nlats)
     print(mess)
-  
-    # Create N deposition, Nmanure and Nmineral variables
-    # ===================================================
+
+    # N produced by each livestock type - written in bands of latitudes
+    # ================================================================
     units = 'kg of N (produced by livestock) per cell'
-    var_name = 'Ncattle'
-    missing_value = clone_dset.variables['Band1']._FillValue
-    ncattle = nc_dset.createVariable(var_name, 'f4', ('lat', 'lon'), fill_value=missing_value)
-    ncattle.long_name = 'cattle'
-    ncattle.units = units
-    ncattle.missing_value = missing_value
-
-    var_name = 'Ngoats'
-    ngoats = nc_dset.createVariable(var_name, 'f4', ('lat', 'lon'), fill_value=missing_value)
-    ngoats.long_name = 'goats'
-    ngoats.units = units
-    ngoats.missing_value = missing_value
-
-    var_name = 'Nsheep'
-    nsheep = nc_dset.createVariable(var_name, 'f4', ('lat', 'lon'), fill_value=missing_value)
-    nsheep.long_name = 'sheep'
-    nsheep.units = units
-    nsheep.missing_value = missing_value
-
-    # close netCDF files
-    # ==================
-    nc_dset.sync()
-    nc_dset.close()
-    clone_dset.close()
+    for var_name, long_name in zip(['Ncattle', 'Ngoats', 'Nsheep'], ['cattle', 'goats', 'sheep']):
+        schema.add_variable(var_name, 'f4', ('lat', 'lon'), fill_value = missing_value, chunksizes = GRAZE_CHUNKS,
+                            compress = True, attrs = {'long_name': long_name, 'units': units,
+                                                                                'missing_value': missing_value})
+
+    if schema.create(nc_fname) is None:
+        return None
 
     print('Created: ' + nc_fname + '\n')
-    return
+    return nc_fname
@@ -18,14 +18,18 @@ from netCDF4 import Dataset
 from glob import glob
 from time import time, strftime
 from numpy import count_nonzero, zeros, int32, float32, float64, arange
-from numpy.ma.core import MaskedConstant, MaskedArray
+from numpy.ma import masked_array, getmaskarray
 
 from locale import format_string, setlocale, LC_ALL
 setlocale(LC_ALL, '')
 
 from grazing_classes import GrazeNcDefn, create_graze_nc
 from shape_funcs import calculate_area
-from spec_utilities import update_progress
+from spec_utilities import ProgressMeter, JobCancelled
+from profiling_fns import stage
+from nc_schema_writer import SlabWriter
+from atomic_output import temp_fname, finalise_output, discard_temp, check_existing_output
+from qa_scan import run_qa
 
 sleepTime = 5
 
@@ -49,8 +53,7 @@ def _create_grid_cell_area_array(graze_nc, clone_defn):
     nlons = len(lons)
 
     arr_tmp = arange(nlats*nlons)
-    areas = arr_tmp.reshape(nlats, nlons)
-    areas.dtype = float32
+    areas = arr_tmp.reshape(nlats, nlons).astype(float32)     # assigning dtype would reinterpret the int64 bytes
 
     resol_d2 = clone_defn.resol_d2
 
@@ -65,74 +68,81 @@ def _create_grid_cell_area_array(graze_nc, clone_defn):
         areas[lat_indx, :] = nlons*[area]       # fill longitudes for each latitude with same area
         tmp = areas[lat_indx, :10]              # for debugging
 
+    graze_dset.close()
+
     return areas
 
 def _integrate_grazing_dsets(lvstck_nc_fn, graze_ncs, areas):
     '''
-    laboriously step through each cell
+    read each latitude row of each grazing dataset in one call, convert to N per hectare and write by bands
     '''
     try:  # call the Dataset constructor
-        lvstck_dset = Dataset(lvstck_nc_fn, 'a')
+        with stage('open'):
+            lvstck_dset = Dataset(lvstck_nc_fn, 'a')
     except PermissionError as err:
         print(err)
         return None
 
-    for graze_nc in graze_ncs:
-        graze_dset = Dataset(graze_nc, 'r')
-
-        data = graze_dset.variables['Band1']
-        nlats = graze_dset.variables['lat'].size
-        nlons = graze_dset.variables['lon'].size
-
-        root_name = splitext(split(graze_nc)[1])[0]
-        anml_type = root_name.split('_')[-1]
-        var_name = 'N' + anml_type
-        print('\nProcessing ' + var_name)
-
-        last_time = time()
-        nvalid = 0
-        nmask = 0
-        nunknwn = 0
-        nsize_grid = nlons*nlats
-
-        for lat_indx in range(nlats):
-
-            for lon_indx in range(nlons):
-                val = data[lat_indx, lon_indx]
-
-                if isinstance(val, MaskedConstant):
-                    lvstck_dset.variables[var_name][lat_indx, lon_indx] = val
-                    nmask += 1
-
-                elif isinstance(val, MaskedArray):      # used isinstance(val, float32) for 1.4.2 of netCDF4 module
-                    nkg_ha_ma = val / areas[lat_indx, lon_indx]  # N per hectare
-                    nkg_ha = nkg_ha_ma.item()
-
-                    lvstck_dset.variables[var_name][lat_indx, lon_indx] = nkg_ha
-                    nvalid += 1
-
-                else:
-                    if nunknwn == 0:
-                        print(ERROR_STR + 'unknown data type: {} at lat/lon: {} {}'.format(type(val), lat_indx, lon_indx))
-
-                    nunknwn += 1
-
-                last_time = update_progress(last_time, nvalid, nmask, nunknwn, nsize_grid)
+    # datasets are closed however integration ends, including cancellation of a job from the GUI
+    # ==========================================================================================
+    try:
+        for graze_nc in graze_ncs:
+            with stage('open'):
+                graze_dset = Dataset(graze_nc, 'r')
 
-            lat_indx += 1
-
-        graze_dset.close()
-
-    lvstck_dset.sync()
-    lvstck_dset.close()
+            try:
+                data = graze_dset.variables['Band1']
+                nlats = graze_dset.variables['lat'].size
+                nlons = graze_dset.variables['lon'].size
+
+                root_name = splitext(split(graze_nc)[1])[0]
+                anml_type = root_name.split('_')[-1]
+                var_name = 'N' + anml_type
+                print('\nProcessing ' + var_name)
+
+                nvalid = 0
+                nmask = 0
+                nsize_grid = nlons*nlats
+                meter = ProgressMeter('Processing ' + var_name, nsize_grid)
+                writer = SlabWriter(lvstck_dset.variables[var_name], axis = 0)
+
+                for lat_indx in range(nlats):
+
+                    # one read per latitude row, masked cells remain masked
+                    # =====================================================
+                    with stage('read') as stg:
+                        row_vals = masked_array(data[lat_indx, :])
+                        stg.nbytes = row_vals.nbytes
+
+                    with stage('compute'):
+                        nkg_ha = row_vals / areas[lat_indx, :]      # N per hectare
+                        writer.write_rows(lat_indx, nkg_ha.reshape(1, nlons))
+
+                    nrow_mask = int(count_nonzero(getmaskarray(row_vals)))
+                    nmask += nrow_mask
+                    nvalid += nlons - nrow_mask
+                    meter.tick(nlons)
+
+                # writer holds the final band of latitudes
+                # ========================================
+                writer.close()
+
+                meter.counters = {'valid': nvalid, 'masked': nmask}
+                meter.finish()
+            finally:
+                graze_dset.close()
+
+        lvstck_dset.sync()
+    finally:
+        lvstck_dset.close()
 
     print('\nWrote ' + lvstck_nc_fn)
 
-    return
+    return True
 
 def integrate_grazing_dsets(form):
     """
-
+    returns True if the livestock dataset was built or an existing one kept, otherwise None
     """
     graze_dir = form.w_lbl_fertdir.text()
     delete_flag = form.w_del_nc.isChecked()
@@ -140,29 +150,40 @@ def integrate_grazing_dsets(form):
     # check new file name and remove if necessary
     # ===========================================
     lvstck_nc_fn = join(graze_dir, GRAZE_FN + 'livestock.nc')
-    if isfile(lvstck_nc_fn):
-        if delete_flag:
-            try:
-                remove(lvstck_nc_fn)
-            except PermissionError as err:
-                print(err)
-                return None
-
-            print('Deleted: ' + lvstck_nc_fn)
-        else:
-            print(WARNING_STR + 'NC file: ' + lvstck_nc_fn + ' already exists')
-            return None
+    build_flag = check_existing_output(lvstck_nc_fn, delete_flag)
+    if not build_flag:
+        return True if build_flag is False else None
 
     # ====================================
     graze_ncs = glob(graze_dir + '\\' + GRAZE_FN + '*.nc')
     if lvstck_nc_fn in graze_ncs:
-        del(graze_ncs[lvstck_nc_fn])
+        graze_ncs.remove(lvstck_nc_fn)
+    if len(graze_ncs) == 0:
+        print(ERROR_STR + 'no ' + GRAZE_FN + '*.nc files in ' + graze_dir)
+        return None
 
     clone_defn = GrazeNcDefn(graze_ncs[-1])
 
-    create_graze_nc(lvstck_nc_fn, clone_defn)
+    # build in a temporary file which is renamed when complete
+    # ========================================================
+    tmp_fn = temp_fname(lvstck_nc_fn)
+    if create_graze_nc(tmp_fn, clone_defn) is None:
+        discard_temp(tmp_fn)
+        return None
+
     areas = _create_grid_cell_area_array(graze_ncs[0], clone_defn)
-    _integrate_grazing_dsets(lvstck_nc_fn, graze_ncs, areas)
+    try:
+        integrated = _integrate_grazing_dsets(tmp_fn, graze_ncs, areas)
+    except JobCancelled:
+        discard_temp(tmp_fn)
+        raise
+
+    if integrated is None:
+        discard_temp(tmp_fn)
+        return None
+
+    finalise_output(tmp_fn, lvstck_nc_fn)
+    run_qa(form.settings, [lvstck_nc_fn])
 
-    return
+    return True
 
@@ -0,0 +1,81 @@
+#-------------------------------------------------------------------------------
+# Name:        gui_workers.py
+# Purpose:     run long operations away from the Qt event loop and report structured progress
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Description: each operation is a QRunnable queued on a QThreadPool; progress reported by ProgressMeter
+#              is forwarded as a signal carrying completed, remaining, throughput and ETA
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+__prog__ = 'gui_workers.py'
+__version__ = '0.0.0'
+__author__ = 's03mm5'
+
+from threading import Event
+from time import time
+
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+
+from spec_utilities import set_progress_hook, JobCancelled
+from NetCdfUtilsBatch import run_job
+
+ERROR_STR = '*** Error *** '
+
+class WorkerSignals(QObject):
+    '''
+    signals must belong to a QObject, QRunnable is not one
+    '''
+    started = pyqtSignal(str)
+    progress = pyqtSignal(dict)
+    finished = pyqtSignal(str, bool, float)     # description, success flag, elapsed seconds
+
+class JobWorker(QRunnable):
+    '''
+    runs one job, snapshotted from the form when queued, in a thread of the pool
+    '''
+    def __init__(self, job, form):
+        """
+        job is as for NetCdfUtilsBatch.run_job
+        """
+        super(JobWorker, self).__init__()
+        self.job = job
+        self.form = form
+        self.signals = WorkerSignals()
+        self.cancel_event = Event()
+        self.strt_time = None
+
+    def cancel(self):
+        """
+        takes effect the next time the job reports progress or, for a job waiting on a process pool, within
+        spec_utilities.POLL_SECS
+        """
+        self.cancel_event.set()
+
+    def _report(self, prgrss):
+        """
+        progress hook called from the worker thread with the ProgressMeter report dictionary
+        raises JobCancelled when cancellation has been requested
+        """
+        if self.cancel_event.is_set():
+            raise JobCancelled('cancelled by user')
+
+        self.signals.progress.emit(prgrss)
+
+    def run(self):
+        """
+        executed in a pool thread
+        """
+        self.strt_time = time()
+        self.signals.started.emit(self.job['operation'])
+        set_progress_hook(self._report, self.cancel_event.is_set)
+        try:
+            descr, ret_code, elapsed = run_job(self.job, self.form)
+        except JobCancelled as err:
+            print('\nJob ' + self.job['operation'] + ' ' + str(err))
+            descr, ret_code, elapsed = self.job['operation'], False, time() - self.strt_time
+        finally:
+            set_progress_hook(None)
+
+        self.signals.finished.emit(descr, ret_code, elapsed)
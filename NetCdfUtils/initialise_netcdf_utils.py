@@ -20,6 +20,7 @@ import json
 from glob import glob
 from time import sleep
 from set_up_logging import set_up_logging
+from spec_utilities import configure_progress
 
 sleepTime = 5
 APPLIC_STR = 'netcdf_utils'
@@ -36,6 +37,10 @@ def initiation(form):
     form.settings['config_file'] = normpath(form.settings['config_dir'] + '/' + APPLIC_STR + '_config.json')
     set_up_logging(form, APPLIC_STR)
 
+    # progress reports go to the log and, if the optional metrics_fname setting is present, a JSON lines file
+    # =======================================================================================================
+    configure_progress(form.lgr, form.settings.get('metrics_fname'))
+
     return
 
 def _read_setup_file():
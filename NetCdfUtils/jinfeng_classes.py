@@ -18,9 +18,13 @@ from time import time, strftime
 from netCDF4 import Dataset
 from numpy import arange, nan as NaN
 
+from nc_schema_writer import NcSchema
+
 ERROR_STR = '*** Error *** '
 WARNING_STR = '*** Warning *** '
 
+FERT_CHUNKS = (1, 64, 1024)     # one year of a band of latitudes
+
 class NcFileDefn(object, ):
     '''
     instantiate new dataset based on Jinfeng lat/lon extents
@@ -66,12 +70,6 @@ def create_fert_nc(nc_fname, clone_defn, strt_year, nyears):
     createVariable method has arguments:
                first: variable name, second: datatype, third: tuple with the name(s) of the dimension(s)
     '''
-    try:  # call the Dataset constructor to create file
-        nc_dset = Dataset(nc_fname, 'w', format='NETCDF4_CLASSIC')
-    except PermissionError as err:
-        print(err)
-        return None
-
     try:
         clone_dset = Dataset(clone_defn.nc_fname, 'r')
     except PermissionError as err:
@@ -81,79 +79,45 @@ def create_fert_nc(nc_fname, clone_defn, strt_year, nyears):
     # create global attributes
     # =======================
     date_stamp = strftime('%H:%M %d-%m-%Y')
-    nc_dset.attribution = 'Created at ' + date_stamp + ' for Spatial Ecosse SuperG grasslands project'
-    nc_dset.history = 'SuperG'
-    nc_dset.dataUsed = 'Jinfeng'
+    schema = NcSchema({'attribution': 'Created at ' + date_stamp + ' for Spatial Ecosse SuperG grasslands project',
+                       'history': 'SuperG', 'dataUsed': 'Data used: from Jinfeng May 2022'})
 
-    # ==========================================================================
-    data_used = 'Data used: from Jinfeng May 2022'
-    nc_dset.dataUsed = data_used
+    resol = clone_defn.resol
 
-    # expand bounding box to make sure all results are included
-    # =========================================================
-    lon_ll, lat_ll, lon_ur, lat_ur = clone_defn.bbox
+    # create dimensions and the lat/lon variables (4 byte float in this case)
+    # =======================================================================
+    schema.add_dimension('lat', clone_defn.nlats)
+    schema.add_dimension('lon', clone_defn.nlons)
+    schema.add_dimension('time', nyears)
 
-    resol = clone_defn.resol
+    schema.add_variable('lat', 'f4', ('lat',), values = clone_defn.lats,
+                        attrs = {'description': 'degrees of latitude North to South in ' + str(resol) + ' degree steps',
+                                 'units': 'degrees_north', 'long_name': 'latitude', 'axis': 'Y'})
+    schema.add_variable('lon', 'f4', ('lon',), values = clone_defn.lons,
+                        attrs = {'description': 'degrees of longitude West to East in ' + str(resol) + ' degree steps',
+                                 'units': 'degrees_east', 'long_name': 'longitude', 'axis': 'X'})
 
-    # create dimensions
-    # =================
-    nc_dset.createDimension('lat', clone_defn.nlats)
-    nc_dset.createDimension('lon', clone_defn.nlons)
-    nc_dset.createDimension('time', nyears)
-
-    # create the lat/lon variables (4 byte float in this case)
-    # ========================================================
-    lats = nc_dset.createVariable('lat', 'f4', ('lat',))
-    lats.description = 'degrees of latitude North to South in ' + str(resol) + ' degree steps'
-    lats.units = 'degrees_north'
-    lats.long_name = 'latitude'
-    lats.axis = 'Y'
-    lats[:] = clone_defn.lats
-
-    lons = nc_dset.createVariable('lon', 'f4', ('lon',))
-    lons.description = 'degrees of longitude West to East in ' + str(resol) + ' degree steps'
-    lons.units = 'degrees_east'
-    lons.long_name = 'longitude'
-    lons.axis = 'X'
-    lons[:] = clone_defn.lons
-
-    # setup time dimension - asssume daily
-    # ====================================
     mess = 'Number of longitudes: {}\tlatitudes: {}\tyears: {}'.format(clone_defn.nlons, clone_defn.nlats, nyears)
     print(mess)
 
-    times = nc_dset.createVariable('time', 'i4', ('time',))
-    times.units = 'year'
-    times.calendar = 'standard'
-    times.axis = 'T'
-    times[:] = arange(strt_year, strt_year + nyears)
-
-    # Create N deposition, Nmanure and Nmineral variables
-    # ===================================================
-    var_name = 'Ndep'
-    missing_value = clone_dset.variables[var_name].missing_value
-    ndep = nc_dset.createVariable(var_name, 'f4', ('time', 'lat', 'lon'), fill_value=missing_value)
-    ndep.long_name = 'Oxidised nitrogen'
-    ndep.units = clone_dset.variables[var_name].units
-    ndep.missing_value = NaN
-
-    var_name = 'Nmanure'
-    nmanure = nc_dset.createVariable(var_name, 'f4', ('time', 'lat', 'lon'), fill_value=missing_value)
-    nmanure.long_name = 'manure'
-    nmanure.units = clone_dset.variables[var_name].units
-    ndep.missing_value = NaN    # previous: nmanure.missing_value = clone_dset.variables[var_name].missing_value
-
-    var_name = 'Nmineral'
-    nmineral = nc_dset.createVariable(var_name, 'f4', ('time', 'lat', 'lon'), fill_value=missing_value)
-    nmineral.long_name = 'synthetic fertiliser'
-    nmineral.units = clone_dset.variables[var_name].units
-    ndep.missing_value = NaN
-
-    # close netCDF files
-    # ==================
-    nc_dset.sync()
-    nc_dset.close()
+    schema.add_variable('time', 'i4', ('time',), values = arange(strt_year, strt_year + nyears),
+                        attrs = {'units': 'year', 'calendar': 'standard', 'axis': 'T'})
+
+    # N deposition, Nmanure and Nmineral variables are written a year at a time and scanned in bands of latitudes
+    # ==========================================================================================================
+    missing_value = clone_dset.variables['Ndep'].missing_value
+    for var_name, long_name in zip(['Ndep', 'Nmanure', 'Nmineral'], ['Oxidised nitrogen', 'manure',
+                                                                                        'synthetic fertiliser']):
+        attrs = {'long_name': long_name, 'units': clone_dset.variables[var_name].units}
+        if var_name == 'Ndep':
+            attrs['missing_value'] = NaN
+
+        schema.add_variable(var_name, 'f4', ('time', 'lat', 'lon'), fill_value = missing_value,
+                                        chunksizes = FERT_CHUNKS, compress = True, attrs = attrs)
     clone_dset.close()
 
+    if schema.create(nc_fname) is None:
+        return None
+
     print('Created: ' + nc_fname + '\n')
-    return
+    return nc_fname
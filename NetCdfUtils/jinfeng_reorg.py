@@ -14,16 +14,24 @@ __author__ = 's03mm5'
 
 from os.path import join, isfile, isdir, split, splitext, normpath
 from os import mkdir, remove
+from multiprocessing import Pool
 from netCDF4 import Dataset
 from glob import glob
 from time import time, strftime
-from numpy import any, array, nan as NaN
+from numpy import count_nonzero, nan as NaN
+from numpy.ma import masked_array
 
 from locale import format_string, setlocale, LC_ALL
 setlocale(LC_ALL, '')
 
-from spec_utilities import update_progress_post, update_progress2
+from spec_utilities import ProgressMeter, JobCancelled, pool_map
 from jinfeng_classes import NcFileDefn, create_fert_nc
+from profiling_fns import stage
+from nc_schema_writer import SlabWriter
+from chunk_fns import generate_bands
+from atomic_output import temp_fname, finalise_output, discard_temp, check_existing_output
+from zarr_backend import open_dataset, is_zarr, backend_fname, ZARR_EXT, OUTPUT_BACKEND, BACKEND_NPROCS
+from qa_scan import run_qa
 
 sleepTime = 5
 
@@ -32,96 +40,173 @@ HECTARES_TO_M2 = 0.0001
 ERROR_STR = '*** Error *** '
 WARNING_STR = '*** Warning *** '
 
-def _concatenate_fert_files(nc_fname, fert_ncs):
-    '''
+def _copy_fert_year(all_dset, tstep, fert_nc):
+    """
+    copy the variables of one annual file to time step tstep
+    """
+    with stage('open'):
+        read_dset = Dataset(fert_nc, 'r')
+
+    for var_name in list(['Ndep', 'Nmanure', 'Nmineral']):
+        with stage('read') as stg:
+            vals = read_dset.variables[var_name][:, :, :, :]
+            stg.nbytes = vals.nbytes
+
+        with stage('write') as stg:
+            all_dset.variables[var_name][tstep, :, :] = vals
+            stg.nbytes = vals.nbytes
+
+    read_dset.close()
 
+def _fert_year_worker(task):
+    """
+    each worker writes whole time steps, and therefore separate chunks, of the store - no lock is needed
+    returns False if the annual file could not be copied
+    """
+    nc_fname, tstep, fert_nc = task
+    try:
+        all_dset = open_dataset(nc_fname, 'a')
+        _copy_fert_year(all_dset, tstep, fert_nc)
+        all_dset.close()
+    except (OSError, RuntimeError, KeyError, ValueError) as err:
+        print(ERROR_STR + 'copying ' + fert_nc + ' to ' + nc_fname + ' ' + str(err))
+        return False
+
+    return True
+
+def _concatenate_fert_files(nc_fname, fert_ncs, nprocs = 1):
+    '''
+    nc_fname may be a Zarr store in which case annual files are copied by nprocs worker processes
     '''
     try:  # call the Dataset constructor
-        all_dset = Dataset(nc_fname, 'a')
+        with stage('open'):
+            all_dset = open_dataset(nc_fname, 'a')
     except PermissionError as err:
         print(err)
         return None
 
-    nlats = len(all_dset.dimensions['lat'])
-    nlons = len(all_dset.dimensions['lon'])
-    nsize_grid = nlats*nlons
-
-    strt_time = time()
-    last_time = time()
-    nmasked = 0
-    nout_of_area = 0
-    nwarns = 0
-    nvalid = 0
-    for tstep, fert_nc in enumerate(fert_ncs):
-        read_dset = Dataset(fert_nc, 'r')
-
-        for var_name in list(['Ndep', 'Nmanure', 'Nmineral']):
-            all_dset.variables[var_name][tstep, :, :] =  read_dset.variables[var_name][:, :, :, :]
-
-        read_dset.close()
-        last_time = update_progress_post(last_time, strt_time, nvalid, nsize_grid, nout_of_area, nmasked, nwarns)
-
-    identify_zero_cells = True
-    if identify_zero_cells:
-
-        # stanza to identify all zero cells
-        # =================================
-        ntsteps = len(all_dset.dimensions['time'])
-        nan_slice = array(ntsteps * [NaN])
-
-        for var_name in list(['Ndep', 'Nmanure', 'Nmineral']):
-            print('\nProcessing variable: ' + var_name)
-            nzeros = 0
-            ndata = 0
-
-            for lat_indx in range(nlats):
-                for lon_indx in range(nlons):
-                    vals = all_dset.variables[var_name][:, lat_indx, lon_indx]
-                    if any(vals):
-                        ndata += 1
-                    else:
-                        nzeros += 1
-                        all_dset.variables[var_name][:, lat_indx, lon_indx] = nan_slice
-
-                    last_time = update_progress2(last_time, ndata, nzeros, nsize_grid)
-
-            print('\nVariable: ' + var_name + '\tdata points with data: {}\twithout data: {}'.format(ndata, nzeros))
-
-    all_dset.sync()
-    all_dset.close()
-
-    return
+    # dataset is closed however concatenation ends, including cancellation of a job from the GUI
+    # ==========================================================================================
+    try:
+        nlats = len(all_dset.dimensions['lat'])
+        nlons = len(all_dset.dimensions['lon'])
+        nsize_grid = nlats*nlons
+
+        if is_zarr(nc_fname) and nprocs > 1:
+            print('Concatenating {} annual files using {} processes'.format(len(fert_ncs), nprocs))
+            tasks = [(nc_fname, tstep, fert_nc) for tstep, fert_nc in enumerate(fert_ncs)]
+            with Pool(processes = nprocs) as pool:
+                rslts = pool_map(pool, _fert_year_worker, tasks)
+            if not all(rslts):
+                return None
+        else:
+            meter = ProgressMeter('Concatenating annual files', len(fert_ncs), unit = 'files', check_every = 1)
+            for tstep, fert_nc in enumerate(fert_ncs):
+                _copy_fert_year(all_dset, tstep, fert_nc)
+                meter.tick()
+
+            meter.finish()
+
+        identify_zero_cells = True
+        if identify_zero_cells:
+
+            # stanza to identify all zero cells - processed in bands of latitudes which are written in one call
+            # ==================================================================================================
+            for var_name in list(['Ndep', 'Nmanure', 'Nmineral']):
+                print('\nProcessing variable: ' + var_name)
+                nzeros = 0
+                ndata = 0
+                meter = ProgressMeter('Identifying zero cells of ' + var_name, nsize_grid, check_every = 1)
+                nc_var = all_dset.variables[var_name]
+                writer = SlabWriter(nc_var, axis = 1, lead = (slice(None),))
+
+                for row_strt, row_end in generate_bands(nlats, writer.nrows):
+                    with stage('read') as stg:
+                        vals = nc_var[:, row_strt:row_end, :]
+                        stg.nbytes = vals.nbytes
+
+                    with stage('compute'):
+                        vals = masked_array(vals)
+                        has_data = vals.filled(0).any(axis=0)
+                        vals[:, ~has_data] = NaN
+                        nzeros_band = int(count_nonzero(~has_data))
+
+                    with stage('write') as stg:
+                        writer.write_rows(row_strt, vals)
+                        stg.nbytes = vals.nbytes
+
+                    nzeros += nzeros_band
+                    ndata += has_data.size - nzeros_band
+                    meter.tick(has_data.size)
+
+                with stage('write'):
+                    writer.close()
+
+                meter.counters = {'with data': ndata, 'no data': nzeros}
+                meter.finish()
+                print('\nVariable: ' + var_name + '\tdata points with data: {}\twithout data: {}'.format(ndata, nzeros))
+
+        all_dset.sync()
+
+        return True
+    finally:
+        all_dset.close()
 
 def concat_jinfeng_dsets(form):
     """
-
+    returns True if the concatenated dataset was built or an existing one kept, otherwise None
     """
     fert_dir = form.w_lbl_fertdir.text()
     delete_flag = form.w_del_nc.isChecked()
+    backend = form.settings.get('output_backend', OUTPUT_BACKEND)
+    nprocs = form.settings.get('backend_nprocs', BACKEND_NPROCS)
 
-    retcode = _sort_fname_and_start_year(fert_dir, delete_flag)
-    if retcode is None:
-        return
+    retcode = _sort_fname_and_start_year(fert_dir, delete_flag, backend)
+    if not retcode:
+        return True if retcode is False else None
 
     nc_fname, strt_year, nyears, fert_ncs = retcode
 
+    # build in a temporary file which is renamed when complete
+    # ========================================================
+    tmp_fn = temp_fname(nc_fname)
+    if is_zarr(nc_fname):
+        tmp_fn += ZARR_EXT
     clone_defn = NcFileDefn(fert_ncs[-1])
-    create_fert_nc(nc_fname, clone_defn, strt_year, nyears)
+    try:
+        build_flag = create_fert_nc(tmp_fn, clone_defn, strt_year, nyears) is not None and \
+                                                    _concatenate_fert_files(tmp_fn, fert_ncs, nprocs) is not None
+    except (OSError, RuntimeError, KeyError, ValueError) as err:
+        print(ERROR_STR + 'building ' + nc_fname + ' ' + str(err))
+        build_flag = False
+    except JobCancelled:
+        discard_temp(tmp_fn)
+        raise
+
+    if not build_flag:
+        discard_temp(tmp_fn)
+        return None
 
-    _concatenate_fert_files(nc_fname, fert_ncs)
+    finalise_output(tmp_fn, nc_fname)
+    run_qa(form.settings, [nc_fname])
 
-    return
+    return True
 
-def _sort_fname_and_start_year(fert_dir, delete_flag):
+def _sort_fname_and_start_year(fert_dir, delete_flag, backend = OUTPUT_BACKEND):
     '''
-    gather detail and file name for new NC file
+    gather detail and file name for new NC file, or Zarr store if backend is zarr
+    returns False if an existing output is to be kept and None if there is nothing to build from
     '''
     out_dir = join(fert_dir, 'concat_dset')     # prepare directory
     if not isdir(out_dir):
         mkdir(out_dir)
 
     fert_ncs = glob(fert_dir + '*/era*.nc')     # gather existing Nmanure and Nmineral NC files
+    fert_ncs = [fert_nc for fert_nc in fert_ncs if normpath(split(fert_nc)[0]) != normpath(out_dir)]
     nyears = len(fert_ncs)
+    if nyears == 0:
+        print(ERROR_STR + 'no era*.nc files in the subdirectories of ' + fert_dir)
+        return None
 
     # take arbritary file name and construct new file name
     # ====================================================
@@ -130,21 +215,12 @@ def _sort_fname_and_start_year(fert_dir, delete_flag):
     root_name = splitext(short_fn)[0]
     fn_lst = root_name.split('_')
     strt_year = int(fn_lst[-1])
-    nc_fname = join(out_dir, '_'.join(fn_lst[:-1]) + '.nc')
-
-    # check new file name and remove if necessary
-    # ===========================================
-    if isfile(nc_fname):
-        if delete_flag:
-            try:
-                remove(nc_fname)
-            except PermissionError as err:
-                print(err)
-                return None
+    nc_fname = backend_fname(join(out_dir, '_'.join(fn_lst[:-1]) + '.nc'), backend)
 
-            print('Deleted: ' + nc_fname)
-        else:
-            print(WARNING_STR + 'NC file: ' + nc_fname + ' already exists')
-            return None
+    # check new file name and remove if necessary - incomplete files are always removed
+    # =================================================================================
+    build_flag = check_existing_output(nc_fname, delete_flag)
+    if not build_flag:
+        return build_flag
 
     return (nc_fname, strt_year, nyears, fert_ncs)
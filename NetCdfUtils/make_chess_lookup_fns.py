@@ -15,14 +15,19 @@ from os.path import isdir, split, exists, join, isfile, splitext
 from time import time
 from math import sqrt
 from pandas import read_csv, DataFrame
+from numpy import abs as np_abs, arange, asarray, float64, full, int64, median, rint, flatnonzero
 
 from locale import setlocale, format_string, LC_ALL
 setlocale(LC_ALL, '')
 
-from spec_utilities import update_progress
+from spec_utilities import ProgressMeter
+from osgb_fns import wgs84_to_osgb
 
 MAX_VALS   = 500000
 READ_FLAG = True
+LOOKUP_MODE = 'osgb'    # osgb: cell indices computed from eastings and northings, search: nearest cell by search
+CHESS_RESOL = 1000.0    # metres
+EDGE_TOL = 0.05         # fraction of a cell within which a point is checked against neighbouring cells
 
 METEO_FN = 'E:\\CHESS_data_monthly\\miscanfor\\meteo_lat_lon_osgb.csv'
 AOI_FN = 'E:\\GlobalEcosseData\\Hwsd_CSVs\\UK\\vault\\Wales_hwsd.csv'
@@ -56,7 +61,7 @@ def _make_lookup_table_from_meteogrid_csv(meteogrid_df):
     nmask = 0
     nunknwn = 0
     num_vals = 0
-    last_time = time()
+    meter = ProgressMeter('Finding nearest CHESS cells', num_total, unit = 'points')
 
     lats = []
     lons = []
@@ -83,13 +88,14 @@ def _make_lookup_table_from_meteogrid_csv(meteogrid_df):
         nrthing = meteogrid_df['northing'][rec_id_nrst]
         nrthings.append(nrthing)
 
-        last_time = update_progress(last_time, num_vals, nmask, nunknwn, num_total)
+        meter.tick()
 
         num_vals += 1
         if num_vals > MAX_VALS:
             print('\nnumber of vals: {}\texceeds requested: {}'.format(num_vals, MAX_VALS))
             break
 
+    meter.finish()
     mappings_df['lat'] = lats
     mappings_df['lon'] = lons
     mappings_df['northing'] = [int(nrthng) for nrthng in nrthings]
@@ -100,16 +106,124 @@ def _make_lookup_table_from_meteogrid_csv(meteogrid_df):
     #mreturn mappings_df.sort_values(by=['lat', 'lon'], ascending=[False, True])
     return mappings_df
 
-def make_chess_lookup_table(form):
+class ChessGrid(object, ):
+    '''
+    regular OSGB grid of the CHESS cells listed in the meteogrid CSV: origin and resolution are derived from the
+    eastings, northings and indices of the listed cells, and each index pair is mapped to its CSV record
+    '''
+    def __init__(self, meteogrid_df, resol = CHESS_RESOL):
+        """
+
+        """
+        self.resol = resol
+        self.xindx = meteogrid_df['xindx'].values.astype(int64)
+        self.yindx = meteogrid_df['yindx'].values.astype(int64)
+        self.eastings = meteogrid_df['easting'].values.astype(float64)
+        self.northings = meteogrid_df['northing'].values.astype(float64)
+        self.cell_lats = meteogrid_df['cell_lat'].values.astype(float64)
+        self.cell_lons = meteogrid_df['cell_lon'].values.astype(float64)
+
+        # eastings and northings of cell (0, 0) - every cell should agree to within a metre
+        # =================================================================================
+        self.x0 = float(median(self.eastings - self.xindx*resol))
+        self.y0 = float(median(self.northings - self.yindx*resol))
+        nirregular = int(((np_abs(self.eastings - self.xindx*resol - self.x0) > 1.0) |
+                          (np_abs(self.northings - self.yindx*resol - self.y0) > 1.0)).sum())
+        if nirregular > 0:
+            print(ERROR_STR + '{} cells of {} are not on a regular {} m grid'.format(nirregular, METEO_FN, resol))
+
+        self.nx = int(self.xindx.max()) + 1
+        self.ny = int(self.yindx.max()) + 1
+        self.recids = full((self.ny, self.nx), -1, dtype=int64)
+        self.recids[self.yindx, self.xindx] = arange(len(self.xindx))
+
+    def record_ids(self, xindx, yindx):
+        """
+        CSV record of each index pair or -1 if the cell is outside the grid or not listed
+        """
+        inside = (xindx >= 0) & (xindx < self.nx) & (yindx >= 0) & (yindx < self.ny)
+        recids = full(len(xindx), -1, dtype=int64)
+        recids[inside] = self.recids[yindx[inside], xindx[inside]]
+
+        return recids
+
+    def nearest_by_search(self, lat, lon, recids = None):
+        """
+        record of the nearest cell in latitude and longitude, as _make_lookup_table_from_meteogrid_csv finds it,
+        among recids or, if None, every cell
+        """
+        if recids is None:
+            dists = (lat - self.cell_lats)**2 + (lon - self.cell_lons)**2
+            return int(dists.argmin())
+
+        dists = (lat - self.cell_lats[recids])**2 + (lon - self.cell_lons[recids])**2
+        return int(recids[dists.argmin()])
+
+def _make_lookup_table_from_osgb(chess_grid, use_pyproj = True):
+    """
+    cell indices of each AOI point computed from its easting and northing; points near a cell edge, where the
+    transformation error or the differing metric of the search could give another cell, are resolved by
+    searching the neighbouring cells and points in cells which are not listed by searching every cell
     """
+    aoi_df = read_csv(AOI_FN, sep=',', names=AOI_HEADERS)
+    num_total = len(aoi_df)
+    print('\nAOI HWSD file has {} records'.format(num_total))
+    meter = ProgressMeter('Computing CHESS cells from OSGB coordinates', num_total, unit = 'points')
+
+    lats = aoi_df['lat'].values.astype(float64)
+    lons = aoi_df['lon'].values.astype(float64)
+    eastings, nrthings = wgs84_to_osgb(lats, lons, use_pyproj)
+
+    xfrac = (asarray(eastings) - chess_grid.x0)/chess_grid.resol
+    yfrac = (asarray(nrthings) - chess_grid.y0)/chess_grid.resol
+    xindx = rint(xfrac).astype(int64)
+    yindx = rint(yfrac).astype(int64)
+    recids = chess_grid.record_ids(xindx, yindx)
+    edge = (np_abs(xfrac - xindx) > 0.5 - EDGE_TOL) | (np_abs(yfrac - yindx) > 0.5 - EDGE_TOL) | (recids < 0)
+    meter.tick(num_total - int(edge.sum()))
+
+    # edge cases: the 3 x 3 neighbourhood or, if the cell itself is not listed, every cell
+    # =====================================================================================
+    nsearched = 0
+    offsets = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+    for pnt in flatnonzero(edge):
+        if recids[pnt] < 0:
+            recids[pnt] = chess_grid.nearest_by_search(lats[pnt], lons[pnt])
+            nsearched += 1
+        else:
+            nghbrs = chess_grid.record_ids(asarray([xindx[pnt] + dx for dx, dy in offsets]),
+                                           asarray([yindx[pnt] + dy for dx, dy in offsets]))
+            recids[pnt] = chess_grid.nearest_by_search(lats[pnt], lons[pnt], nghbrs[nghbrs >= 0])
+        meter.tick()
+
+    meter.counters = {'computed': num_total - int(edge.sum()), 'edge checked': int(edge.sum()) - nsearched,
+                                                                                        'searched': nsearched}
+    meter.finish()
+
+    mappings_df = DataFrame()
+    mappings_df['lat'] = lats
+    mappings_df['lon'] = lons
+    mappings_df['northing'] = chess_grid.northings[recids].astype(int64)
+    mappings_df['easting'] = chess_grid.eastings[recids].astype(int64)
+    mappings_df['yindx'] = chess_grid.yindx[recids]
+    mappings_df['xindx'] = chess_grid.xindx[recids]
+
+    return mappings_df
 
+def make_chess_lookup_table(form):
+    """
+    the chess_lookup_mode setting selects computation from OSGB coordinates, the default, or search
+    returns True once the lookup table is written, otherwise None
     """
+    lookup_mode = form.settings.get('chess_lookup_mode', LOOKUP_MODE)
 
     # =======================================
     meteogrid_df = read_csv(METEO_FN, sep=',')
-    meteogrid_df['point'] = [(lat, lon) for lat, lon in zip(meteogrid_df['cell_lat'], meteogrid_df['cell_lon'])]
-
-    mppngs_df = _make_lookup_table_from_meteogrid_csv(meteogrid_df)
+    if lookup_mode == 'osgb':
+        mppngs_df = _make_lookup_table_from_osgb(ChessGrid(meteogrid_df))
+    else:
+        meteogrid_df['point'] = [(lat, lon) for lat, lon in zip(meteogrid_df['cell_lat'], meteogrid_df['cell_lon'])]
+        mppngs_df = _make_lookup_table_from_meteogrid_csv(meteogrid_df)
 
     root_dir, short_fn = split(AOI_FN)
     root_name, dummy = splitext(short_fn)
@@ -122,5 +236,6 @@ def make_chess_lookup_table(form):
 
     except PermissionError as err:
         print('Could not create ' + aoi_mppngs_fn + ' due to: ' + str(err))
+        return None
 
-    return
+    return True
@@ -0,0 +1,111 @@
+#-------------------------------------------------------------------------------
+# Name:        monthly_aggregation.py
+# Purpose:     aggregate daily series to calendar months with month boundaries taken from the actual dates
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Description: boundaries are derived from the start date and calendar of the series so that leap days are
+#              accounted for; series are reduced along their last axis so that many cells, stacked as an
+#              array of shape (ncells, ndays), are aggregated in one call
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+__prog__ = 'monthly_aggregation.py'
+__version__ = '0.0.0'
+__author__ = 's03mm5'
+
+from numpy import arange, asarray, concatenate, diff, flatnonzero, float64, full, inf, int64, isnan, where, \
+                                                                            add, minimum, maximum, nan as NaN
+
+from time_axes import day_numbers
+
+METHODS = ['sum', 'mean', 'min', 'max']
+
+class MonthlyAggregator(object, ):
+    '''
+    segments a daily time axis into calendar months and reduces arrays along their last axis
+
+    missing values, NaN, are ignored; a month with no valid values gives NaN
+    '''
+    def __init__(self, seg_strts, month_indx, nsteps, nmonths, strt_year, strt_month):
+        """
+        use from_start_date or from_dates rather than calling directly
+        """
+        self.seg_strts = seg_strts          # index of first step of each segment
+        self.month_indx = month_indx        # output month of each segment
+        self.nsteps = nsteps
+        self.nmonths = nmonths
+        self.strt_year = strt_year
+        self.strt_month = strt_month
+
+    @classmethod
+    def from_start_date(cls, strt_year, strt_month, strt_day, nsteps, calendar = 'standard'):
+        """
+        contiguous daily series of nsteps days starting at the given date
+        the first and last months may be partial
+        """
+        day0 = day_numbers(strt_year, strt_month, strt_day, calendar)
+        nmonths_max = nsteps // 28 + 2
+        mnth_indx = (strt_month - 1) + arange(1, nmonths_max + 1)
+        edges = day_numbers(strt_year + mnth_indx // 12, mnth_indx % 12 + 1, 1, calendar) - day0
+        edges = edges[edges < nsteps]
+        seg_strts = concatenate(([0], edges)).astype(int64)
+
+        return cls(seg_strts, arange(len(seg_strts)), nsteps, len(seg_strts), strt_year, strt_month)
+
+    @classmethod
+    def from_dates(cls, years, months):
+        """
+        series with the year and month of each step known e.g. from netCDF4.num2date; steps must be in order
+        months without any step are present in the output as NaN
+        """
+        years = asarray(years, dtype=int64)
+        months = asarray(months, dtype=int64)
+        codes = (years - years[0])*12 + months - months[0]
+        seg_strts = concatenate(([0], flatnonzero(diff(codes)) + 1)).astype(int64)
+
+        return cls(seg_strts, codes[seg_strts], len(codes), int(codes[-1]) + 1, int(years[0]), int(months[0]))
+
+    def days_per_month(self):
+        """
+        number of steps in each segment
+        """
+        return diff(concatenate((self.seg_strts, [self.nsteps])))
+
+    def aggregate(self, vals, method = 'mean'):
+        """
+        reduce vals, of shape (..., nsteps), to shape (..., nmonths) using method: sum, mean, min or max
+        """
+        vals = asarray(vals, dtype=float64)
+        if vals.shape[-1] != self.nsteps:
+            raise ValueError('series has {} steps, expected {}'.format(vals.shape[-1], self.nsteps))
+
+        valid = ~isnan(vals)
+        counts = add.reduceat(valid.astype(int64), self.seg_strts, axis=-1)
+
+        if method in ('sum', 'mean'):
+            rslt = add.reduceat(where(valid, vals, 0.0), self.seg_strts, axis=-1)
+            if method == 'mean':
+                rslt = rslt / where(counts > 0, counts, 1)
+        elif method == 'min':
+            rslt = minimum.reduceat(where(valid, vals, inf), self.seg_strts, axis=-1)
+        elif method == 'max':
+            rslt = maximum.reduceat(where(valid, vals, -inf), self.seg_strts, axis=-1)
+        else:
+            raise ValueError('method {} must be one of: {}'.format(method, ', '.join(METHODS)))
+
+        rslt[counts == 0] = NaN
+
+        if len(self.month_indx) == self.nmonths:
+            return rslt
+
+        monthly = full(vals.shape[:-1] + (self.nmonths,), NaN)
+        monthly[..., self.month_indx] = rslt
+        return monthly
+
+    def aggregate_vars(self, var_vals, var_methods, default_method = 'mean'):
+        """
+        aggregate several variables, each with its own method e.g. {'precip': 'sum', 'tas': 'mean'}
+        """
+        return {var_name: self.aggregate(vals, var_methods.get(var_name, default_method))
+                                                                        for var_name, vals in var_vals.items()}
@@ -0,0 +1,286 @@
+#-------------------------------------------------------------------------------
+# Name:        nc_diff.py
+# Purpose:     compare two NetCDF files, or Zarr stores, variable by variable in bounded memory
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Description: intended to show that optimised pipelines give unchanged outputs; each variable is read from both
+#              datasets in blocks along its first axis aligned to the chunks of the first dataset; values are
+#              equal when |a - b| <= atol + rtol*|b|; fill values and NaNs are masked so that datasets with
+#              different fill values compare equal, a value masked in one dataset but not the other is a
+#              difference; variables may be compared by separate processes
+#              reports the number of differences, the largest absolute and relative differences and the indices
+#              and values of the first differences of each variable
+#              e.g.   python nc_diff.py before.nc after.nc --rtol 1e-6 --nprocs 4
+#              exit status is 0 when the datasets match and 1 otherwise
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+__prog__ = 'nc_diff.py'
+__version__ = '0.0.0'
+__author__ = 's03mm5'
+
+from argparse import ArgumentParser
+from multiprocessing import Pool
+import json
+import sys
+
+from numpy import abs as np_abs, argwhere, float64, prod, unravel_index, where
+from numpy.ma import masked_invalid, getmaskarray
+
+from zarr_backend import open_dataset
+from profiling_fns import stage
+
+ATOL = 0.0
+RTOL = 0.0
+MAX_REPORT = 10         # differences reported for each variable
+MAX_MB = 256
+
+WARNING_STR = '*** Warning *** '
+
+class VarDiff(object, ):
+    '''
+    differences of one variable accumulated block by block
+    '''
+    def __init__(self, var_name, max_report = MAX_REPORT):
+        """
+
+        """
+        self.var_name = var_name
+        self.max_report = max_report
+        self.ncompared = 0
+        self.ndiffs = 0
+        self.nmask_diffs = 0
+        self.sum_abs_diff = 0.0
+        self.max_abs_diff = 0.0
+        self.max_abs_indx = None
+        self.max_rel_diff = 0.0
+        self.first_diffs = []
+        self.error = None
+
+    def add(self, row_strt, vals_a, vals_b, atol, rtol):
+        """
+        compare blocks whose first axis runs from row_strt
+        """
+        vals_a = masked_invalid(vals_a)
+        vals_b = masked_invalid(vals_b)
+        mask_a = getmaskarray(vals_a)
+        mask_b = getmaskarray(vals_b)
+        both = ~mask_a & ~mask_b
+
+        data_a = vals_a.filled(0).astype(float64)
+        data_b = vals_b.filled(0).astype(float64)
+        abs_diff = where(both, np_abs(data_a - data_b), 0.0)
+        value_diffs = both & (abs_diff > atol + rtol*np_abs(data_b))
+        mask_diffs = mask_a != mask_b
+        diffs = value_diffs | mask_diffs
+
+        self.ncompared += int(both.sum())
+        self.ndiffs += int(diffs.sum())
+        self.nmask_diffs += int(mask_diffs.sum())
+        self.sum_abs_diff += float(abs_diff.sum())
+
+        if abs_diff.size > 0:
+            indx = int(abs_diff.argmax())
+            if abs_diff.flat[indx] > self.max_abs_diff:
+                self.max_abs_diff = float(abs_diff.flat[indx])
+                self.max_abs_indx = self._indices(row_strt, unravel_index(indx, abs_diff.shape))
+
+            rel_diff = where(both & (data_b != 0), abs_diff / where(data_b != 0, np_abs(data_b), 1.0), 0.0)
+            self.max_rel_diff = max(self.max_rel_diff, float(rel_diff.max()))
+
+        # indices and values of the first differences
+        # ===========================================
+        nspare = self.max_report - len(self.first_diffs)
+        if nspare > 0 and diffs.any():
+            for indx in argwhere(diffs)[:nspare]:
+                indx = tuple(indx)
+                self.first_diffs.append({'index': self._indices(row_strt, indx),
+                                         'a': None if mask_a[indx] else float(data_a[indx]),
+                                         'b': None if mask_b[indx] else float(data_b[indx])})
+
+    def _indices(self, row_strt, indx):
+        """
+        indices within the variable of a position within a block
+        """
+        if len(indx) == 0:
+            return []
+        return [int(indx[0]) + row_strt] + [int(elem) for elem in indx[1:]]
+
+    def summary(self):
+        """
+
+        """
+        return {'ncompared': self.ncompared, 'ndiffs': self.ndiffs, 'nmask_diffs': self.nmask_diffs,
+                'max_abs_diff': self.max_abs_diff, 'max_abs_index': self.max_abs_indx,
+                'max_rel_diff': self.max_rel_diff,
+                'mean_abs_diff': self.sum_abs_diff / self.ncompared if self.ncompared > 0 else 0.0,
+                'first_diffs': self.first_diffs, 'error': self.error}
+
+def _block_nrows(nc_var, max_mb):
+    """
+    rows along the first axis per block, a multiple of the chunk size, such that both blocks and the
+    intermediate arrays fit within max_mb
+    """
+    chunking = nc_var.chunking()
+    chunk_nrows = 1 if chunking == 'contiguous' or chunking is None else chunking[0]
+    row_nbytes = max(1, int(prod(nc_var.shape[1:])))*8*6
+
+    return max(chunk_nrows, (int(max_mb*1024*1024) // row_nbytes // chunk_nrows)*chunk_nrows)
+
+def diff_var(var_a, var_b, atol = ATOL, rtol = RTOL, max_report = MAX_REPORT, stop_early = False, max_mb = MAX_MB):
+    '''
+    compare a variable of two datasets; with stop_early set comparison ends after the first block with a
+    difference, so counts cover only the blocks compared
+    '''
+    rslt = VarDiff(var_a.name, max_report)
+    if var_a.shape != var_b.shape:
+        rslt.error = 'shapes differ: {} and {}'.format(var_a.shape, var_b.shape)
+        return rslt.summary()
+
+    if var_a.ndim == 0:
+        rslt.add(0, var_a[...].reshape(1), var_b[...].reshape(1), atol, rtol)
+        return rslt.summary()
+
+    nrows = var_a.shape[0]
+    block_nrows = _block_nrows(var_a, max_mb)
+    for row_strt in range(0, nrows, block_nrows):
+        row_end = min(row_strt + block_nrows, nrows)
+        with stage('read') as stg:
+            vals_a = var_a[row_strt:row_end]
+            vals_b = var_b[row_strt:row_end]
+            stg.nbytes = vals_a.nbytes + vals_b.nbytes
+
+        with stage('compute'):
+            rslt.add(row_strt, vals_a, vals_b, atol, rtol)
+
+        if stop_early and rslt.ndiffs > 0:
+            break
+
+    return rslt.summary()
+
+def _diff_worker(task):
+    """
+    compare one variable in a separate process
+    """
+    fname_a, fname_b, var_name, atol, rtol, max_report, stop_early, max_mb = task
+    dset_a = open_dataset(fname_a, 'r')
+    dset_b = open_dataset(fname_b, 'r')
+    rslt = diff_var(dset_a.variables[var_name], dset_b.variables[var_name], atol, rtol, max_report, stop_early,
+                                                                                                        max_mb)
+    dset_a.close()
+    dset_b.close()
+
+    return var_name, rslt
+
+def diff_datasets(fname_a, fname_b, var_names = None, atol = ATOL, rtol = RTOL, max_report = MAX_REPORT,
+                                                                stop_early = False, nprocs = 1, max_mb = MAX_MB):
+    '''
+    compare the variables common to both datasets, by default all of them
+    returns a report with the variables present in only one dataset and a summary for each variable compared;
+    a variable of var_names missing from either dataset has a summary with an error
+    with stop_early set no further variables are compared once one differs
+    '''
+    dset_a = open_dataset(fname_a, 'r')
+    dset_b = open_dataset(fname_b, 'r')
+    only_a = sorted(set(dset_a.variables) - set(dset_b.variables))
+    only_b = sorted(set(dset_b.variables) - set(dset_a.variables))
+    if var_names is None:
+        var_names = [var_name for var_name in dset_a.variables if var_name in dset_b.variables]
+
+    report = {'fname_a': fname_a, 'fname_b': fname_b, 'atol': atol, 'rtol': rtol, 'only_a': only_a,
+                                                                                'only_b': only_b, 'variables': {}}
+
+    # variables requested but absent from either dataset are reported rather than compared
+    # ====================================================================================
+    cmpr_names = []
+    for var_name in var_names:
+        absent = [fname for fname, dset in ((fname_a, dset_a), (fname_b, dset_b)) if var_name not in dset.variables]
+        if len(absent) == 0:
+            cmpr_names.append(var_name)
+        else:
+            rslt = VarDiff(var_name, max_report)
+            rslt.error = 'not in ' + ' or '.join(absent)
+            report['variables'][var_name] = rslt.summary()
+
+    if stop_early and len(cmpr_names) < len(var_names):
+        cmpr_names = []
+
+    if nprocs > 1 and len(cmpr_names) > 1:
+        dset_a.close()
+        dset_b.close()
+        tasks = [(fname_a, fname_b, var_name, atol, rtol, max_report, stop_early, max_mb) for var_name in cmpr_names]
+        with Pool(processes = min(nprocs, len(cmpr_names))) as pool:
+            for var_name, rslt in pool.imap_unordered(_diff_worker, tasks):
+                report['variables'][var_name] = rslt
+                if stop_early and (rslt['ndiffs'] > 0 or rslt['error'] is not None):
+                    pool.terminate()
+                    break
+    else:
+        for var_name in cmpr_names:
+            rslt = diff_var(dset_a.variables[var_name], dset_b.variables[var_name], atol, rtol, max_report,
+                                                                                            stop_early, max_mb)
+            report['variables'][var_name] = rslt
+            if stop_early and (rslt['ndiffs'] > 0 or rslt['error'] is not None):
+                break
+        dset_a.close()
+        dset_b.close()
+
+    report['identical'] = len(only_a) == 0 and len(only_b) == 0 and len(report['variables']) == len(var_names) \
+            and all(rslt['ndiffs'] == 0 and rslt['error'] is None for rslt in report['variables'].values())
+
+    return report
+
+def print_report(report):
+    '''
+
+    '''
+    print('Comparing ' + report['fname_a'] + ' with ' + report['fname_b'] +
+                                                        ' atol: {} rtol: {}'.format(report['atol'], report['rtol']))
+    for key, fname in (('only_a', report['fname_a']), ('only_b', report['fname_b'])):
+        if len(report[key]) > 0:
+            print(WARNING_STR + 'variables only in ' + fname + ': ' + ', '.join(report[key]))
+
+    for var_name, rslt in report['variables'].items():
+        if rslt['error'] is not None:
+            print('\t{:<16s} {}'.format(var_name, rslt['error']))
+            continue
+
+        print('\t{:<16s} compared: {:>12d}  differences: {:>10d}  mask differences: {:>8d}  max abs: {:.6g}  '
+                'max rel: {:.6g}  mean abs: {:.6g}'.format(var_name, rslt['ncompared'], rslt['ndiffs'],
+                    rslt['nmask_diffs'], rslt['max_abs_diff'], rslt['max_rel_diff'], rslt['mean_abs_diff']))
+        for diff in rslt['first_diffs']:
+            print('\t\tindex: {}\ta: {}\tb: {}'.format(diff['index'], diff['a'], diff['b']))
+
+    print('Datasets ' + ('match' if report['identical'] else 'differ'))
+
+    return
+
+def main():
+    '''
+
+    '''
+    parser = ArgumentParser(description='Compare two NetCDF files or Zarr stores variable by variable')
+    parser.add_argument('fname_a')
+    parser.add_argument('fname_b')
+    parser.add_argument('--vars', nargs='+', help='default is every variable common to both')
+    parser.add_argument('--atol', type=float, default=ATOL, help='absolute tolerance')
+    parser.add_argument('--rtol', type=float, default=RTOL, help='tolerance relative to values of fname_b')
+    parser.add_argument('--max_report', type=int, default=MAX_REPORT, help='differences listed for each variable')
+    parser.add_argument('--stop_early', action='store_true', help='stop at the first difference')
+    parser.add_argument('--nprocs', type=int, default=1, help='processes comparing variables')
+    parser.add_argument('--max_mb', type=float, default=MAX_MB, help='memory limit for blocks read')
+    parser.add_argument('--json', help='also write the report to this file')
+    args = parser.parse_args()
+
+    report = diff_datasets(args.fname_a, args.fname_b, args.vars, args.atol, args.rtol, args.max_report,
+                                                                args.stop_early, args.nprocs, args.max_mb)
+    print_report(report)
+    if args.json is not None:
+        with open(args.json, 'w') as fobj:
+            json.dump(report, fobj, indent=1)
+
+    sys.exit(0 if report['identical'] else 1)
+
+if __name__ == '__main__':
+    main()
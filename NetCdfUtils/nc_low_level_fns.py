@@ -12,14 +12,19 @@ __prog__ = 'nc_low_level_fns.py'
 __version__ = '0.0.0'
 __author__ = 's03mm5'
 
-from calendar import monthrange
-from _datetime import datetime
-from statistics import mean, StatisticsError
-from numpy import arange
+from numpy import asarray, float64, nan as NaN
+
+from time_axes import time_axis, ndays_in_years, day_numbers, TIME_UNITS
+from monthly_aggregation import MonthlyAggregator
 
 missing_value = -999.0
 imiss_value = int(missing_value)
 
+ERROR_STR = '*** Error *** '
+WARNING_STR = '*** Warning *** '
+HARMONIE_STRT_YEAR = 1969           # HARMONIE daily datasets start on 1st January 1969
+STOCK_METHODS = {'soc': 'mean'}     # variables which are not fluxes
+
 ROOT_WTHR = 'E:\\GlobalEcosseData\\'
 HARMONIE = ROOT_WTHR + 'HARMONIE_V2\\Monthly\\'
 ECLIPS_OUT = ROOT_WTHR + 'ECLIPS2_GlEc\\Monthly\\'
@@ -29,96 +34,60 @@ GCMS = ['CLMcom_CCLM', 'CLMcom_CLM', 'DMI_HIRAM','KMNI_RAMCO','MPI_CSC_REMO2009'
 YEAR_RANGE = '_1961_2100'
 SCENARIOS = {'RCP60':'_6.0', 'RCP45':'_4.5', 'RCP26':'_2.6', 'RCP85':'_8.5'}
 
-def daily_to_monthly(val_list, metric, nmonths):
+def daily_to_monthly(val_list, metric, nmonths, strt_year = HARMONIE_STRT_YEAR, calendar = 'standard'):
     '''
-    take days extents from HARMONIE daily datasets 41 years 365 + 12 leap years
+    aggregate a daily series starting on 1st January of strt_year to nmonths calendar months
+    stocks e.g. soc are averaged and fluxes are summed; val_list may also be an array of shape (ncells, ndays)
+    if the series ends part way through the last month the flux of that month is set to NaN
     '''
-    indx1 = 0
-    imnth = 1
-    monthly_vals = []
-    for indx_mnth in range(nmonths):
-        frst_day, num_days = monthrange(2011, imnth)
-        indx2 = indx1 + num_days
-        if metric == 'soc':
-            try:
-                monthly_vals.append(mean(val_list[indx1:indx2]))
-            except StatisticsError as err:
-                print(err)
-                return None
-        else:
-            monthly_vals.append(sum(val_list[indx1:indx2]))  # flux
-        indx1 += num_days
-        imnth += 1
-        if imnth > 12:
-            imnth = 1
-
-    return monthly_vals
-
-def generate_daily_atimes(fut_start_year):
+    vals = asarray(val_list, dtype=float64)
+    aggregator = MonthlyAggregator.from_start_date(strt_year, 1, 1, vals.shape[-1], calendar)
+    if aggregator.nmonths < nmonths:
+        print(ERROR_STR + 'series of {} days covers only {} of {} months'.format(vals.shape[-1],
+                                                                                aggregator.nmonths, nmonths))
+        return None
+
+    method = STOCK_METHODS.get(metric, 'sum')
+    monthly_vals = aggregator.aggregate(vals, method)[..., :nmonths]
+
+    # a partial last month would give a flux which is too small
+    # ==========================================================
+    mnth_indx = nmonths - 1
+    year, month = strt_year + mnth_indx // 12, mnth_indx % 12 + 1
+    ndays_last = int(day_numbers(year + month // 12, month % 12 + 1, 1, calendar) - day_numbers(year, month, 1, calendar))
+    ndays_read = int(aggregator.days_per_month()[mnth_indx])
+    if ndays_read < ndays_last:
+        print(WARNING_STR + 'series of {} days ends after {} of {} days of month {} of {} calendar'
+                            .format(vals.shape[-1], ndays_read, ndays_last, nmonths, calendar)
+                            + (' - will set to missing' if method == 'sum' else ''))
+        if method == 'sum':
+            monthly_vals[..., mnth_indx] = NaN
+
+    return monthly_vals.tolist()
+
+def generate_daily_atimes(fut_start_year, num_years = 41, calendar = 'standard'):
     '''
-    take days extents from HARMONIE daily datasets 41 years 365 + 12 leap years
+    midpoints, starts and ends of each day of num_years years from 1st January of fut_start_year
+    in days since 1900-01-01 - HARMONIE daily datasets cover 41 years
     '''
-    nday_strt = 25202; nday_end = 43098
-    atimes = arange(nday_strt, nday_end + 1)     # create ndarray
+    ndays = ndays_in_years(fut_start_year, num_years, calendar)
+    atimes, bounds = time_axis(fut_start_year, ndays, 'daily', TIME_UNITS, calendar)
 
-    return atimes
+    return atimes, bounds[:, 0], bounds[:, 1]
 
-def generate_mnthly_atimes(fut_start_year, num_months):
+def generate_mnthly_atimes(fut_start_year, num_months, calendar = 'standard'):
     '''
-    expect 1092 for 91 years plus 2 extras for 40 and 90 year differences
+    midpoints, starts and ends of num_months months from January of fut_start_year in days since 1900-01-01
+    end of each month is the start of the next, as CF bounds
     '''
+    atimes, bounds = time_axis(fut_start_year, num_months, 'monthly', TIME_UNITS, calendar)
 
-    atimes = arange(num_months)     # create ndarray
-    atimes_strt = arange(num_months)
-    atimes_end  = arange(num_months)
-
-    date_1900 = datetime(1900, 1, 1, 12, 0)
-    imnth = 1
-    year = fut_start_year
-    prev_delta_days = -999
-    for indx in arange(num_months + 1):
-        date_this = datetime(year, imnth, 1, 12, 0)
-        delta = date_this - date_1900   # days since 1900-01-01
-
-        # add half number of days in this month to the day of the start of the month
-        # ==========================================================================
-        if indx > 0:
-            atimes[indx-1] = prev_delta_days + int((delta.days - prev_delta_days)/2)
-            atimes_strt[indx-1] = prev_delta_days
-            atimes_end[indx-1] =  delta.days - 1
-
-        prev_delta_days = delta.days
-        imnth += 1
-        if imnth > 12:
-            imnth = 1
-            year += 1
-
-    return atimes, atimes_strt, atimes_end
-
-def generate_yearly_atimes(fut_start_year, num_years):
+    return atimes, bounds[:, 0], bounds[:, 1]
+
+def generate_yearly_atimes(fut_start_year, num_years, calendar = 'standard'):
     '''
-    expect 1092 for 91 years plus 2 extras for 40 and 90 year differences
+    midpoints, starts and ends of num_years years from fut_start_year in days since 1900-01-01
     '''
+    atimes, bounds = time_axis(fut_start_year, num_years, 'yearly', TIME_UNITS, calendar)
 
-    atimes = arange(num_years)     # create ndarray
-    atimes_strt = arange(num_years)
-    atimes_end  = arange(num_years)
-
-    date_1900 = datetime(1900, 1, 1, 12, 0)
-    year = fut_start_year
-    prev_delta_days = -999
-    for indx in arange(num_years + 1):
-        date_this = datetime(year, 1, 1, 12, 0)
-        delta = date_this - date_1900   # days since 1900-01-01
-
-        # add half number of days in this month to the day of the start of the month
-        # ==========================================================================
-        if indx > 0:
-            atimes[indx-1] = prev_delta_days + int((delta.days - prev_delta_days)/2)
-            atimes_strt[indx-1] = prev_delta_days
-            atimes_end[indx-1] =  delta.days - 1
-
-        prev_delta_days = delta.days
-        year += 1
-
-    return atimes, atimes_strt, atimes_end
\ No newline at end of file
+    return atimes, bounds[:, 0], bounds[:, 1]
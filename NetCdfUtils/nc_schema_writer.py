@@ -0,0 +1,270 @@
+#-------------------------------------------------------------------------------
+# Name:        nc_schema_writer.py
+# Purpose:     create NetCDF files from a declared layout and write to them in buffered, chunk aligned slabs
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Description: an NcSchema declares dimensions, variables, dtypes, chunk shapes, compression, fill values and
+#              attributes; a SlabWriter accumulates values for a band of rows of one variable in memory and
+#              writes the band in a single call when the band is complete
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+__prog__ = 'nc_schema_writer.py'
+__version__ = '0.0.0'
+__author__ = 's03mm5'
+
+from netCDF4 import Dataset
+from numpy import zeros, ones
+from numpy.ma import masked_array, getmaskarray
+
+NC_FORMAT = 'NETCDF4_CLASSIC'
+NC_FORMATS = ['NETCDF4', 'NETCDF4_CLASSIC', 'NETCDF3_CLASSIC', 'NETCDF3_64BIT_OFFSET', 'NETCDF3_64BIT_DATA']
+COMPLEVEL = 4           # zlib level - higher levels cost much more time for little further reduction
+BAND_NROWS = 32         # default rows per band of the slab writer when the variable is not chunked
+
+class NcSchema(object, ):
+    '''
+    fixed layout of a NetCDF file: dimensions and variables in order of declaration plus global attributes
+    '''
+    def __init__(self, global_attrs = None, nc_format = NC_FORMAT):
+        """
+
+        """
+        self.global_attrs = {} if global_attrs is None else dict(global_attrs)
+        self.nc_format = nc_format
+        self.dimensions = []
+        self.variables = []
+
+    def add_dimension(self, name, size):
+        """
+        size of None gives an unlimited dimension
+        """
+        self.dimensions.append((name, size))
+
+    def add_variable(self, name, dtype, dims, fill_value = None, chunksizes = None, compress = False,
+                                                                                attrs = None, values = None):
+        """
+        chunksizes is a tuple with an entry for each dimension and is clipped to the dimension sizes
+        values, if supplied, are written when the file is created e.g. coordinates
+        """
+        self.variables.append({'name': name, 'dtype': dtype, 'dims': tuple(dims), 'fill_value': fill_value,
+                               'chunksizes': chunksizes, 'compress': compress,
+                               'attrs': {} if attrs is None else dict(attrs), 'values': values})
+
+    def _chunk_shape(self, var_defn):
+        """
+        clip requested chunk shape to the dimensions
+        """
+        if var_defn['chunksizes'] is None:
+            return None
+
+        dim_sizes = dict(self.dimensions)
+        chunk_shape = []
+        for dim, chunk_size in zip(var_defn['dims'], var_defn['chunksizes']):
+            dim_size = dim_sizes[dim]
+            if dim_size is None or dim_size == 0:
+                chunk_shape.append(max(1, chunk_size))
+            else:
+                chunk_shape.append(max(1, min(chunk_size, dim_size)))
+
+        return tuple(chunk_shape)
+
+    def create(self, nc_fname):
+        """
+        create file and return its name, or None if it cannot be created
+        a name ending in .zarr gives a Zarr store with the same layout
+        """
+        if nc_fname.rstrip('/\\').endswith('.zarr'):
+            from zarr_backend import create_zarr
+            try:
+                return create_zarr(self, nc_fname)
+            except (PermissionError, ImportError) as err:
+                print(err)
+                return None
+
+        try:
+            nc_dset = Dataset(nc_fname, 'w', format=self.nc_format)
+        except PermissionError as err:
+            print(err)
+            return None
+
+        for attr_name, attr_val in self.global_attrs.items():
+            nc_dset.setncattr(attr_name, attr_val)
+
+        for name, size in self.dimensions:
+            nc_dset.createDimension(name, size)
+
+        for var_defn in self.variables:
+            chunk_shape = self._chunk_shape(var_defn)
+            var = nc_dset.createVariable(var_defn['name'], var_defn['dtype'], var_defn['dims'],
+                            fill_value = var_defn['fill_value'], zlib = var_defn['compress'], complevel = COMPLEVEL,
+                                        shuffle = var_defn['compress'], chunksizes = chunk_shape)
+            for attr_name, attr_val in var_defn['attrs'].items():
+                var.setncattr(attr_name, attr_val)
+
+            if var_defn['values'] is not None:
+                var[:] = var_defn['values']
+
+        nc_dset.sync()
+        nc_dset.close()
+
+        return nc_fname
+
+def schema_from_dset(src_dset, chunk_shapes = None, with_values = True):
+    '''
+    schema reproducing an open dataset; chunk_shapes maps variable names to new chunk shapes
+    with_values set reads the values of variables not in chunk_shapes so that they are written on creation
+    unlimited dimensions become fixed
+    '''
+    chunk_shapes = {} if chunk_shapes is None else chunk_shapes
+    schema = NcSchema({attr: src_dset.getncattr(attr) for attr in src_dset.ncattrs()},
+                                            src_dset.data_model if src_dset.data_model in NC_FORMATS else NC_FORMAT)
+    for dim_name, dim in src_dset.dimensions.items():
+        schema.add_dimension(dim_name, len(dim))
+
+    for var_name, src_var in src_dset.variables.items():
+        attrs = {attr: src_var.getncattr(attr) for attr in src_var.ncattrs() if attr != '_FillValue'}
+        fill_value = src_var.getncattr('_FillValue') if '_FillValue' in src_var.ncattrs() else None
+        filters = src_var.filters()
+        compress = False if filters is None else filters.get('zlib', False)
+
+        if var_name in chunk_shapes:
+            chunksizes = chunk_shapes[var_name]
+            values = None
+        else:
+            chunking = src_var.chunking()
+            chunksizes = None if chunking == 'contiguous' or chunking is None else chunking
+            values = src_var[:] if with_values else None
+
+        schema.add_variable(var_name, src_var.dtype, src_var.dimensions, fill_value, chunksizes, compress, attrs,
+                                                                                                    values = values)
+    return schema
+
+def band_nrows(nc_var, axis):
+    '''
+    rows per band of a slab writer: the chunk size of the variable along axis so that writes are chunk aligned
+    '''
+    chunking = nc_var.chunking()
+    if chunking == 'contiguous' or chunking is None:
+        return BAND_NROWS
+
+    return chunking[axis]
+
+class SlabWriter(object, ):
+    '''
+    buffers writes to a band of rows of nc_var along axis and writes each band in one call
+
+    lead is a tuple of indices, integers or slices, for the axes before axis; the axes after axis are
+    always written in full. When read_back is set each band is initialised from the file so that values not
+    written through the writer are preserved, otherwise the band starts as fill values
+    '''
+    def __init__(self, nc_var, axis = 0, lead = (), nrows = None, read_back = False):
+        """
+
+        """
+        if len(lead) != axis:
+            raise ValueError('lead must supply an index for each of the {} axes before axis'.format(axis))
+
+        self.nc_var = nc_var
+        self.axis = axis
+        self.lead = tuple(lead)
+        self.read_back = read_back
+        self.nrows_total = nc_var.shape[axis]
+        self.nrows = band_nrows(nc_var, axis) if nrows is None else max(1, int(nrows))
+
+        lead_shape = tuple(len(range(*indx.indices(size))) for indx, size in zip(lead, nc_var.shape)
+                                                                                        if isinstance(indx, slice))
+        self.trail_shape = nc_var.shape[axis + 1:]
+        self.lead_shape = lead_shape
+        self.band_strt = None
+        self.band_end = None
+        self.vals = None
+        self.mask = None
+        self.nwrites = 0
+
+    def _index(self, row_strt, row_end):
+        """
+        netCDF index for the rows of the band
+        """
+        return self.lead + (slice(row_strt, row_end),)
+
+    def _load_band(self, row):
+        """
+        flush current band and start the band containing row
+        """
+        self.flush()
+        band_strt = (row // self.nrows) * self.nrows
+        band_end = min(band_strt + self.nrows, self.nrows_total)
+        shape = self.lead_shape + (band_end - band_strt,) + self.trail_shape
+
+        if self.read_back:
+            band = self.nc_var[self._index(band_strt, band_end)]
+            self.vals = masked_array(band).filled(0).astype(self.nc_var.dtype)
+            self.mask = getmaskarray(band).copy()
+        else:
+            self.vals = zeros(shape, dtype=self.nc_var.dtype)
+            self.mask = ones(shape, dtype=bool)
+
+        self.band_strt = band_strt
+        self.band_end = band_end
+
+    def write_rows(self, row_strt, vals):
+        """
+        vals has shape lead_shape + (nrows,) + trail_shape and may span several bands; masked values are written
+        as fill values
+        """
+        vals = masked_array(vals)
+        nrows = vals.shape[len(self.lead_shape)]
+        lead_slices = (slice(None),)*len(self.lead_shape)
+        row = row_strt
+        while row < row_strt + nrows:
+            if self.band_strt is None or not self.band_strt <= row < self.band_end:
+                self._load_band(row)
+
+            row_end = min(self.band_end, row_strt + nrows)
+            src = lead_slices + (slice(row - row_strt, row_end - row_strt),)
+            dst = lead_slices + (slice(row - self.band_strt, row_end - self.band_strt),)
+            self.vals[dst] = vals[src].filled(0)
+            self.mask[dst] = getmaskarray(vals)[src]
+            row = row_end
+
+    def write_cell(self, row, trail_indx, val):
+        """
+        set a single row and trailing position e.g. write_cell(lat_indx, (lon_indx,), val); val may be masked
+        rows are expected in ascending order, a row outside the current band starts a new band
+        """
+        if self.band_strt is None or not self.band_strt <= row < self.band_end:
+            self._load_band(row)
+
+        indx = (slice(None),)*len(self.lead_shape) + (row - self.band_strt,) + tuple(trail_indx)
+        val = masked_array(val)
+        self.vals[indx] = val.filled(0)
+        self.mask[indx] = getmaskarray(val)     # element by element when val is a vector over the lead axes
+
+    def flush(self):
+        """
+        write the current band, if any
+        """
+        if self.band_strt is None:
+            return
+
+        self.nc_var[self._index(self.band_strt, self.band_end)] = masked_array(self.vals, mask = self.mask)
+        self.nwrites += 1
+        self.band_strt = None
+        self.band_end = None
+        self.vals = None
+        self.mask = None
+
+    def close(self):
+        """
+
+        """
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+        return False
@@ -0,0 +1,132 @@
+#-------------------------------------------------------------------------------
+# Name:        osgb_fns.py
+# Purpose:     vectorised conversion of WGS84 latitudes and longitudes to Ordnance Survey National Grid (OSGB36)
+#              eastings and northings
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Description: pyproj is used if it is installed, otherwise a seven parameter Helmert transformation from WGS84
+#              to OSGB36 followed by the transverse Mercator projection of the National Grid, as given in
+#              "A guide to coordinate systems in Great Britain", Ordnance Survey; the Helmert transformation
+#              is accurate to a few metres which is ample for locating cells of a 1 km grid
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+__prog__ = 'osgb_fns.py'
+__version__ = '0.0.0'
+__author__ = 's03mm5'
+
+from numpy import arctan2, asarray, cos, float64, radians, sin, sqrt, tan
+
+# ellipsoids: semi-major and semi-minor axes in metres
+# ====================================================
+WGS84 = (6378137.000, 6356752.3141)
+AIRY_1830 = (6377563.396, 6356256.909)
+
+# Helmert transformation WGS84 to OSGB36: translations in metres, scale in ppm and rotations in arc seconds
+# ========================================================================================================
+HELMERT_TX, HELMERT_TY, HELMERT_TZ = -446.448, 125.157, -542.060
+HELMERT_S = 20.4894
+HELMERT_RX, HELMERT_RY, HELMERT_RZ = -0.1502, -0.2470, -0.8421
+
+# National Grid projection
+# ========================
+NG_F0 = 0.9996012717                # scale factor on central meridian
+NG_LAT0, NG_LON0 = 49.0, -2.0       # true origin in degrees
+NG_E0, NG_N0 = 400000.0, -100000.0  # false origin in metres
+
+NITERS = 8      # iterations of the geodetic latitude, converges to better than 1 mm in fewer
+
+def _to_cartesian(lats, lons, ellipsoid):
+    """
+    geodetic coordinates in radians, at zero height, to cartesian
+    """
+    a, b = ellipsoid
+    e2 = 1.0 - (b*b)/(a*a)
+    nu = a / sqrt(1.0 - e2*sin(lats)**2)
+
+    return nu*cos(lats)*cos(lons), nu*cos(lats)*sin(lons), (1.0 - e2)*nu*sin(lats)
+
+def _from_cartesian(x, y, z, ellipsoid):
+    """
+    cartesian coordinates to geodetic latitudes and longitudes in radians
+    """
+    a, b = ellipsoid
+    e2 = 1.0 - (b*b)/(a*a)
+    p = sqrt(x*x + y*y)
+
+    lats = arctan2(z, p*(1.0 - e2))
+    for dummy in range(NITERS):
+        nu = a / sqrt(1.0 - e2*sin(lats)**2)
+        lats = arctan2(z + e2*nu*sin(lats), p)
+
+    return lats, arctan2(y, x)
+
+def helmert_wgs84_to_osgb36(lats, lons):
+    '''
+    WGS84 latitudes and longitudes in degrees to OSGB36 latitudes and longitudes in radians
+    '''
+    x1, y1, z1 = _to_cartesian(radians(lats), radians(lons), WGS84)
+
+    scale = 1.0 + HELMERT_S*1.0e-6
+    rx, ry, rz = [radians(rot/3600.0) for rot in (HELMERT_RX, HELMERT_RY, HELMERT_RZ)]
+    x2 = HELMERT_TX + scale*x1 - rz*y1 + ry*z1
+    y2 = HELMERT_TY + rz*x1 + scale*y1 - rx*z1
+    z2 = HELMERT_TZ - ry*x1 + rx*y1 + scale*z1
+
+    return _from_cartesian(x2, y2, z2, AIRY_1830)
+
+def national_grid(lats, lons):
+    '''
+    transverse Mercator projection of OSGB36 latitudes and longitudes, in radians, to eastings and northings
+    '''
+    a, b = AIRY_1830
+    e2 = 1.0 - (b*b)/(a*a)
+    n = (a - b)/(a + b)
+    lat0 = radians(NG_LAT0)
+
+    sin_lat = sin(lats)
+    cos_lat = cos(lats)
+    tan2 = tan(lats)**2
+    nu = a*NG_F0 / sqrt(1.0 - e2*sin_lat**2)
+    rho = a*NG_F0*(1.0 - e2)*(1.0 - e2*sin_lat**2)**-1.5
+    eta2 = nu/rho - 1.0
+
+    dlat = lats - lat0
+    slat = lats + lat0
+    meridian = b*NG_F0*((1.0 + n + 1.25*n**2 + 1.25*n**3)*dlat
+                        - (3.0*n + 3.0*n**2 + 2.625*n**3)*sin(dlat)*cos(slat)
+                        + (1.875*n**2 + 1.875*n**3)*sin(2.0*dlat)*cos(2.0*slat)
+                        - (35.0/24.0)*n**3*sin(3.0*dlat)*cos(3.0*slat))
+
+    term1 = meridian + NG_N0
+    term2 = nu/2.0*sin_lat*cos_lat
+    term3 = nu/24.0*sin_lat*cos_lat**3*(5.0 - tan2 + 9.0*eta2)
+    term3a = nu/720.0*sin_lat*cos_lat**5*(61.0 - 58.0*tan2 + tan2**2)
+    term4 = nu*cos_lat
+    term5 = nu/6.0*cos_lat**3*(nu/rho - tan2)
+    term6 = nu/120.0*cos_lat**5*(5.0 - 18.0*tan2 + tan2**2 + 14.0*eta2 - 58.0*tan2*eta2)
+
+    dlon = lons - radians(NG_LON0)
+    northings = term1 + term2*dlon**2 + term3*dlon**4 + term3a*dlon**6
+    eastings = NG_E0 + term4*dlon + term5*dlon**3 + term6*dlon**5
+
+    return eastings, northings
+
+def wgs84_to_osgb(lats, lons, use_pyproj = True):
+    '''
+    eastings and northings in metres of arrays of WGS84 latitudes and longitudes in degrees
+    '''
+    lats = asarray(lats, dtype=float64)
+    lons = asarray(lons, dtype=float64)
+
+    if use_pyproj:
+        try:
+            from pyproj import Transformer
+        except ImportError:
+            pass
+        else:
+            transformer = Transformer.from_crs('EPSG:4326', 'EPSG:27700', always_xy = True)
+            return transformer.transform(lons, lats)
+
+    return national_grid(*helmert_wgs84_to_osgb36(lats, lons))
@@ -0,0 +1,235 @@
+#-------------------------------------------------------------------------------
+# Name:        point_extraction.py
+# Purpose:     extract the time series of many points from the NetCDF products in a few chunk aligned reads
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Description: indices of all points are resolved in one vectorised step, points are then grouped by the
+#              storage chunk, or tile, of the lat/lon plane containing them and each tile is read once per block
+#              of time steps, the values of its points being scattered into an (npoints, ntime) array
+#              works with any (time, lat, lon) or (lat, lon) variable created by this package
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+__prog__ = 'point_extraction.py'
+__version__ = '0.0.0'
+__author__ = 's03mm5'
+
+from netCDF4 import Dataset
+from numpy import argsort, asarray, flatnonzero, diff, concatenate, float64, zeros, ones
+from numpy.ma import masked_array, getmaskarray
+
+from weather_datasets import WeatherGrid, get_nc_coords
+from profiling_fns import stage
+
+TILE_NROWS = 32             # rows per tile when the variable is not chunked
+MAX_READ_VALS = 16*1024*1024    # upper limit on values held in memory by a single read
+
+WARNING_STR = '*** Warning *** '
+
+def _tile_shape(shape, chunking, lat_axis):
+    """
+    lat/lon extent of a storage chunk, or a band of rows for contiguous variables
+    """
+    if chunking == 'contiguous' or chunking is None:
+        return min(TILE_NROWS, shape[lat_axis]), shape[lat_axis + 1]
+
+    return chunking[lat_axis], chunking[lat_axis + 1]
+
+def _time_block(shape, chunking, tile_size):
+    """
+    time steps per read: a multiple of the chunk size along time such that a tile read is bounded by MAX_READ_VALS
+    """
+    tchunk = 1 if chunking == 'contiguous' or chunking is None else chunking[0]
+    nblocks = max(1, MAX_READ_VALS // max(1, tile_size*tchunk))
+
+    return min(shape[0], tchunk*nblocks)
+
+class PointExtractor(object, ):
+    '''
+    keeps a product open and extracts the series of batches of points from any of its variables
+    shape and chunking of every variable are read when the product is opened so that, after construction, only
+    _read_tile calls the netCDF library
+    '''
+    def __init__(self, nc_fname, lat_var = 'lat', lon_var = 'lon'):
+        """
+
+        """
+        self.nc_fname = nc_fname
+        self.nc_dset = Dataset(nc_fname, 'r')
+        self.grid = WeatherGrid(self.nc_dset.variables[lat_var][:], self.nc_dset.variables[lon_var][:])
+        self.var_meta = {var_name: (nc_var.shape, nc_var.chunking())
+                                                            for var_name, nc_var in self.nc_dset.variables.items()}
+        self.nreads = 0
+
+    def locate(self, lats, lons, clip_flag = True):
+        """
+        grid indices of each point and whether the point lies within the grid
+        with clip_flag set points outside the grid take the nearest edge cell, as get_nc_coords does
+        """
+        grid = self.grid
+        lat_indx = grid.lat_indices(asarray(lats, dtype=float64).ravel())
+        lon_indx = grid.lon_indices(asarray(lons, dtype=float64).ravel())
+        inside = (lat_indx >= 0) & (lat_indx < grid.nlats) & (lon_indx >= 0) & (lon_indx < grid.nlons)
+
+        noutside = int((~inside).sum())
+        if noutside > 0:
+            print(WARNING_STR + '{} of {} points lie outside the grid of {}{}'.format(noutside, len(inside),
+                                            self.nc_fname, ' - will use nearest edge cells' if clip_flag else ''))
+        if clip_flag:
+            lat_indx, lon_indx = grid.indices(lats, lons)
+            lat_indx = lat_indx.ravel()
+            lon_indx = lon_indx.ravel()
+            inside[:] = True
+
+        return lat_indx, lon_indx, inside
+
+    def extract(self, var_names, lats, lons, time_slice = slice(None), clip_flag = True):
+        """
+        return a dictionary of masked arrays, one per variable, of shape (npoints, ntime) for (time, lat, lon)
+        variables and (npoints,) for (lat, lon) variables; fill values and points outside the grid are masked
+        """
+        if isinstance(var_names, str):
+            var_names = [var_names]
+
+        lat_indx, lon_indx, inside = self.locate(lats, lons, clip_flag)
+
+        rslts = {}
+        for var_name in var_names:
+            rslts[var_name] = self._extract_var(var_name, lat_indx, lon_indx, inside, time_slice)
+
+        return rslts
+
+    def _extract_var(self, var_name, lat_indx, lon_indx, inside, time_slice):
+        """
+        group points by tile and read each tile once for each block of time steps
+        """
+        if var_name not in self.var_meta:
+            raise KeyError('variable {} not in {}'.format(var_name, self.nc_fname))
+
+        nc_var = self.nc_dset.variables[var_name]
+        shape, chunking = self.var_meta[var_name]
+        lat_axis = len(shape) - 2
+        if lat_axis not in (0, 1):
+            raise ValueError('variable {} has shape {}, expected (lat, lon) or (time, lat, lon)'
+                                                                                        .format(var_name, shape))
+        npoints = len(lat_indx)
+        tile_nrows, tile_ncols = _tile_shape(shape, chunking, lat_axis)
+
+        if lat_axis == 1:
+            time_indices = range(*time_slice.indices(shape[0]))
+            ntime = len(time_indices)
+            out_shape = (npoints, ntime)
+        else:
+            ntime = 1
+            out_shape = (npoints,)
+
+        vals = zeros(out_shape, dtype=nc_var.dtype)
+        mask = ones(out_shape, dtype=bool)
+        if npoints == 0 or ntime == 0:
+            return masked_array(vals, mask=mask)
+
+        # sort points by tile so that each tile's points are contiguous
+        # ==============================================================
+        pnts = flatnonzero(inside)
+        ntile_cols = -(-shape[lat_axis + 1] // tile_ncols)
+        tile_keys = (lat_indx[pnts] // tile_nrows)*ntile_cols + lon_indx[pnts] // tile_ncols
+        order = argsort(tile_keys, kind='stable')
+        pnts = pnts[order]
+        tile_keys = tile_keys[order]
+        bounds = concatenate(([0], flatnonzero(diff(tile_keys)) + 1, [len(pnts)]))
+
+        if lat_axis == 1:
+            # a reversed time slice is read in ascending order and the values reversed afterwards
+            # ======================================================================================
+            tblock = _time_block(shape, chunking, tile_nrows*tile_ncols)
+            if time_indices.step < 0:
+                time_indices = time_indices[::-1]
+            time_blocks = []
+            for indx in range(0, ntime, tblock):
+                block_indices = time_indices[indx:indx + tblock]
+                time_blocks.append((indx, slice(block_indices[0], block_indices[-1] + 1, block_indices.step)))
+        else:
+            time_blocks = [(0, None)]
+
+        for tile_strt, tile_end in zip(bounds[:-1], bounds[1:]):
+            tile_pnts = pnts[tile_strt:tile_end]
+            rows = lat_indx[tile_pnts]
+            cols = lon_indx[tile_pnts]
+            tile_key = int(tile_keys[tile_strt])
+            tile_rows = (tile_key // ntile_cols)*tile_nrows
+            tile_cols = (tile_key % ntile_cols)*tile_ncols
+            tile = (slice(tile_rows, min(tile_rows + tile_nrows, shape[lat_axis])),
+                    slice(tile_cols, min(tile_cols + tile_ncols, shape[lat_axis + 1])))
+            bbox = (slice(int(rows.min()), int(rows.max()) + 1), slice(int(cols.min()), int(cols.max()) + 1))
+
+            for out_strt, tslice in time_blocks:
+                block, row0, col0 = self._read_tile(nc_var, var_name, tslice, tile, bbox)
+
+                block_vals = masked_array(block)
+                block_mask = getmaskarray(block_vals)
+                block_vals = block_vals.data
+                if tslice is None:
+                    vals[tile_pnts] = block_vals[rows - row0, cols - col0]
+                    mask[tile_pnts] = block_mask[rows - row0, cols - col0]
+                else:
+                    out_end = out_strt + block_vals.shape[0]
+                    vals[tile_pnts, out_strt:out_end] = block_vals[:, rows - row0, cols - col0].T
+                    mask[tile_pnts, out_strt:out_end] = block_mask[:, rows - row0, cols - col0].T
+
+        if lat_axis == 1 and time_slice.indices(shape[0])[2] < 0:
+            return masked_array(vals[:, ::-1], mask=mask[:, ::-1])
+
+        return masked_array(vals, mask=mask)
+
+    def _read_tile(self, nc_var, var_name, tslice, tile, bbox):
+        """
+        read the bounding box of the points within a tile for a block of time steps, tslice, or for a (lat, lon)
+        variable when tslice is None; returns the values and the indices of their first row and column
+        overridden to read, and cache, whole tiles
+        """
+        with stage('read') as stg:
+            if tslice is None:
+                block = nc_var[bbox]
+            else:
+                block = nc_var[(tslice,) + bbox]
+            stg.nbytes = block.nbytes
+        self.nreads += 1
+
+        return block, bbox[0].start, bbox[1].start
+
+    def close(self):
+        """
+
+        """
+        self.nc_dset.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+def extract_points(nc_fname, var_names, lats, lons, time_slice = slice(None), clip_flag = True):
+    '''
+    one-off extraction - open nc_fname, extract the series of every point for each variable and close
+    '''
+    with PointExtractor(nc_fname) as extractor:
+        return extractor.extract(var_names, lats, lons, time_slice, clip_flag)
+
+def extract_points_by_cell(lggr, wthr_dict, nc_fname, var_name, lats, lons):
+    '''
+    reference implementation: one get_nc_coords call and one read per point, as the simulation scripts do
+    '''
+    series = []
+    with Dataset(nc_fname, 'r') as nc_dset:
+        nc_var = nc_dset.variables[var_name]
+        for lat, lon in zip(lats, lons):
+            lat_indx, lon_indx = get_nc_coords(lggr, wthr_dict, lat, lon)
+            if nc_var.ndim == 3:
+                series.append(nc_var[:, lat_indx, lon_indx])
+            else:
+                series.append(nc_var[lat_indx, lon_indx])
+
+    return series
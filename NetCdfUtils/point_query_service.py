@@ -0,0 +1,340 @@
+#-------------------------------------------------------------------------------
+# Name:        point_query_service.py
+# Purpose:     local HTTP service which keeps the weather datasets open and answers batched point queries
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Description: datasets are described by read_wthr_dsets_detail; decompressed chunks, or tiles, are held in a
+#              size bounded LRU cache shared by all clients so that simulation jobs on the same host read each
+#              chunk from disk once rather than once per job
+#              listens on localhost only, e.g.  python point_query_service.py --wthr_dir E:\GlobalEcosseData
+#              requests:
+#                   POST /points     {"resource": "ECLIPS2_Mnth", "metric": "precip", "lats": [...], "lons": [...],
+#                                     "time_strt": 0, "time_end": null}
+#                   GET  /stats      cache hits, misses, evictions and bytes held
+#                   GET  /resources  weather resources and their variables
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+__prog__ = 'point_query_service.py'
+__version__ = '0.0.0'
+__author__ = 's03mm5'
+
+from argparse import ArgumentParser
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Lock
+from urllib.request import Request, urlopen
+import json
+
+from numpy import array, float64
+from numpy.ma import masked_array, masked_invalid, getmaskarray
+
+from point_extraction import PointExtractor
+from profiling_fns import stage
+
+HOST = '127.0.0.1'
+PORT = 8765
+CACHE_MB = 512
+METRICS = {'precip': ('fn_precip', 'precip_var'), 'tas': ('fn_tas', 'tas_var')}
+
+ERROR_STR = '*** Error *** '
+
+_READ_LOCK = Lock()     # the HDF5 library is not thread safe, even for different files
+
+class ChunkCache(object, ):
+    '''
+    least recently used cache of tiles keyed by file, variable, tile origin and time block
+    '''
+    def __init__(self, max_bytes = CACHE_MB*1024*1024):
+        """
+
+        """
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.tiles = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = Lock()
+
+    def get(self, key):
+        """
+        return tile or None; a hit moves the tile to the most recently used end
+        """
+        with self.lock:
+            tile = self.tiles.get(key)
+            if tile is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.tiles.move_to_end(key)
+
+        return tile
+
+    def put(self, key, tile):
+        """
+        add tile and evict least recently used tiles until within the size limit
+        tiles larger than the cache are not held
+        """
+        if tile.nbytes > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.tiles:
+                return
+
+            self.tiles[key] = tile
+            self.nbytes += tile.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self.tiles.popitem(last = False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def stats(self):
+        """
+
+        """
+        nrequests = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': round(self.hits/nrequests, 4) if nrequests > 0 else None, 'ntiles': len(self.tiles),
+                'mbytes': round(self.nbytes/(1024*1024), 2), 'max_mbytes': round(self.max_bytes/(1024*1024), 2)}
+
+class CachedPointExtractor(PointExtractor):
+    '''
+    reads whole tiles through a shared ChunkCache so that any later query touching the same tile is served
+    from memory; every call to the netCDF library - opening, variable metadata, tile reads and closing - is
+    serialised
+    '''
+    def __init__(self, nc_fname, cache, lat_var = 'lat', lon_var = 'lon'):
+        """
+
+        """
+        with _READ_LOCK:
+            PointExtractor.__init__(self, nc_fname, lat_var, lon_var)
+        self.cache = cache
+
+    def _read_tile(self, nc_var, var_name, tslice, tile, bbox):
+        """
+        whole tile from the cache, reading and caching it on a miss
+        """
+        time_key = None if tslice is None else (tslice.start, tslice.stop, tslice.step)
+        key = (self.nc_fname, var_name, tile[0].start, tile[1].start, time_key)
+
+        block = self.cache.get(key)
+        if block is None:
+            with _READ_LOCK, stage('read') as stg:
+                block = nc_var[tile] if tslice is None else nc_var[(tslice,) + tile]
+                stg.nbytes = block.nbytes
+            self.nreads += 1
+            block = masked_array(block)
+            self.cache.put(key, block)
+
+        return block, tile[0].start, tile[1].start
+
+    def close(self):
+        """
+
+        """
+        with _READ_LOCK:
+            PointExtractor.close(self)
+
+class PointQueryService(object, ):
+    '''
+    open datasets of each weather resource, created on first use, sharing one chunk cache
+    '''
+    def __init__(self, wthr_sets, cache_mb = CACHE_MB):
+        """
+        wthr_sets is the dictionary assembled by read_wthr_dsets_detail
+        """
+        self.wthr_sets = wthr_sets
+        self.cache = ChunkCache(int(cache_mb*1024*1024))
+        self.extractors = {}
+        self.lock = Lock()
+        self.nqueries = 0
+        self.npoints = 0
+
+    def resources(self):
+        """
+
+        """
+        return {wthr_rsrce: {metric: wthr_set[var_key] for metric, (fn_key, var_key) in METRICS.items()}
+                                                                for wthr_rsrce, wthr_set in self.wthr_sets.items()}
+
+    def _extractor(self, nc_fname):
+        """
+
+        """
+        with self.lock:
+            if nc_fname not in self.extractors:
+                self.extractors[nc_fname] = CachedPointExtractor(nc_fname, self.cache)
+
+            return self.extractors[nc_fname]
+
+    def query(self, wthr_rsrce, metric, lats, lons, time_strt = 0, time_end = None):
+        """
+        masked (npoints, ntime) array of the metric of a weather resource at each point
+        tiles are cached per block of time steps so queries over the same time range share the cache
+        """
+        if wthr_rsrce not in self.wthr_sets:
+            raise KeyError('weather resource {} not available'.format(wthr_rsrce))
+        if metric not in METRICS:
+            raise KeyError('metric {} must be one of: {}'.format(metric, ', '.join(METRICS)))
+
+        fn_key, var_key = METRICS[metric]
+        wthr_set = self.wthr_sets[wthr_rsrce]
+        var_name = wthr_set[var_key]
+
+        extractor = self._extractor(wthr_set[fn_key])
+        rslt = extractor.extract(var_name, lats, lons, slice(time_strt, time_end))[var_name]
+
+        with self.lock:
+            self.nqueries += 1
+            self.npoints += len(rslt)
+
+        return rslt
+
+    def stats(self):
+        """
+
+        """
+        return {'queries': self.nqueries, 'points': self.npoints, 'open_datasets': sorted(self.extractors),
+                                                                                        'cache': self.cache.stats()}
+
+    def close(self):
+        """
+
+        """
+        for extractor in self.extractors.values():
+            extractor.close()
+        self.extractors = {}
+
+def _to_json(rslt):
+    '''
+    nested lists of floats with None for masked values
+    '''
+    vals = rslt.astype(float64).filled(0.0).tolist()
+    for row_vals, row_mask in zip(vals, getmaskarray(rslt).tolist()):
+        for indx in [indx for indx, masked in enumerate(row_mask) if masked]:
+            row_vals[indx] = None
+
+    return vals
+
+class _QueryHandler(BaseHTTPRequestHandler):
+    '''
+    JSON in and out; masked values are returned as null
+    '''
+    service = None
+
+    def _reply(self, status, content):
+        """
+
+        """
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._reply(200, self.service.stats())
+        elif self.path == '/resources':
+            self._reply(200, self.service.resources())
+        else:
+            self._reply(404, {'error': 'unknown path ' + self.path})
+
+    def do_POST(self):
+        if self.path != '/points':
+            self._reply(404, {'error': 'unknown path ' + self.path})
+            return
+
+        try:
+            nbytes = int(self.headers.get('Content-Length', 0))
+            rqst = json.loads(self.rfile.read(nbytes).decode('utf-8'))
+            rslt = self.service.query(rqst['resource'], rqst['metric'], rqst['lats'], rqst['lons'],
+                                                        rqst.get('time_strt', 0), rqst.get('time_end'))
+        except (KeyError, ValueError, TypeError) as err:
+            self._reply(400, {'error': str(err)})
+            return
+        except (OSError, RuntimeError) as err:
+            self._reply(500, {'error': str(err)})      # e.g. a dataset which is missing or cannot be read
+            return
+
+        self._reply(200, {'resource': rqst['resource'], 'metric': rqst['metric'],
+                                                                                    'values': _to_json(rslt)})
+
+    def log_message(self, format, *args):
+        pass        # a line per query would swamp the console
+
+def serve(wthr_sets, host = HOST, port = PORT, cache_mb = CACHE_MB):
+    '''
+    serve queries until interrupted
+    '''
+    service = PointQueryService(wthr_sets, cache_mb)
+    handler = type('QueryHandler', (_QueryHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    print('Point query service listening on http://{}:{} with {} MB chunk cache'.format(host, port, cache_mb))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print('Point query service stopped - cache statistics: ' + json.dumps(service.cache.stats()))
+        service.close()
+
+    return
+
+def query_points(wthr_rsrce, metric, lats, lons, time_strt = 0, time_end = None, host = HOST, port = PORT):
+    '''
+    client: masked (npoints, ntime) array from a running service
+    '''
+    rqst = {'resource': wthr_rsrce, 'metric': metric, 'lats': [float(lat) for lat in lats],
+                            'lons': [float(lon) for lon in lons], 'time_strt': time_strt, 'time_end': time_end}
+    url = 'http://{}:{}/points'.format(host, port)
+    request = Request(url, data = json.dumps(rqst).encode('utf-8'), headers = {'Content-Type': 'application/json'})
+    with urlopen(request) as response:
+        rslt = json.loads(response.read().decode('utf-8'))
+
+    return masked_invalid(array(rslt['values'], dtype=float64))
+
+def service_stats(host = HOST, port = PORT):
+    '''
+    client: statistics of a running service
+    '''
+    with urlopen('http://{}:{}/stats'.format(host, port)) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+class _Form(object, ):
+    '''
+    minimal stand in for the GUI form required by read_wthr_dsets_detail
+    '''
+    def __init__(self, wthr_dir):
+        self.settings = {'wthr_dir': wthr_dir}
+
+def main():
+    '''
+    describe the weather resources under wthr_dir and serve them
+    '''
+    from weather_datasets import read_wthr_dsets_detail
+    from eclips_reorg import WTHR_SET_DEFNS
+
+    parser = ArgumentParser(description='Serve batched point queries of the weather datasets on localhost')
+    parser.add_argument('--wthr_dir', required=True, help='root directory of the weather resources')
+    parser.add_argument('--resources', nargs='+', choices=list(WTHR_SET_DEFNS), help='default is all resources')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--cache_mb', type=float, default=CACHE_MB, help='size limit of the chunk cache')
+    args = parser.parse_args()
+
+    rsrces = list(WTHR_SET_DEFNS) if args.resources is None else args.resources
+    form = _Form(args.wthr_dir)
+    if not read_wthr_dsets_detail(form, {rsrc: WTHR_SET_DEFNS[rsrc] for rsrc in rsrces}) or not form.wthr_sets:
+        print(ERROR_STR + 'no weather resources found in ' + args.wthr_dir)
+        return
+
+    serve(form.wthr_sets, HOST, args.port, args.cache_mb)
+
+if __name__ == '__main__':
+    main()
@@ -30,4 +30,4 @@ def subtract_turkey(form):
     hwsd_mu_globals = HWSD_mu_globals_csv(form, hwsd_csv_fname)
 
     # print('\n' + descriptor + ' configuration file ' + config_file)
-    return
\ No newline at end of file
+    return True
\ No newline at end of file
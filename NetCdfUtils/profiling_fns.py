@@ -0,0 +1,171 @@
+#-------------------------------------------------------------------------------
+# Name:        profiling_fns.py
+# Purpose:     opt-in per-stage timing of pipelines: dataset open, variable read, variable write, compute
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Description: stages are wrapped in the stage context manager or the timed decorator; when profiling is not
+#              enabled stage returns a shared do-nothing context manager, so nothing is allocated, but stages
+#              should still be kept out of per-cell loops
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+__prog__ = 'profiling_fns.py'
+__version__ = '0.0.0'
+__author__ = 's03mm5'
+
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter, strftime
+import json
+
+STAGE_ORDER = ['open', 'coords', 'read', 'compute', 'write']
+
+class _TimedStage(object, ):
+    '''
+    handed to the body of a stage so that it can record the number of bytes moved
+    '''
+    __slots__ = ('profiler', 'name', 'nbytes', 'strt')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.nbytes = 0
+        self.strt = 0.0
+
+    def __enter__(self):
+        self.strt = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.profiler.add(self.name, perf_counter() - self.strt, self.nbytes)
+        return False
+
+class _NullStage(object, ):
+    '''
+    used when profiling is not enabled; bytes recorded by the body are discarded
+    '''
+    __slots__ = ('nbytes',)
+
+    def __init__(self):
+        self.nbytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class StageProfiler(object, ):
+    '''
+    aggregates wall time, call count and bytes for each named stage
+    '''
+    def __init__(self, descr):
+        """
+
+        """
+        self.descr = descr
+        self.stages = {}
+        self.strt_time = perf_counter()
+
+    def add(self, name, elapsed, nbytes):
+        """
+
+        """
+        if name not in self.stages:
+            self.stages[name] = {'calls': 0, 'seconds': 0.0, 'bytes': 0}
+
+        stage = self.stages[name]
+        stage['calls'] += 1
+        stage['seconds'] += elapsed
+        stage['bytes'] += nbytes
+
+    def summary(self):
+        """
+        stages in conventional order followed by any others, plus wall time of the job
+        """
+        names = [name for name in STAGE_ORDER if name in self.stages]
+        names += sorted(name for name in self.stages if name not in STAGE_ORDER)
+        wall_time = perf_counter() - self.strt_time
+
+        rows = []
+        for name in names:
+            stage = self.stages[name]
+            rows.append({'stage': name, 'calls': stage['calls'], 'seconds': stage['seconds'], 'bytes': stage['bytes'],
+                         'percent': 100.0*stage['seconds']/wall_time if wall_time > 0 else 0.0})
+
+        return {'descr': self.descr, 'wall_time': wall_time, 'stages': rows}
+
+    def report(self, out_fname = None):
+        """
+        print summary table and optionally append it as JSON to out_fname
+        """
+        summary = self.summary()
+        print('\nTiming for ' + self.descr + ' - wall time: {:.2f}s'.format(summary['wall_time']))
+        print('\t{:<12s}{:>10s}{:>12s}{:>8s}{:>12s}{:>10s}'.format('stage', 'calls', 'seconds', '%', 'MB', 'MB/s'))
+        for row in summary['stages']:
+            mbytes = row['bytes']/1e6
+            rate = mbytes/row['seconds'] if row['seconds'] > 0 else 0.0
+            print('\t{:<12s}{:>10,d}{:>12.3f}{:>8.1f}{:>12.1f}{:>10.1f}'
+                            .format(row['stage'], row['calls'], row['seconds'], row['percent'], mbytes, rate))
+
+        if out_fname is not None:
+            summary['time'] = strftime('%Y-%m-%dT%H:%M:%S')
+            with open(out_fname, 'a') as fprof:
+                fprof.write(json.dumps(summary) + '\n')
+            print('Appended timing summary to ' + out_fname)
+
+        return summary
+
+_active_profiler = None
+
+def stage(name):
+    '''
+    context manager timing the body as stage name; the body may set nbytes of the object it is given
+    '''
+    profiler = _active_profiler
+    if profiler is None:
+        return _NULL_STAGE
+
+    return _TimedStage(profiler, name)
+
+def timed(name):
+    '''
+    decorator equivalent of stage; bytes are taken from the nbytes attribute of the result if it has one
+    '''
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _active_profiler
+            if profiler is None:
+                return func(*args, **kwargs)
+
+            strt = perf_counter()
+            rslt = func(*args, **kwargs)
+            profiler.add(name, perf_counter() - strt, getattr(rslt, 'nbytes', 0))
+            return rslt
+
+        return wrapper
+
+    return decorator
+
+@contextmanager
+def profiled_job(descr, enabled = True, out_fname = None):
+    '''
+    enable profiling for the duration of a job and report a summary at the end
+    '''
+    global _active_profiler
+    if not enabled:
+        yield None
+        return
+
+    previous = _active_profiler
+    profiler = StageProfiler(descr)
+    _active_profiler = profiler
+    try:
+        yield profiler
+    finally:
+        _active_profiler = previous
+        profiler.report(out_fname)
@@ -0,0 +1,298 @@
+#-------------------------------------------------------------------------------
+# Name:        qa_scan.py
+# Purpose:     one pass quality statistics of the variables of generated NetCDF files and Zarr stores
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Description: each variable is read raw, without masking, in blocks along its first axis aligned to its chunks;
+#              for each time step and for the variable as a whole are counted: valid values, NaNs, fill values,
+#              zeros and values outside the expected range, together with minimum, maximum and mean of the valid
+#              values; variables may be scanned by separate processes
+#              the report is written beside the file as <fname>.qa.json with per time step statistics held
+#              column by column, and <fname>.qa.csv with a row per time step and a row, step "all", per variable
+#              e.g.   python qa_scan.py Tairalign_RCP45_CLMcom_CCLM_1961_2100.nc --nprocs 2
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+__prog__ = 'qa_scan.py'
+__version__ = '0.0.0'
+__author__ = 's03mm5'
+
+from argparse import ArgumentParser
+from multiprocessing import Pool
+from time import strftime
+import csv
+import json
+
+from numpy import isnan, where, zeros, full, float64, int64, inf, prod, issubdtype, floating
+
+from zarr_backend import open_dataset
+from profiling_fns import stage
+from spec_utilities import pool_map
+
+QA_FLAG = True          # scan outputs at the end of each pipeline, overridden by the qa_scan setting
+QA_NPROCS = 1
+MAX_MB = 256
+JSON_SUFFIX = '.qa.json'
+CSV_SUFFIX = '.qa.csv'
+STATS = ['count', 'min', 'max', 'mean', 'nan', 'fill', 'zero', 'out_of_range']
+
+# expected ranges of the weather variables, used when a variable has no valid_min, valid_max or valid_range
+# =========================================================================================================
+VALID_RANGES = {'Tairalign': (-70.0, 60.0), 'tas': (-70.0, 60.0), 'tg': (-70.0, 60.0),
+                'Precipalign': (0.0, 3000.0), 'precip': (0.0, 3000.0), 'pp': (0.0, 3000.0),
+                'Ndep': (0.0, None), 'Nmanure': (0.0, None), 'Nmineral': (0.0, None)}
+
+WARNING_STR = '*** Warning *** '
+
+def _valid_range(nc_var):
+    """
+    lower and upper limits, either of which may be None, from the attributes of nc_var or VALID_RANGES
+    """
+    attrs = nc_var.ncattrs()
+    if 'valid_range' in attrs:
+        return tuple(float(val) for val in nc_var.getncattr('valid_range'))
+
+    if 'valid_min' in attrs or 'valid_max' in attrs:
+        return (float(nc_var.getncattr('valid_min')) if 'valid_min' in attrs else None,
+                float(nc_var.getncattr('valid_max')) if 'valid_max' in attrs else None)
+
+    return VALID_RANGES.get(nc_var.name, (None, None))
+
+def _fill_values(nc_var):
+    """
+    values which mark missing data: the fill value and missing value attributes
+    """
+    attrs = nc_var.ncattrs()
+    return [nc_var.getncattr(attr) for attr in ('_FillValue', 'missing_value') if attr in attrs]
+
+class StepStats(object, ):
+    '''
+    statistics of each step along the first axis of a variable, accumulated block by block
+    '''
+    def __init__(self, nsteps):
+        """
+
+        """
+        self.count = zeros(nsteps, dtype=int64)
+        self.sum = zeros(nsteps, dtype=float64)
+        self.min = full(nsteps, inf)
+        self.max = full(nsteps, -inf)
+        self.nan = zeros(nsteps, dtype=int64)
+        self.fill = zeros(nsteps, dtype=int64)
+        self.zero = zeros(nsteps, dtype=int64)
+        self.out_of_range = zeros(nsteps, dtype=int64)
+
+    def add(self, step_strt, vals, fill_values, valid_range):
+        """
+        vals is a raw block, unmasked, whose first axis runs from step_strt
+        """
+        step_end = step_strt + vals.shape[0]
+        vals = vals.reshape(vals.shape[0], -1)
+        steps = slice(step_strt, step_end)
+
+        fill = zeros(vals.shape, dtype=bool)
+        nans = isnan(vals) if issubdtype(vals.dtype, floating) else zeros(vals.shape, dtype=bool)
+        for fill_value in fill_values:
+            if issubdtype(vals.dtype, floating) and isnan(fill_value):
+                fill |= nans
+            else:
+                fill |= vals == fill_value
+        nans &= ~fill
+        valid = ~(fill | nans)
+
+        lo, hi = valid_range
+        out_of_range = zeros(vals.shape, dtype=bool)
+        if lo is not None:
+            out_of_range |= vals < lo
+        if hi is not None:
+            out_of_range |= vals > hi
+
+        self.count[steps] += valid.sum(axis=1)
+        self.sum[steps] += where(valid, vals, 0).sum(axis=1, dtype=float64)
+        self.min[steps] = where(valid, vals, inf).min(axis=1, initial=inf)
+        self.max[steps] = where(valid, vals, -inf).max(axis=1, initial=-inf)
+        self.nan[steps] += nans.sum(axis=1)
+        self.fill[steps] += fill.sum(axis=1)
+        self.zero[steps] += (valid & (vals == 0)).sum(axis=1)
+        self.out_of_range[steps] += (valid & out_of_range).sum(axis=1)
+
+    def steps(self):
+        """
+        per step statistics as lists, None where a step has no valid values
+        """
+        has_data = self.count > 0
+        means = self.sum / where(has_data, self.count, 1)
+        rslts = {'count': self.count.tolist()}
+        for stat, vals in (('min', self.min), ('max', self.max), ('mean', means)):
+            rslts[stat] = [float(val) if flag else None for val, flag in zip(vals, has_data)]
+        for stat in ('nan', 'fill', 'zero', 'out_of_range'):
+            rslts[stat] = getattr(self, stat).tolist()
+
+        return rslts
+
+    def totals(self):
+        """
+        statistics of the variable as a whole
+        """
+        count = int(self.count.sum())
+        return {'count': count, 'min': float(self.min.min()) if count > 0 else None,
+                'max': float(self.max.max()) if count > 0 else None,
+                'mean': float(self.sum.sum() / count) if count > 0 else None, 'nan': int(self.nan.sum()),
+                'fill': int(self.fill.sum()), 'zero': int(self.zero.sum()), 'out_of_range': int(self.out_of_range.sum()),
+                'steps_without_data': int((self.count == 0).sum())}
+
+def scan_var(nc_var, max_mb = MAX_MB):
+    '''
+    statistics of a variable: totals and, for variables with a leading time dimension, per time step
+    '''
+    nc_var.set_auto_maskandscale(False)
+    fill_values = _fill_values(nc_var)
+    valid_range = _valid_range(nc_var)
+
+    if nc_var.ndim == 0:
+        stats = StepStats(1)
+        with stage('read'):
+            stats.add(0, nc_var[...].reshape(1, 1), fill_values, valid_range)
+        return {'totals': stats.totals(), 'steps': None, 'valid_range': list(valid_range)}
+
+    nsteps = nc_var.shape[0]
+    chunking = nc_var.chunking()
+    tchunk = 1 if chunking == 'contiguous' or chunking is None else chunking[0]
+    step_nbytes = max(1, int(prod(nc_var.shape[1:])))*(nc_var.dtype.itemsize + 8 + 4)
+    block = max(tchunk, (int(max_mb*1024*1024) // step_nbytes // tchunk)*tchunk)
+
+    stats = StepStats(nsteps)
+    for step_strt in range(0, nsteps, block):
+        with stage('read') as stg:
+            vals = nc_var[step_strt:min(step_strt + block, nsteps)]
+            stg.nbytes = vals.nbytes
+
+        with stage('compute'):
+            stats.add(step_strt, vals, fill_values, valid_range)
+
+    per_step = nc_var.ndim > 1 and nc_var.dimensions[0] == 'time'
+
+    return {'totals': stats.totals(), 'steps': stats.steps() if per_step else None, 'valid_range': list(valid_range)}
+
+def _scan_worker(task):
+    """
+    scan one variable of a file in a separate process
+    """
+    fname, var_name, max_mb = task
+    nc_dset = open_dataset(fname, 'r')
+    rslt = scan_var(nc_dset.variables[var_name], max_mb)
+    nc_dset.close()
+
+    return rslt
+
+def scan_file(fname, var_names = None, nprocs = QA_NPROCS, max_mb = MAX_MB):
+    '''
+    statistics of each variable of a NetCDF file or Zarr store, by default every variable
+    '''
+    nc_dset = open_dataset(fname, 'r')
+    if var_names is None:
+        var_names = list(nc_dset.variables)
+
+    if nprocs > 1 and len(var_names) > 1:
+        nc_dset.close()
+        with Pool(processes = min(nprocs, len(var_names))) as pool:
+            rslts = pool_map(pool, _scan_worker, [(fname, var_name, max_mb) for var_name in var_names])
+        return dict(zip(var_names, rslts))
+
+    rslts = {var_name: scan_var(nc_dset.variables[var_name], max_mb) for var_name in var_names}
+    nc_dset.close()
+
+    return rslts
+
+def _warnings(var_name, totals):
+    """
+    lines describing anything unexpected in the totals of a variable
+    """
+    mess = []
+    if totals['count'] == 0:
+        mess.append('has no valid values')
+    if totals['nan'] > 0:
+        mess.append('has {} NaNs which are not fill values'.format(totals['nan']))
+    if totals['out_of_range'] > 0:
+        mess.append('has {} values out of range'.format(totals['out_of_range']))
+    if totals['count'] > 0 and totals['steps_without_data'] > 0:
+        mess.append('has {} time steps without valid values'.format(totals['steps_without_data']))
+
+    return [WARNING_STR + 'variable ' + var_name + ' ' + line for line in mess]
+
+def write_report(fname, rslts):
+    '''
+    write the JSON and CSV reports of fname and return their names
+    '''
+    json_fname = fname.rstrip('/\\') + JSON_SUFFIX
+    with open(json_fname, 'w') as fobj:
+        json.dump({'file': fname, 'created': strftime('%H:%M %d-%m-%Y'), 'variables': rslts}, fobj)
+
+    csv_fname = fname.rstrip('/\\') + CSV_SUFFIX
+    with open(csv_fname, 'w', newline='') as fobj:
+        writer = csv.writer(fobj)
+        writer.writerow(['variable', 'step'] + STATS)
+        for var_name, rslt in rslts.items():
+            writer.writerow([var_name, 'all'] + [rslt['totals'][stat] for stat in STATS])
+            steps = rslt['steps']
+            if steps is None:
+                continue
+            for istep, row in enumerate(zip(*[steps[stat] for stat in STATS])):
+                writer.writerow([var_name, istep] + list(row))
+
+    return json_fname, csv_fname
+
+def qa_report(fname, var_names = None, nprocs = QA_NPROCS, max_mb = MAX_MB):
+    '''
+    scan fname, print a line per variable and any warnings and write the reports; returns the scan results
+    '''
+    print('\nQA scan of ' + fname)
+    rslts = scan_file(fname, var_names, nprocs, max_mb)
+
+    for var_name, rslt in rslts.items():
+        totals = rslt['totals']
+        mean = 'n/a' if totals['mean'] is None else '{:.4g}'.format(totals['mean'])
+        print('\t{:<16s} valid: {:>12d}  min: {}  max: {}  mean: {}  NaN: {}  fill: {}  zero: {}'
+                    .format(var_name, totals['count'], totals['min'], totals['max'], mean, totals['nan'],
+                                                                                    totals['fill'], totals['zero']))
+        for line in _warnings(var_name, totals):
+            print(line)
+
+    json_fname, csv_fname = write_report(fname, rslts)
+    print('Wrote QA reports ' + json_fname + ' and ' + csv_fname)
+
+    return rslts
+
+def run_qa(settings, fnames):
+    '''
+    called at the end of a pipeline: scan each output if the qa_scan setting, default QA_FLAG, is set
+    '''
+    if not settings.get('qa_scan', QA_FLAG):
+        return
+
+    nprocs = settings.get('qa_nprocs', QA_NPROCS)
+    for fname in fnames:
+        try:
+            qa_report(fname, nprocs = nprocs)
+        except (OSError, RuntimeError, KeyError) as err:
+            print(WARNING_STR + 'QA scan of ' + fname + ' failed: ' + str(err))
+
+    return
+
+def main():
+    '''
+
+    '''
+    parser = ArgumentParser(description='One pass QA statistics of the variables of NetCDF files or Zarr stores')
+    parser.add_argument('fnames', nargs='+', help='files or stores to scan')
+    parser.add_argument('--vars', nargs='+', help='default is every variable')
+    parser.add_argument('--nprocs', type=int, default=QA_NPROCS, help='processes scanning variables')
+    parser.add_argument('--max_mb', type=float, default=MAX_MB, help='memory limit for blocks read')
+    args = parser.parse_args()
+
+    for fname in args.fnames:
+        qa_report(fname, args.vars, args.nprocs, args.max_mb)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+#-------------------------------------------------------------------------------
+# Name:        rechunk_nc.py
+# Purpose:     copy (time, lat, lon) products written map by map into a layout where each chunk holds the whole
+#              time series of a small tile of cells
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Description: memory is bounded by max_mb; if a band of source chunk rows spanning every time step fits in
+#              memory the copy is made in one pass, otherwise in two: the first pass reads each source chunk
+#              once, in blocks of time steps, into an uncompressed scratch file chunked by time block and tile,
+#              the second reads whole tiles from the scratch file and writes them to the output
+#              other variables, dimensions and attributes are copied unaltered; the time dimension of the
+#              output is fixed rather than unlimited; the output may be a Zarr store, see zarr_backend.py
+#              e.g.   python rechunk_nc.py Tairalign_RCP45_CLMcom_CCLM_1961_2100.nc --tile 4 --max_mb 1024
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+__prog__ = 'rechunk_nc.py'
+__version__ = '0.0.0'
+__author__ = 's03mm5'
+
+from argparse import ArgumentParser
+from os.path import splitext, split, join, isfile
+from os import remove
+
+from netCDF4 import Dataset
+
+from nc_schema_writer import schema_from_dset
+from atomic_output import temp_fname, finalise_output, discard_temp, check_existing_output
+from spec_utilities import ProgressMeter
+from profiling_fns import stage
+from zarr_backend import open_dataset, is_zarr, ZARR_EXT
+
+CELL_TILE = 4           # lat and lon extent of each output chunk - a per-cell read decompresses CELL_TILE**2 series
+MAX_MB = 512
+OUT_SUFFIX = '_cells'
+
+ERROR_STR = '*** Error *** '
+
+def _chunking(nc_var):
+    """
+    chunk shape of nc_var, contiguous variables being treated as chunked by single maps
+    """
+    chunking = nc_var.chunking()
+    if chunking == 'contiguous' or chunking is None:
+        return (1,) + nc_var.shape[1:]
+
+    return tuple(chunking)
+
+def _round_down(nvals, multiple):
+    """
+    largest multiple of multiple not exceeding nvals, but at least multiple
+    """
+    return max(multiple, (nvals // multiple)*multiple)
+
+def cell_chunks(nc_var, tile = CELL_TILE):
+    '''
+    output chunk shape: every time step of a tile x tile block of cells
+    '''
+    ntime, nlats, nlons = nc_var.shape
+    return ntime, min(tile, nlats), min(tile, nlons)
+
+def rechunk_targets(nc_dset):
+    '''
+    names of the three dimensional variables of a dataset
+    '''
+    return [var_name for var_name, nc_var in nc_dset.variables.items() if nc_var.ndim == 3]
+
+def _copy_blocks(src_var, dst_var, time_step, row_step, col_step, meter):
+    """
+    copy src_var to dst_var in (time_step, row_step, col_step) blocks, raw values without masking
+    """
+    ntime, nlats, nlons = src_var.shape
+    for row_strt in range(0, nlats, row_step):
+        row_end = min(row_strt + row_step, nlats)
+        for col_strt in range(0, nlons, col_step):
+            col_end = min(col_strt + col_step, nlons)
+            for time_strt in range(0, ntime, time_step):
+                time_end = min(time_strt + time_step, ntime)
+
+                with stage('read') as stg:
+                    block = src_var[time_strt:time_end, row_strt:row_end, col_strt:col_end]
+                    stg.nbytes = block.nbytes
+
+                with stage('write') as stg:
+                    dst_var[time_strt:time_end, row_strt:row_end, col_strt:col_end] = block
+                    stg.nbytes = block.nbytes
+
+                meter.tick()
+                meter.add_bytes(nread = block.nbytes, nwritten = block.nbytes)
+
+    return
+
+def _plan(src_var, out_chunks, max_bytes):
+    """
+    block shapes of one pass, or of both passes when the second element of the result is not None
+    """
+    ntime, nlats, nlons = src_var.shape
+    itemsize = src_var.dtype.itemsize
+    src_tchunk, src_rchunk, src_cchunk = _chunking(src_var)
+    out_tchunk, out_rchunk, out_cchunk = out_chunks
+
+    # band aligned to the row chunks of both source and output
+    # ========================================================
+    band_nrows = -(-max(src_rchunk, out_rchunk) // out_rchunk)*out_rchunk
+    row_nbytes = ntime*nlons*itemsize
+
+    if band_nrows*row_nbytes <= max_bytes:
+        band_nrows = min(nlats, _round_down(max_bytes // row_nbytes, band_nrows))
+        return (ntime, band_nrows, nlons), None
+
+    # second pass reads whole tiles of the scratch file, as many columns as memory allows
+    # =================================================================================
+    tile_nbytes = ntime*out_rchunk*out_cchunk*itemsize
+    if tile_nbytes > max_bytes:
+        raise ValueError('time series of a {} x {} tile need {:.1f} MB, more than the limit of {:.1f} MB'
+                        .format(out_rchunk, out_cchunk, tile_nbytes/(1024*1024), max_bytes/(1024*1024)))
+
+    ncols = min(nlons, _round_down(max_bytes // (ntime*out_rchunk*itemsize), out_cchunk))
+    pass2 = (ntime, out_rchunk, ncols)
+
+    # first pass reads bands of source chunk rows, as many time steps as memory allows
+    # ===============================================================================
+    ntimes = _round_down(max_bytes // (band_nrows*nlons*itemsize), src_tchunk)
+    pass1 = (min(ntime, ntimes), band_nrows, nlons)
+
+    return pass1, pass2
+
+def rechunk_nc(src_fname, out_fname = None, var_names = None, tile = CELL_TILE, max_mb = MAX_MB,
+                                                                        scratch_dir = None, delete_flag = True):
+    '''
+    write a copy of src_fname in which each chunk of var_names, by default every (time, lat, lon) variable,
+    holds the full time series of a tile x tile block of cells; returns the output file name or None
+    an out_fname ending in .zarr gives a Zarr store
+    '''
+    if out_fname is None:
+        root, ext = splitext(src_fname)
+        out_fname = root + OUT_SUFFIX + ext
+
+    build_flag = check_existing_output(out_fname, delete_flag)
+    if not build_flag:
+        return out_fname if build_flag is False else None
+
+    max_bytes = int(max_mb*1024*1024)
+    src_dset = open_dataset(src_fname, 'r')
+    if var_names is None:
+        var_names = rechunk_targets(src_dset)
+
+    # declare output: same dimensions, variables and attributes, new chunking for target variables
+    # ============================================================================================
+    plans = {}
+    for var_name in var_names:
+        src_var = src_dset.variables[var_name]
+        out_chunks = cell_chunks(src_var, tile)
+        try:
+            plans[var_name] = out_chunks, _plan(src_var, out_chunks, max_bytes)
+        except ValueError as err:
+            print(ERROR_STR + var_name + ' ' + str(err))
+            src_dset.close()
+            return None
+
+    schema = schema_from_dset(src_dset, {var_name: plans[var_name][0] for var_name in var_names})
+    history = 'rechunked by {} for per-cell reads of {}'.format(__prog__, ', '.join(var_names))
+    schema.global_attrs['history'] = (schema.global_attrs.get('history', '') + ' ' + history).strip()
+
+    tmp_fname = temp_fname(out_fname)
+    if is_zarr(out_fname):
+        tmp_fname += ZARR_EXT
+    if schema.create(tmp_fname) is None:
+        src_dset.close()
+        return None
+
+    out_dset = open_dataset(tmp_fname, 'a')
+    try:
+        for var_name in var_names:
+            _rechunk_var(src_dset.variables[var_name], out_dset.variables[var_name], plans[var_name], tmp_fname,
+                                                                                                        scratch_dir)
+    except (OSError, RuntimeError) as err:
+        print(ERROR_STR + 'rechunking ' + src_fname + ' ' + str(err))
+        out_dset.close()
+        src_dset.close()
+        discard_temp(tmp_fname)
+        return None
+
+    out_dset.close()
+    src_dset.close()
+
+    return finalise_output(tmp_fname, out_fname)
+
+def _rechunk_var(src_var, out_var, plan, tmp_fname, scratch_dir):
+    """
+    copy one variable in one or two passes according to plan
+    """
+    out_chunks, (pass1, pass2) = plan
+    src_var.set_auto_maskandscale(False)
+    out_var.set_auto_maskandscale(False)
+
+    if pass2 is None:
+        nblocks = -(-src_var.shape[1] // pass1[1])
+        meter = ProgressMeter('Rechunking ' + src_var.name + ' in one pass', nblocks, 'blocks', check_every = 1)
+        _copy_blocks(src_var, out_var, *pass1, meter)
+        meter.finish()
+        return
+
+    # first pass to scratch file chunked by time block and tile
+    # =========================================================
+    scratch_fname = tmp_fname + '.scratch'
+    if scratch_dir is not None:
+        scratch_fname = join(scratch_dir, split(scratch_fname)[1])
+
+    ntime, nlats, nlons = src_var.shape
+    scratch_dset = Dataset(scratch_fname, 'w', format='NETCDF4')
+    for dim_name, size in zip(src_var.dimensions, src_var.shape):
+        scratch_dset.createDimension(dim_name, size)
+    scratch_var = scratch_dset.createVariable(src_var.name, src_var.dtype, src_var.dimensions,
+                                                        chunksizes = (pass1[0], out_chunks[1], out_chunks[2]))
+    scratch_var.set_auto_maskandscale(False)
+
+    try:
+        nblocks = -(-nlats // pass1[1])*(-(-ntime // pass1[0]))
+        meter = ProgressMeter('Rechunking ' + src_var.name + ' pass 1 of 2', nblocks, 'blocks', check_every = 1)
+        _copy_blocks(src_var, scratch_var, *pass1, meter)
+        meter.finish()
+
+        nblocks = -(-nlats // pass2[1])*(-(-nlons // pass2[2]))
+        meter = ProgressMeter('Rechunking ' + src_var.name + ' pass 2 of 2', nblocks, 'blocks', check_every = 1)
+        _copy_blocks(scratch_var, out_var, *pass2, meter)
+        meter.finish()
+    finally:
+        scratch_dset.close()
+        if isfile(scratch_fname):
+            remove(scratch_fname)
+
+    return
+
+def main():
+    '''
+
+    '''
+    parser = ArgumentParser(description='Copy (time, lat, lon) NetCDF products into a cell ordered chunk layout')
+    parser.add_argument('src_fname', help='NetCDF file to rechunk')
+    parser.add_argument('--out_fname', help='default is the source name with suffix ' + OUT_SUFFIX +
+                                                                                    ', a .zarr name gives a Zarr store')
+    parser.add_argument('--vars', nargs='+', help='default is every (time, lat, lon) variable')
+    parser.add_argument('--tile', type=int, default=CELL_TILE, help='lat/lon extent of each chunk')
+    parser.add_argument('--max_mb', type=float, default=MAX_MB, help='memory limit for blocks read')
+    parser.add_argument('--scratch_dir', help='directory for the scratch file of a two pass copy')
+    args = parser.parse_args()
+
+    rechunk_nc(args.src_fname, args.out_fname, args.vars, args.tile, args.max_mb, args.scratch_dir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#-------------------------------------------------------------------------------
+# Name:        region_wthr_fns.py
+# Purpose:     extract area averaged weather for regions and write Century style .100 climate files
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Description: each bounding box is resolved to an index window on the weather grid; regions which share
+#              a window are served from a single hyperslab read per variable
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+__prog__ = 'region_wthr_fns.py'
+__version__ = '0.0.0'
+__author__ = 's03mm5'
+
+from netCDF4 import Dataset, num2date
+from numpy import array, array_equal, full, int64, isnan, nan as NaN
+
+from weather_datasets import report_aoi_size, _average_slice, _open_output_files
+from monthly_aggregation import MonthlyAggregator
+
+ERROR_STR = '*** Error *** '
+WARNING_STR = '*** Warning *** '
+
+METRIC_KEYS = {'precip': ('fn_precip', 'precip_var'), 'tas': ('fn_tas', 'tas_var')}
+CLIM_LINE_NAMES = {'precip': 'prec', 'tas': 'tave'}
+MISSING_STR = '-99.99'
+
+def _group_regions_by_window(wthr_sets, resource, regions):
+    '''
+    regions is either a single (admin_div, bbox) pair or a list of them, bbox being lon_ll, lat_ll, lon_ur, lat_ur
+    returns dictionary keyed by index window of lists of administrative divisions
+    '''
+    if len(regions) == 2 and isinstance(regions[0], str):
+        regions = [regions]
+
+    windows = {}
+    for admin_div, bbox in regions:
+        lon_ll, lat_ll, lon_ur, lat_ur = bbox
+        window = report_aoi_size(wthr_sets, resource, lon_ll, lat_ll, lon_ur, lat_ur)
+        if window in windows:
+            windows[window].append(admin_div)
+        else:
+            windows[window] = [admin_div]
+
+    return windows
+
+def _fetch_month_codes(nc_dset):
+    '''
+    return year and month of each time step as ndarrays
+    '''
+    time_var = nc_dset.variables['time']
+    calendar_attr = time_var.calendar if 'calendar' in time_var.ncattrs() else 'standard'
+    dates = num2date(time_var[:], units = time_var.units, calendar = calendar_attr)
+
+    years = array([date.year for date in dates], dtype=int64)
+    months = array([date.month for date in dates], dtype=int64)
+
+    return years, months
+
+def _to_monthly(series, years, months, metric):
+    '''
+    aggregate a daily or monthly series to calendar months - precipitation is summed, temperature is averaged
+    '''
+    aggregator = MonthlyAggregator.from_dates(years, months)
+
+    return aggregator.aggregate(series, 'sum' if metric == 'precip' else 'mean')
+
+def _write_clim_file(admin_div, out_dir, strt_yr, end_yr, monthly_vals, strt_month = 1):
+    '''
+    write one line per metric and year in .100 format: metric name, year, then twelve monthly values
+    monthly values run from strt_month of strt_yr; months outside the series are written as missing
+    '''
+    fhand_clim, clim_file = _open_output_files(admin_div, out_dir, strt_yr, end_yr)
+    nyears = end_yr - strt_yr + 1
+
+    for metric in monthly_vals:
+        line_name = CLIM_LINE_NAMES[metric]
+        vals = full(nyears*12, NaN)
+        vals[strt_month - 1:strt_month - 1 + len(monthly_vals[metric])] = monthly_vals[metric]
+        for iyr, year in enumerate(range(strt_yr, end_yr + 1)):
+            rec = [line_name, '{:>6d}'.format(year)]
+            for val in vals[iyr*12:(iyr + 1)*12]:
+                rec.append(MISSING_STR if isnan(val) else '{:7.2f}'.format(val))
+
+            fhand_clim.write('  '.join(rec) + '\n')
+
+    fhand_clim.close()
+
+    return clim_file
+
+def fetch_region_wthr(wthr_sets, resource, regions, out_dir, weighting = 'area'):
+    '''
+    for each region write a .100 file of area averaged monthly precipitation and temperature
+    regions: a single (admin_div, bbox) pair or a list of them
+    '''
+    wthr_set = wthr_sets[resource]
+    lats = wthr_set['grid'].lats
+    windows = _group_regions_by_window(wthr_sets, resource, regions)
+    print('{} regions share {} weather windows for resource {}'
+                                        .format(sum(len(divs) for divs in windows.values()), len(windows), resource))
+
+    # keep both datasets open for the duration
+    # ========================================
+    nc_dsets = {}
+    for metric, (fn_key, var_key) in METRIC_KEYS.items():
+        nc_dsets[metric] = Dataset(wthr_set[fn_key], 'r')
+
+    # monthly values are aligned using the time axis of precipitation, that of temperature must match
+    # ================================================================================================
+    years, months = _fetch_month_codes(nc_dsets['precip'])
+    tas_years, tas_months = _fetch_month_codes(nc_dsets['tas'])
+    if not (array_equal(years, tas_years) and array_equal(months, tas_months)):
+        print(ERROR_STR + 'time axes of precipitation and temperature differ for resource ' + resource)
+        for metric in nc_dsets:
+            nc_dsets[metric].close()
+        return []
+
+    strt_yr = int(years[0])
+    end_yr = int(years[-1])
+    strt_month = int(months[0])
+    if strt_month != 1 or months[-1] != 12:
+        print(WARNING_STR + 'resource {} covers {}-{:0>2d} to {}-{:0>2d} - months outside the series will be '
+                    'written as missing'.format(resource, strt_yr, strt_month, end_yr, int(months[-1])))
+
+    clim_files = []
+    for (lat_min, lat_max, lon_min, lon_max), admin_divs in windows.items():
+
+        # one hyperslab read per variable for all regions sharing this window
+        # ===================================================================
+        monthly_vals = {}
+        for metric, (fn_key, var_key) in METRIC_KEYS.items():
+            var = nc_dsets[metric].variables[wthr_set[var_key]]
+            slab = var[:, lat_min:lat_max + 1, lon_min:lon_max + 1]
+            series = _average_slice(slab, lats[lat_min:lat_max + 1], weighting)
+            monthly_vals[metric] = _to_monthly(series, years, months, metric)
+
+        for admin_div in admin_divs:
+            clim_files.append(_write_clim_file(admin_div, out_dir, strt_yr, end_yr, monthly_vals, strt_month))
+
+    for metric in nc_dsets:
+        nc_dsets[metric].close()
+
+    print('Wrote {} climate files to {}'.format(len(clim_files), out_dir))
+
+    return clim_files
@@ -0,0 +1,127 @@
+#-------------------------------------------------------------------------------
+# Name:        regrid_fns.py
+# Purpose:     first order conservative regridding between regular lat/lon grids using sparse overlap weights
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Description: the weight of an input cell in an output cell is the area of their overlap on the sphere,
+#              proportional to the overlap in longitude times the overlap in sine of latitude; the 2-D weight
+#              matrix is therefore the Kronecker product of a latitude and a longitude matrix and is applied as
+#              the two CSR factors, which is equivalent and avoids forming the product
+#              missing input values are excluded and the weights renormalised
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+__prog__ = 'regrid_fns.py'
+__version__ = '0.0.0'
+__author__ = 's03mm5'
+
+from numpy import argsort, arange, clip, cumsum, deg2rad, float64, int64, maximum, minimum, \
+                                                                                repeat, searchsorted, sin, zeros
+from numpy.ma import getmaskarray, masked_invalid
+from scipy.sparse import csr_matrix
+
+# overlaps shorter than this fraction of the output interval are rounding error where edges coincide
+# ==================================================================================================
+OVERLAP_TOL = 1e-9
+
+def cell_edges(centres, resol):
+    '''
+    lower and upper edges of cells of regular grid, whichever order the centres are stored in
+    '''
+    resol_d2 = abs(resol)/2.0
+    return centres - resol_d2, centres + resol_d2
+
+def overlap_matrix(out_lo, out_hi, in_lo, in_hi):
+    '''
+    CSR matrix, shape (nout, nin), of the lengths of overlap of each output interval with each input interval
+    input intervals must not overlap one another but may be in descending order
+    overlaps of less than OVERLAP_TOL of the output interval are dropped
+    '''
+    order = argsort(in_lo)
+    in_lo_srtd = in_lo[order]
+    in_hi_srtd = in_hi[order]
+
+    # for each output interval the range of sorted input intervals which may overlap it
+    # ==================================================================================
+    frst = searchsorted(in_hi_srtd, out_lo, side='right')
+    last = searchsorted(in_lo_srtd, out_hi, side='left')
+    counts = maximum(last - frst, 0)
+
+    rows = repeat(arange(len(out_lo)), counts)
+    offsets = arange(counts.sum()) - repeat(cumsum(counts) - counts, counts)
+    cols_srtd = repeat(frst, counts) + offsets
+
+    overlaps = minimum(out_hi[rows], in_hi_srtd[cols_srtd]) - maximum(out_lo[rows], in_lo_srtd[cols_srtd])
+    keep = overlaps > OVERLAP_TOL*(out_hi - out_lo)[rows]
+
+    return csr_matrix((overlaps[keep], (rows[keep], order[cols_srtd[keep]])), shape=(len(out_lo), len(in_lo)))
+
+class ConservativeRegridder(object, ):
+    '''
+    precomputed overlap weights between two WeatherGrid instances, shared by every slice regridded
+    offers the same band interface as RegridIndexMap
+    '''
+    def __init__(self, inpt_grid, out_grid):
+        """
+
+        """
+        in_lat_lo, in_lat_hi = cell_edges(inpt_grid.lats, inpt_grid.resol_lat)
+        out_lat_lo, out_lat_hi = cell_edges(out_grid.lats, out_grid.resol_lat)
+        in_lon_lo, in_lon_hi = cell_edges(inpt_grid.lons, inpt_grid.resol_lon)
+        out_lon_lo, out_lon_hi = cell_edges(out_grid.lons, out_grid.resol_lon)
+
+        def _sin_lat(lats):
+            return sin(deg2rad(clip(lats, -90.0, 90.0)))
+
+        self.lat_wts = overlap_matrix(_sin_lat(out_lat_lo), _sin_lat(out_lat_hi),
+                                                                    _sin_lat(in_lat_lo), _sin_lat(in_lat_hi))
+        self.lon_wts = overlap_matrix(out_lon_lo, out_lon_hi, in_lon_lo, in_lon_hi)
+
+        # input rows contributing to each output row
+        # ==========================================
+        nnz_rows = self.lat_wts.getnnz(axis=1)
+        self.row_lo = zeros(out_grid.nlats, dtype=int64)
+        self.row_hi = zeros(out_grid.nlats, dtype=int64)
+        for irow in arange(out_grid.nlats)[nnz_rows > 0]:
+            cols = self.lat_wts.indices[self.lat_wts.indptr[irow]:self.lat_wts.indptr[irow + 1]]
+            self.row_lo[irow] = cols.min()
+            self.row_hi[irow] = cols.max() + 1
+
+        print('Conservative regridding weights: {} latitude and {} longitude overlaps'
+                                                                    .format(self.lat_wts.nnz, self.lon_wts.nnz))
+
+    def input_rows(self, lat_strt, lat_end):
+        """
+        range of input rows, upper exclusive, read to regrid output rows lat_strt to lat_end
+        """
+        in_area = self.in_area(lat_strt, lat_end)
+        if not in_area.any():
+            return 0, 0
+
+        return int(self.row_lo[lat_strt:lat_end][in_area].min()), int(self.row_hi[lat_strt:lat_end][in_area].max())
+
+    def in_area(self, lat_strt, lat_end):
+        """
+        output rows of the band which overlap any input rows
+        """
+        return self.row_hi[lat_strt:lat_end] > self.row_lo[lat_strt:lat_end]
+
+    def regrid_band(self, inpt_band, row_min, lat_strt, lat_end):
+        """
+        area weighted mean of valid input values in each cell of the band and the total weight of the valid input
+        contributing to it, in units of sine of latitude times degrees of longitude
+        """
+        inpt_band = masked_invalid(inpt_band)
+        valid = (~getmaskarray(inpt_band)).astype(float64)
+        vals = inpt_band.filled(0.0).astype(float64)
+
+        lat_wts = self.lat_wts[lat_strt:lat_end, row_min:row_min + vals.shape[0]]
+        sums = self.lon_wts.dot((lat_wts.dot(vals)).T).T
+        wts = self.lon_wts.dot((lat_wts.dot(valid)).T).T
+
+        means = zeros(sums.shape, dtype=float64)
+        has_data = wts > 0
+        means[has_data] = sums[has_data] / wts[has_data]
+
+        return means, wts
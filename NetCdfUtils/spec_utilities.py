@@ -5,18 +5,23 @@ __version__ = '0.0.0'
 __author__ = 's03mm5'
 
 from os.path import split, join, isfile
-from locale import format_string, setlocale, LC_ALL
+from locale import setlocale, LC_ALL
 import json
 import time
 from sys import stdout
+from threading import local
+from multiprocessing import TimeoutError as PoolTimeout
 import csv
-from nc_low_level_fns import daily_to_monthly
+from nc_low_level_fns import daily_to_monthly, HARMONIE_STRT_YEAR
 
 setlocale(LC_ALL, '')
 
 SUMMARY_VARNAMES = {'soc':'total_soc', 'ch4':'ch4_c', 'co2':'co2_c', 'no3':'no3_n', 'npp':'npp_adj', 'n2o':'n2o_n'}
 SUMMARY_VARNAMES = {'soc':'total_soc', 'co2':'co2_c', 'no3':'no3_n', 'n2o':'n2o_n'}
-NLINES_EXPECTATION = 14965
+NLINES_EXPECTATION = 14965     # 41 years of 365 days - SUMMARY.OUT has no leap days
+SUMMARY_CALENDAR = 'noleap'
+MIN_CALENDAR_YEAR = 1800        # smaller values in the year column of SUMMARY.OUT are simulation years
+POLL_SECS = 1.0                 # interval at which cancellation is checked while waiting on worker processes
 ERROR_STR = '*** Error *** '
 WARNING_STR = '*** Warning *** '
 
@@ -28,6 +33,184 @@ class EcosseDialect(csv.excel):
 class SpecError(Exception):
     pass
 
+class JobCancelled(Exception):
+    pass
+
+# per thread progress hook so that jobs running in background workers can report to the GUI
+# ==========================================================================================
+_progress_local = local()
+
+# defaults applied to every ProgressMeter, normally set once from the setup file by configure_progress
+# ===================================================================================================
+_progress_defaults = {'lggr': None, 'metrics_fname': None, 'interval': 5.0}
+
+def set_progress_hook(hook, cancelled = None):
+    '''
+    hook is called with the ProgressMeter report dictionary each time progress is reported
+    it may raise JobCancelled to abandon the job; pass None to remove
+    cancelled, if given, returns True once the job has been cancelled and is polled by pool_map
+    '''
+    _progress_local.hook = hook
+    _progress_local.cancelled = cancelled
+
+def check_cancelled():
+    '''
+    raise JobCancelled if the job running in this thread has been cancelled
+    '''
+    cancelled = getattr(_progress_local, 'cancelled', None)
+    if cancelled is not None and cancelled():
+        raise JobCancelled('cancelled by user')
+
+def _indexed_call(task):
+    """
+    run in a worker process: result of one task of pool_map with its position
+    """
+    func, indx, args = task
+    return indx, func(args)
+
+def pool_map(pool, func, tasks, poll_secs = POLL_SECS):
+    '''
+    as pool.map with a chunksize of one, but results are collected as they complete and cancellation of the job
+    is checked every poll_secs while waiting; on cancellation the pool is terminated and JobCancelled raised
+    worker processes never see the progress hook, so this is how jobs which use a pool are cancelled
+    '''
+    rslts = [None]*len(tasks)
+    rslt_iter = pool.imap_unordered(_indexed_call, [(func, indx, task) for indx, task in enumerate(tasks)])
+    for dummy in range(len(tasks)):
+        while True:
+            try:
+                check_cancelled()
+            except JobCancelled:
+                pool.terminate()
+                raise
+            try:
+                indx, rslt = rslt_iter.next(timeout = poll_secs)
+                break
+            except PoolTimeout:
+                pass
+
+        rslts[indx] = rslt
+
+    return rslts
+
+def configure_progress(lggr = None, metrics_fname = None, interval = 5.0):
+    '''
+    set the logger, JSON lines metrics file and reporting interval used by subsequent ProgressMeters
+    '''
+    _progress_defaults['lggr'] = lggr
+    _progress_defaults['metrics_fname'] = metrics_fname
+    _progress_defaults['interval'] = interval
+
+class ProgressMeter(object, ):
+    '''
+    progress and throughput of a pipeline stage
+    tick() is O(1): the clock is only read every check_every ticks and a report is made when interval seconds
+    have elapsed; reports give items completed and remaining, items/s, bytes read and written and ETA and go to
+    stdout, the log, a JSON lines metrics file and the progress hook of this thread
+    '''
+    def __init__(self, descr, ntotal, unit = 'cells', check_every = 256, lggr = None, metrics_fname = None):
+        """
+        ntotal is the number of items expected; use check_every = 1 for loops with few, long iterations
+        """
+        self.descr = descr
+        self.ntotal = ntotal
+        self.unit = unit
+        self.check_every = max(1, check_every)
+        self.lggr = _progress_defaults['lggr'] if lggr is None else lggr
+        self.metrics_fname = _progress_defaults['metrics_fname'] if metrics_fname is None else metrics_fname
+        self.interval = _progress_defaults['interval']
+
+        self.ncomplete = 0
+        self.nbytes_read = 0
+        self.nbytes_written = 0
+        self.counters = {}
+        self._nticks = 0
+        self.strt_time = time.time()
+        self._last_time = self.strt_time
+
+    def tick(self, nitems = 1):
+        """
+        record completion of nitems
+        """
+        self.ncomplete += nitems
+        self._nticks += 1
+        if self._nticks >= self.check_every:
+            self._nticks = 0
+            this_time = time.time()
+            if this_time - self._last_time > self.interval:
+                self._last_time = this_time
+                self.report()
+
+    def count(self, name, nitems = 1):
+        """
+        increment a named counter e.g. masked, skipped or warnings
+        """
+        self.counters[name] = self.counters.get(name, 0) + nitems
+
+    def add_bytes(self, nread = 0, nwritten = 0):
+        """
+
+        """
+        self.nbytes_read += nread
+        self.nbytes_written += nwritten
+
+    def metrics(self):
+        """
+        snapshot of progress as a dictionary
+        """
+        elapsed = time.time() - self.strt_time
+        throughput = self.ncomplete/elapsed if elapsed > 0 else 0.0
+        nremain = max(self.ntotal - self.ncomplete, 0)
+        eta = nremain/throughput if throughput > 0 else None
+
+        prgrss = {'descr': self.descr, 'unit': self.unit, 'completed': self.ncomplete, 'remaining': nremain,
+                  'throughput': throughput, 'eta': eta, 'elapsed': elapsed,
+                  'bytes_read': self.nbytes_read, 'bytes_written': self.nbytes_written}
+        prgrss.update(self.counters)
+
+        return prgrss
+
+    def report(self, final = False):
+        """
+        emit current progress to each destination
+        """
+        prgrss = self.metrics()
+
+        mess = 'Complete: {:,} Remaining: {:,} Rate: {:,.1f} {}/s'.format(prgrss['completed'], prgrss['remaining'],
+                                                                                prgrss['throughput'], self.unit)
+        for name, nitems in self.counters.items():
+            mess += ' {}: {:,}'.format(name.capitalize(), nitems)
+        if self.nbytes_read + self.nbytes_written > 0:
+            mess += ' MB read/written: {:,.1f}/{:,.1f}'.format(self.nbytes_read/1e6, self.nbytes_written/1e6)
+        if prgrss['eta'] is not None and not final:
+            mess += ' ETA: {:.1f} min'.format(prgrss['eta']/60)
+
+        if final:
+            stdout.write('\r' + self.descr + ' - ' + mess + ' elapsed: {:.1f}s\n'.format(prgrss['elapsed']))
+        else:
+            stdout.write('\r' + mess)
+        stdout.flush()
+
+        if self.lggr is not None:
+            self.lggr.info(self.descr + ' - ' + mess)
+
+        if self.metrics_fname is not None:
+            prgrss['time'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+            prgrss['final'] = final
+            with open(self.metrics_fname, 'a') as fmetrics:
+                fmetrics.write(json.dumps(prgrss) + '\n')
+
+        hook = getattr(_progress_local, 'hook', None)
+        if hook is not None:
+            hook(prgrss)
+
+    def finish(self):
+        """
+        final report, returns the metrics
+        """
+        self.report(final = True)
+        return self.metrics()
+
 def make_id_seg(lat, lon, scenario, mu = -999, province = 'province', landuse = 'ara', ndom_soils = 1, area = '-999'):
 
     id_mod = list([province, str(lat), str(lon), mu, scenario, str(ndom_soils), landuse, area])
@@ -173,10 +356,16 @@ def read_summary_out(sim_dir, nmonths, daily_to_monthly_flag = True):
 
     # build result
     # ============
+    # month lengths follow the noleap calendar from the first simulation year, if it is a calendar year
+    # ==================================================================================================
+    strt_year = int(summary['year'][0])
+    if strt_year < MIN_CALENDAR_YEAR:
+        strt_year = HARMONIE_STRT_YEAR
+
     full_result = {}
     for sv_name, lv_name in SUMMARY_VARNAMES.items():
         if lv_name in summary:
-            full_result[sv_name] = daily_to_monthly(summary[lv_name], sv_name, nmonths)   # sv_name = short variable name; lv_name = long
+            full_result[sv_name] = daily_to_monthly(summary[lv_name], sv_name, nmonths, strt_year, SUMMARY_CALENDAR)   # sv_name = short variable name; lv_name = long
 
     return full_result
 
@@ -202,60 +391,6 @@ def load_manifest(lgr, sim_dir):
 
     return manifest
 
-def update_progress2(last_time, ndata, nzeros, nsize_grid):
-    '''
-    Update progress bar
-    '''
-    this_time = time.time()
-    if (this_time - last_time) > 5.0:
-        remain_str = format_string("%d", nsize_grid - ndata - nzeros, grouping=True)
-        nzeros_str = format_string("%d", nzeros, grouping=True)
-        ndata_str = format_string("%d", ndata, grouping=True)
-
-        stdout.flush()
-        stdout.write('\r                                                                                          ')
-        stdout.write('\rWith data: {}  no data: {}  remaining: {}'.format(ndata_str, nzeros_str, remain_str))
-        return this_time
-
-    return last_time
-
-def update_progress(last_time, nvalid, nmask, nunknwn, nsize_grid):
-    '''
-    Update progress bar
-    '''
-    this_time = time.time()
-    if (this_time - last_time) > 5.0:
-        ncomplete = nvalid + nmask + nunknwn
-        remain_str = format_string("%d", nsize_grid - ncomplete, grouping=True)
-        cmplt_str = format_string("%d", ncomplete, grouping=True)
-        valid_str = format_string("%d", nvalid, grouping=True)
-        mask_str = format_string("%d", nmask, grouping=True)
-        unknwn_str = format_string("%d", nunknwn, grouping=True)
-
-        stdout.flush()
-        stdout.write('\r                                                                                          ')
-        stdout.write('\rComplete: {}  Remaining: {}  Valid: {}  Masked: {}  Unknown: {}'
-                                    .format(cmplt_str, remain_str, valid_str, mask_str, unknwn_str))
-        return this_time
-
-    return last_time
-
-def update_progress_post(last_time, start_time, num_grid_cells, num_manifests, skipped, failed, warning_count):
-    '''
-    Update progress bar
-    '''
-    this_time = time.time()
-    if (this_time - last_time) > 5.0:
-        remain_str = format_string("%d", num_manifests - num_grid_cells, grouping=True)
-        cmplt_str = format_string("%d", num_grid_cells, grouping=True)
-        stdout.flush()
-        stdout.write('\r                                                                                          ')
-        stdout.write('\rComplete: {} Skip: {} Warnings: {} Remaining: {}'
-                                                                .format(cmplt_str, skipped, warning_count, remain_str))
-        return this_time
-
-    return last_time
-
 def _within_times(dt, starthour, startminute, endhour, endminute):
     """Deterines if the time is within the specified boundaries.
     dt    - [datetime object] the time to be checked
@@ -0,0 +1,120 @@
+#-------------------------------------------------------------------------------
+# Name:        time_axes.py
+# Purpose:     vectorised generation of time coordinates and bounds for daily, monthly and yearly time steps
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Description: offsets are computed with NumPy datetime64 for the standard calendar and with arithmetic for the
+#              noleap and 360_day calendars; the standard calendar is treated as proleptic Gregorian which
+#              agrees with netCDF4.date2num for all dates after 1582-10-15
+#              bounds follow CF conventions: the end of each step is the start of the next
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+__prog__ = 'time_axes.py'
+__version__ = '0.0.0'
+__author__ = 's03mm5'
+
+import re
+from numpy import arange, array, asarray, column_stack, float64, int64, cumsum, concatenate
+
+TIME_UNITS = 'days since 1900-01-01'
+UNITS_PER_DAY = {'days': 1.0, 'hours': 24.0, 'minutes': 1440.0, 'seconds': 86400.0}
+
+CALENDAR_ALIASES = {'standard': 'standard', 'gregorian': 'standard', 'proleptic_gregorian': 'standard',
+                    'noleap': 'noleap', '365_day': 'noleap', '360_day': '360_day'}
+
+DAYS_IN_MONTH_NOLEAP = array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+CUM_DAYS_NOLEAP = concatenate(([0], cumsum(DAYS_IN_MONTH_NOLEAP)[:-1]))
+
+_UNITS_PATTERN = re.compile(r'\s*(\w+)\s+since\s+(\d{1,4})-(\d{1,2})-(\d{1,2})(?:[ T](\d{1,2}):(\d{1,2})(?::(\d{1,2}))?)?')
+
+def normalise_calendar(calendar):
+    '''
+    map CF calendar names onto the three calendars supported
+    '''
+    try:
+        return CALENDAR_ALIASES[calendar.lower()]
+    except KeyError:
+        raise ValueError('calendar {} is not supported - use one of: {}'
+                                                            .format(calendar, ', '.join(CALENDAR_ALIASES)))
+
+def parse_time_units(units):
+    '''
+    split CF time units e.g. "days since 1900-01-01 12:00" into units per day and reference date and time of day
+    '''
+    match = _UNITS_PATTERN.match(units)
+    if match is None or match.group(1) not in UNITS_PER_DAY:
+        raise ValueError('time units {} not recognised'.format(units))
+
+    year, month, day = int(match.group(2)), int(match.group(3)), int(match.group(4))
+    hour, minute, second = [int(grp) if grp is not None else 0 for grp in match.group(5, 6, 7)]
+    day_frac = (hour*3600 + minute*60 + second)/86400.0
+
+    return UNITS_PER_DAY[match.group(1)], (year, month, day), day_frac
+
+def day_numbers(years, months, days, calendar = 'standard'):
+    '''
+    day number of each date on a continuous count for the calendar - only differences are meaningful
+    '''
+    years = asarray(years, dtype=int64)
+    months = asarray(months, dtype=int64)
+    days = asarray(days, dtype=int64)
+    calendar = normalise_calendar(calendar)
+
+    if calendar == 'standard':
+        mnth_strt = (years - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (months - 1)
+        return mnth_strt.astype('datetime64[D]').astype(int64) + days - 1
+
+    elif calendar == 'noleap':
+        return years*365 + CUM_DAYS_NOLEAP[months - 1] + days - 1
+
+    else:
+        return years*360 + (months - 1)*30 + days - 1
+
+def date_offsets(years, months, days, units = TIME_UNITS, calendar = 'standard'):
+    '''
+    vectorised equivalent of netCDF4.date2num for dates at midnight
+    '''
+    units_per_day, (ref_year, ref_month, ref_day), day_frac = parse_time_units(units)
+    ref_num = day_numbers(ref_year, ref_month, ref_day, calendar)
+
+    return (day_numbers(years, months, days, calendar) - ref_num - day_frac).astype(float64)*units_per_day
+
+def _step_starts(strt_year, strt_month, nsteps, step):
+    """
+    years, months and days of the start of each step and of the step following the last
+    """
+    if step == 'monthly':
+        mnth_indx = (strt_month - 1) + arange(nsteps + 1)
+        return strt_year + mnth_indx // 12, mnth_indx % 12 + 1, 1
+
+    if step == 'yearly':
+        return strt_year + arange(nsteps + 1), strt_month, 1
+
+    raise ValueError('time step {} must be one of daily, monthly or yearly'.format(step))
+
+def time_axis(strt_year, nsteps, step = 'monthly', units = TIME_UNITS, calendar = 'standard', strt_month = 1,
+                                                                                                strt_day = 1):
+    '''
+    midpoints and (nsteps, 2) bounds of nsteps daily, monthly or yearly steps starting at strt_year, strt_month
+    and, for daily steps, strt_day; values are in units, which may have a reference time of day, for the calendar
+    '''
+    if step == 'daily':
+        strt = date_offsets(strt_year, strt_month, strt_day, units, calendar)
+        units_per_day = parse_time_units(units)[0]
+        edges = strt + arange(nsteps + 1, dtype=float64)*units_per_day
+    else:
+        years, months, days = _step_starts(strt_year, strt_month, nsteps, step)
+        edges = date_offsets(years, months, days, units, calendar)
+
+    bounds = column_stack((edges[:-1], edges[1:]))
+    midpoints = 0.5*(edges[:-1] + edges[1:])
+
+    return midpoints, bounds
+
+def ndays_in_years(strt_year, nyears, calendar = 'standard'):
+    '''
+    number of days in the nyears starting at strt_year
+    '''
+    return int(day_numbers(strt_year + nyears, 1, 1, calendar) - day_numbers(strt_year, 1, 1, calendar))
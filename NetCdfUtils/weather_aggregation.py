@@ -23,7 +23,7 @@ from glob import glob
 from time import time
 import csv
 
-from spec_utilities import make_id_seg, update_progress_post, display_headers
+from spec_utilities import make_id_seg, display_headers, ProgressMeter, JobCancelled
 
 sleepTime = 5
 
@@ -43,9 +43,6 @@ def _process_wthr_dir(clim_dir, region_wthr_name, sub_dirs, scenario, fut_start_
 
     # header record
     # =============
-    last_time = time()
-    start_time = time()
-
     hdr_rec = copy(COMMON_HEADERS)
     for year in range(fut_start_year, fut_end_year + 1):
         for month in range(1, 13):
@@ -71,38 +68,49 @@ def _process_wthr_dir(clim_dir, region_wthr_name, sub_dirs, scenario, fut_start_
     nsub_dirs = len(sub_dirs)
     print('Found {:>7d} directories in {}'.format(nsub_dirs, clim_dir))
     ndone, skipped, failed, warning_count = 4*[0]
+    meter = ProgressMeter('Gathering weather from ' + clim_dir, nsub_dirs, unit = 'dirs', check_every = 16)
 
-    for sub_dir in sub_dirs:
-        gran_lat, gran_lon = sub_dir.split('_')
-        lat = 90.0 - float(gran_lat)/GRANULARITY
-        lon = float(gran_lon)/GRANULARITY - 180.0
-
-        id_seg = make_id_seg(lat, lon, scenario)
-
-        # for each weather cell, construct two records, one for each metric
-        # =================================================================
-        rslts = {}
-        for varname in VAR_DEFNS:
-            rslts[varname] = []
-
-        wthr_cell_dir = join(clim_dir, sub_dir)
-        met_files = glob(wthr_cell_dir + '\\met2*s.txt')    # should be 101   TODO: sort
-        for met_file in met_files:
-            with open(met_file, 'r') as fobj:
-                lines = fobj.readlines()
-
-            for line in lines:
-                dum, precip, dum, tair = line.rstrip('\n').split('\t')
-                rslts['precip'].append(precip)
-                rslts['tair'].append(tair)
-
+    # partial output files are removed if the job is cancelled from the GUI
+    # =====================================================================
+    try:
+        for sub_dir in sub_dirs:
+            gran_lat, gran_lon = sub_dir.split('_')
+            lat = 90.0 - float(gran_lat)/GRANULARITY
+            lon = float(gran_lon)/GRANULARITY - 180.0
+
+            id_seg = make_id_seg(lat, lon, scenario)
+
+            # for each weather cell, construct two records, one for each metric
+            # =================================================================
+            rslts = {}
+            for varname in VAR_DEFNS:
+                rslts[varname] = []
+
+            wthr_cell_dir = join(clim_dir, sub_dir)
+            met_files = glob(wthr_cell_dir + '\\met2*s.txt')    # should be 101   TODO: sort
+            for met_file in met_files:
+                with open(met_file, 'r') as fobj:
+                    lines = fobj.readlines()
+
+                for line in lines:
+                    dum, precip, dum, tair = line.rstrip('\n').split('\t')
+                    rslts['precip'].append(precip)
+                    rslts['tair'].append(tair)
+
+            for varname in VAR_DEFNS:
+                writers[varname].writerow(id_seg + rslts[varname])
+
+            meter.tick()
+            ndone += 1
+            if ndone >= MAX_SUB_DIRS:
+                break
+    except JobCancelled:
         for varname in VAR_DEFNS:
-            writers[varname].writerow(id_seg + rslts[varname])
+            fobjs_out[varname].close()
+            remove(out_fnames[varname])
+        raise
 
-        last_time = update_progress_post(last_time, start_time, ndone, nsub_dirs, skipped, failed, warning_count)
-        ndone += 1
-        if ndone >= MAX_SUB_DIRS:
-            break
+    meter.finish()
 
     # clean up
     # ========
@@ -114,10 +122,13 @@ def _process_wthr_dir(clim_dir, region_wthr_name, sub_dirs, scenario, fut_start_
 
 def wthr_aggreg(sims_dir, regions_fname):
     '''
-
+    returns True once the weather directories present have been gathered or None if the regions file is unreadable
     '''
     display_headers()
     regions = _read_regions_file(regions_fname)
+    if regions is None:
+        return None
+
     for wthr_dir in regions['Wthr dir']:
         for fut_clim_scen in FUT_CLIM_SCENS:
             region_wthr_name = wthr_dir + WTHR_RSRCE + fut_clim_scen
@@ -135,7 +146,7 @@ def wthr_aggreg(sims_dir, regions_fname):
             else:
                 print(clim_dir + ' does not exist')
 
-    return
+    return True
 
 def _read_regions_file(regions_fname):
     '''
@@ -148,7 +159,7 @@ def _read_regions_file(regions_fname):
     except (PermissionError, XLRDError) as e:
         print('Error {} reading regions definition file {}'.format(e, regions_fname))
         sleep(sleepTime)
-        exit(0)
+        return None     # reported as a failed job rather than ending the process
 
     return regions
 
@@ -15,7 +15,9 @@ __version__ = '0.0.0'
 # 
 from os import remove
 from os.path import join, normpath, isfile, lexists
-from numpy import zeros
+from numpy import zeros, ones, array, rint, clip, float64, int64, cos, sin, radians, abs as np_abs, where, \
+                                                    tensordot, newaxis, meshgrid, nan as NaN
+from numpy.ma import masked_invalid, getmaskarray
 from numpy.ma.core import MaskedArray
 
 from netCDF4 import Dataset, num2date
@@ -30,16 +32,78 @@ PERIOD_DEFNS = {'Monthly':'Mnth', 'Daily':'Day'}
 ERROR_STR = '*** Error *** '
 WARNING_STR = '*** Warning *** '
 
+class WeatherGrid(object, ):
+    '''
+    regular lat/lon grid held as read-once ndarrays with O(1) index lookup
+    resolutions are signed so grids stored North to South are handled correctly
+    '''
+    def __init__(self, lats, lons):
+        """
+        lats and lons are the coordinate variables of the weather dataset
+        """
+        self.lats = array(lats, dtype=float64)
+        self.lons = array(lons, dtype=float64)
+        self.nlats = len(self.lats)
+        self.nlons = len(self.lons)
+
+        # origin is the first element of each coordinate array, not necessarily the lower left
+        # ====================================================================================
+        self.lat0 = float(self.lats[0])
+        self.lon0 = float(self.lons[0])
+
+        if self.nlats > 1:
+            self.resol_lat = round(float(self.lats[-1] - self.lats[0])/(self.nlats - 1), 9)
+        else:
+            self.resol_lat = 0.0
+
+        if self.nlons > 1:
+            self.resol_lon = round(float(self.lons[-1] - self.lons[0])/(self.nlons - 1), 9)
+        else:
+            self.resol_lon = 0.0
+
+        self.lat_dir = -1 if self.resol_lat < 0 else 1
+        self.lon_dir = -1 if self.resol_lon < 0 else 1
+
+        self.bbox = list([float(self.lons.min()), float(self.lats.min()),
+                                                            float(self.lons.max()), float(self.lats.max())])
+
+    def lat_indices(self, lats):
+        """
+        unclipped latitude indices - accepts scalars or ndarrays
+        """
+        if self.resol_lat == 0.0:
+            return zeros(array(lats).shape, dtype=int64)
+
+        return rint((array(lats, dtype=float64) - self.lat0)/self.resol_lat).astype(int64)
+
+    def lon_indices(self, lons):
+        """
+        unclipped longitude indices - accepts scalars or ndarrays
+        """
+        if self.resol_lon == 0.0:
+            return zeros(array(lons).shape, dtype=int64)
+
+        return rint((array(lons, dtype=float64) - self.lon0)/self.resol_lon).astype(int64)
+
+    def indices(self, lats, lons):
+        """
+        vectorised equivalent of get_nc_coords: indices are clipped to the extent of the grid
+        """
+        lat_indx = clip(self.lat_indices(lats), 0, self.nlats - 1)
+        lon_indx = clip(self.lon_indices(lons), 0, self.nlons - 1)
+
+        return lat_indx, lon_indx
+
 def get_nc_coords(lggr, wthr_dict, latitude, longitude, print_flag = False):
     '''
 
     '''
-    max_lat_indx = len(wthr_dict['latitudes']) - 1
-    max_lon_indx = len(wthr_dict['longitudes']) - 1
+    grid = wthr_dict['grid']
+    max_lat_indx = grid.nlats - 1
+    max_lon_indx = grid.nlons - 1
 
-    lon_ll, lat_ll, lon_ur, lat_ur = wthr_dict['bbox']
-    lat_indx = round((latitude  - lat_ll)/wthr_dict['resol_lat'])
-    lon_indx = round((longitude - lon_ll)/wthr_dict['resol_lon'])
+    lat_indx = int(grid.lat_indices(latitude))
+    lon_indx = int(grid.lon_indices(longitude))
 
     # validate lats
     # =============
@@ -75,15 +139,71 @@ def get_nc_coords(lggr, wthr_dict, latitude, longitude, print_flag = False):
 
     return lat_indx, lon_indx
 
-def _average_slice(slice):
+def cell_weights(lats, weighting = 'cos_lat'):
+    '''
+    relative weight of each latitude row of a regular grid
+        cos_lat: cosine of latitude at the cell centre
+        area:    true spherical cell area i.e. difference of sines of the cell edges, longitude width is constant
+    '''
+    lats = array(lats, dtype=float64)
+    if weighting == 'cos_lat' or len(lats) < 2:
+        return cos(radians(lats))
 
-    ndays, nlats, nlons = slice.shape
-    new_slice = zeros(ndays)
+    if weighting == 'area':
+        resol_d2 = abs(lats[-1] - lats[0])/(len(lats) - 1)/2.0
+        return np_abs(sin(radians(lats + resol_d2)) - sin(radians(lats - resol_d2)))
+
+    raise ValueError('weighting must be cos_lat or area, not {}'.format(weighting))
+
+def polygon_mask(lats, lons, polygon):
+    '''
+    boolean (nlats, nlons) array, True where the cell centre lies inside the polygon
+    polygon is a sequence of (lon, lat) vertices; ray casting is vectorised over all cells for each edge
+    '''
+    alons, alats = meshgrid(array(lons, dtype=float64), array(lats, dtype=float64))
+    inside = zeros(alats.shape, dtype=bool)
+
+    nverts = len(polygon)
+    for indx in range(nverts):
+        lon1, lat1 = polygon[indx]
+        lon2, lat2 = polygon[(indx + 1) % nverts]
+        if lat1 == lat2:
+            continue    # horizontal edges never cross the ray
+
+        crosses = (lat1 > alats) != (lat2 > alats)
+        lon_cross = lon1 + (alats - lat1) * (lon2 - lon1) / (lat2 - lat1)
+        inside ^= crosses & (alons < lon_cross)
+
+    return inside
+
+def _average_slice(slice, lats = None, weighting = None, mask = None):
+    '''
+    return the spatial mean for each day of a (ndays, nlats, nlons) cube in a single axis reduction
+        weighting: None, 'cos_lat' or 'area' - the latter two require lats
+        mask:      optional (nlats, nlons) boolean array, True for cells to include e.g. from polygon_mask
+    masked and NaN values are excluded and weights renormalised; days without valid cells are set to NaN
+    '''
+    data = masked_invalid(slice)
+    ndays, nlats, nlons = data.shape
+
+    if weighting is None:
+        wghts = ones((nlats, nlons))
+    else:
+        wghts = ones((nlats, nlons)) * cell_weights(lats, weighting)[:, newaxis]
 
-    for indx_day in range(ndays):
-        day_slice = slice[indx_day, :, :]
-        new_val = day_slice.mean()
-        new_slice[indx_day] = new_val
+    if mask is not None:
+        wghts = where(mask, wghts, 0.0)
+
+    # weighted sum and sum of weights of valid cells for every day at once
+    # ====================================================================
+    valid = ~getmaskarray(data)
+    wght_sums = tensordot(valid, wghts, axes=([1, 2], [0, 1]))
+    val_sums = tensordot(data.filled(0.0), wghts, axes=([1, 2], [0, 1]))
+
+    new_slice = zeros(ndays)
+    new_slice[:] = NaN
+    has_data = wght_sums > 0.0
+    new_slice[has_data] = val_sums[has_data] / wght_sums[has_data]
 
     return new_slice
 
@@ -104,7 +224,7 @@ def _open_output_files(admin_div, out_dir, start_year, end_year):
 
 def _fetch_weather_nc_parms(nc_fname, rsrc_name, wthr_rsrce, resol_time, time_var_name = 'time'):
     '''
-    create a data record and lat/lon lists from weather datasets
+    create a data record and lat/lon arrays from weather datasets
         raw ECLIPS2 datasets do not have a time dimension
     '''
     nc_fname = normpath(nc_fname)
@@ -134,30 +254,21 @@ def _fetch_weather_nc_parms(nc_fname, rsrc_name, wthr_rsrce, resol_time, time_va
     lat_var = nc_dset.variables[lat]
     lon_var = nc_dset.variables[lon]
 
-    # create lat/lon lists taking into account particularities of each resource
-    # =========================================================================
+    # create lat/lon arrays, read once, taking into account particularities of each resource
+    # ======================================================================================
+    lats = array(lat_var[:], dtype=float64)
+    lons = array(lon_var[:], dtype=float64)
     if rsrc_name == 'EObs':
-        lats = [round(float(lat), 3) for lat in lat_var]
-        lons = [round(float(lon), 3) for lon in lon_var]
-    else:
-        lats = [float(lat) for lat in lat_var]
-        lons = [float(lon) for lon in lon_var]
-
-    # bounding box
-    # ============
-    lon_ll = min(lons)
-    lon_ur = max(lons)
-    lat_ll = min(lats)
-    lat_ur = max(lats)
-
-    # resolutions
-    # ===========
-    '''
-    resol_lon = round((lon_var[-1] - lon_var[0])/(len(lon_var) - 1), 5)
-    resol_lat = round((lat_var[-1] - lat_var[0])/(len(lat_var) - 1), 5)
-    '''
-    resol_lon = round((lons[-1] - lons[0])/(len(lons) - 1),9)
-    resol_lat = round((lats[-1] - lats[0])/(len(lats) - 1),9)
+        lats = lats.round(3)
+        lons = lons.round(3)
+
+    grid = WeatherGrid(lats, lons)
+
+    # bounding box and resolutions
+    # ============================
+    lon_ll, lat_ll, lon_ur, lat_ur = grid.bbox
+    resol_lon = grid.resol_lon
+    resol_lat = grid.resol_lat
     if abs(resol_lat) != abs(round(resol_lon,9)):
         print('Warning - weather resource {} has different lat/lon resolutions: {} {}'
                                                         .format(wthr_rsrce, resol_lat, resol_lon))
@@ -184,9 +295,11 @@ def _fetch_weather_nc_parms(nc_fname, rsrc_name, wthr_rsrce, resol_time, time_va
     nc_dset.close()
 
     data_rec = {'start_year': start_date.year,  'end_year': end_date.year,
-            'resol_lat': resol_lat, 'lat_frst': lats[0], 'lat_last': lats[-1], 'lat_ll': lat_ll, 'lat_ur': lat_ur,
-            'resol_lon': resol_lon, 'lon_frst': lons[0], 'lon_last': lons[-1], 'lon_ll': lon_ll, 'lon_ur': lon_ur,
-                    'resol_time': resol_time, 'daycent_dates': []}
+            'resol_lat': resol_lat, 'lat_frst': grid.lat0, 'lat_last': float(lats[-1]), 'lat_ll': lat_ll,
+            'lat_ur': lat_ur, 'lat0': grid.lat0, 'lat_dir': grid.lat_dir,
+            'resol_lon': resol_lon, 'lon_frst': grid.lon0, 'lon_last': float(lons[-1]), 'lon_ll': lon_ll,
+            'lon_ur': lon_ur, 'lon0': grid.lon0, 'lon_dir': grid.lon_dir,
+                    'resol_time': resol_time, 'daycent_dates': [], 'grid': grid}
 
     print('{} start and end year: {} {}\tresolution: {} degrees'
             .format(wthr_rsrce, data_rec['start_year'],  data_rec['end_year'], abs(data_rec['resol_lat'])))
@@ -265,28 +378,22 @@ def read_wthr_dsets_detail(form, wthr_set_defns):
 
 def report_aoi_size(wthr_sets, resource, lon_ll, lat_ll, lon_ur, lat_ur):
     '''
+    return the lat/lon index window, clipped to the grid, which encloses the AOI
     '''
     func_name =  __prog__ + ' report_aoi_size'
 
     # ====================================
-    wthr_set = wthr_sets[resource]
-    resol_lat = wthr_set['resol_lat']
-    lat0 = wthr_set['lat0']
-    resol_lon = wthr_set['resol_lon']
-    lon0 = wthr_set['lon0']
-
-    lat_indx_ll = int(round((lat_ll - lat0)/resol_lat))
-    lon_indx_ll = int(round((lon_ll - lon0)/resol_lon))
+    grid = wthr_sets[resource]['grid']
 
-    lat_indx_ur = int(round((lat_ur - lat0)/resol_lat))
-    lon_indx_ur = int(round((lon_ur - lon0)/resol_lon))
+    lat_indx_ll, lon_indx_ll = grid.indices(lat_ll, lon_ll)
+    lat_indx_ur, lon_indx_ur = grid.indices(lat_ur, lon_ur)
 
-    lat_indx_min = min(lat_indx_ll, lat_indx_ur)
-    lat_indx_max = max(lat_indx_ll, lat_indx_ur)
+    lat_indx_min = int(min(lat_indx_ll, lat_indx_ur))
+    lat_indx_max = int(max(lat_indx_ll, lat_indx_ur))
     nlats = lat_indx_max - lat_indx_min + 1
 
-    lon_indx_min = min(lon_indx_ll, lon_indx_ur)
-    lon_indx_max = max(lon_indx_ll, lon_indx_ur)
+    lon_indx_min = int(min(lon_indx_ll, lon_indx_ur))
+    lon_indx_max = int(max(lon_indx_ll, lon_indx_ur))
     nlons = lon_indx_max - lon_indx_min + 1
 
     # get slice for each dataset metric
@@ -295,4 +402,4 @@ def report_aoi_size(wthr_sets, resource, lon_ll, lat_ll, lon_ur, lat_ur):
 
     print(mess)
 
-    return
+    return lat_indx_min, lat_indx_max, lon_indx_min, lon_indx_max
@@ -0,0 +1,426 @@
+#-------------------------------------------------------------------------------
+# Name:        zarr_backend.py
+# Purpose:     optional Zarr directory store backend for the NetCDF writers and the populating pipelines
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Description: a store has the same variables, dimensions and attributes as the NetCDF file its schema would
+#              give; dimension names are held in the _ARRAY_DIMENSIONS attribute of each array, as xarray expects
+#              each chunk is a separate file so worker processes writing different chunks of a store need no
+#              locks, unlike a NetCDF file; ZarrDataset and ZarrVariable offer the subset of the netCDF4 interface
+#              used by the pipelines, including masking of fill values, so that pipeline code is unchanged
+#              stores are converted to and from NetCDF in bounded memory with zarr_to_nc and nc_to_zarr
+#              e.g.   python zarr_backend.py Tairalign_RCP45_CLMcom_CCLM_1961_2100.zarr
+#              requires the zarr package, which is only imported when a store is used
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+__prog__ = 'zarr_backend.py'
+__version__ = '0.0.0'
+__author__ = 's03mm5'
+
+from argparse import ArgumentParser
+from os.path import splitext
+from numpy import arange, asarray, dtype, isnan, issubdtype, floating, prod, zeros
+from numpy.ma import masked_array, MaskedArray
+
+from netCDF4 import Dataset, default_fillvals
+
+ZARR_EXT = '.zarr'
+DIMS_ATTR = '_ARRAY_DIMENSIONS'
+BACKENDS = ['netcdf', 'zarr']
+OUTPUT_BACKEND = 'netcdf'   # default, overridden by the output_backend setting
+BACKEND_NPROCS = 4          # worker processes writing to a Zarr store, overridden by the backend_nprocs setting
+MAX_MB = 512
+
+def _import_zarr():
+    """
+    zarr is optional - raise a clear error only when a store is used
+    """
+    try:
+        import zarr
+    except ImportError:
+        raise ImportError('the zarr package is required for the Zarr backend - install it with: pip install zarr')
+
+    return zarr
+
+def is_zarr(fname):
+    '''
+
+    '''
+    return fname.rstrip('/\\').endswith(ZARR_EXT)
+
+def backend_fname(fname, backend):
+    '''
+    output name for the backend: a .zarr store or a .nc file
+    '''
+    if backend not in BACKENDS:
+        raise ValueError('backend {} must be one of: {}'.format(backend, ', '.join(BACKENDS)))
+
+    root = splitext(fname.rstrip('/\\'))[0]
+    return root + (ZARR_EXT if backend == 'zarr' else '.nc')
+
+def _expand_key(key, shape):
+    """
+    slices with steps other than one are not supported by basic Zarr indexing - replace them with index arrays
+    returns the key and whether orthogonal indexing is needed
+    """
+    if not isinstance(key, tuple):
+        key = (key,)
+
+    if Ellipsis in key:
+        indx = key.index(Ellipsis)
+        key = key[:indx] + (slice(None),)*(len(shape) - len(key) + 1) + key[indx + 1:]
+
+    orthogonal = False
+    expanded = []
+    for elem, size in zip(key + (slice(None),)*(len(shape) - len(key)), shape):
+        if isinstance(elem, slice) and elem.step not in (None, 1):
+            expanded.append(arange(*elem.indices(size)))
+            orthogonal = True
+        elif not isinstance(elem, (slice, int)) and asarray(elem).ndim > 0:
+            expanded.append(asarray(elem))
+            orthogonal = True
+        else:
+            expanded.append(elem)
+
+    return tuple(expanded), orthogonal
+
+class ZarrVariable(object, ):
+    '''
+    netCDF4.Variable-like view of a Zarr array: values equal to the fill value or missing value are masked on
+    reading and masked values are written as the fill value
+    '''
+    def __init__(self, name, zarr_array):
+        """
+
+        """
+        self.name = name
+        self.array = zarr_array
+        self.dimensions = tuple(zarr_array.attrs.get(DIMS_ATTR, []))
+        self.shape = tuple(zarr_array.shape)
+        self.ndim = len(self.shape)
+        self.dtype = dtype(zarr_array.dtype).newbyteorder('=')
+        self.auto_mask = True
+
+    def _fill_value(self):
+        """
+
+        """
+        return self.array.fill_value
+
+    def chunking(self):
+        """
+
+        """
+        return list(self.array.chunks)
+
+    def filters(self):
+        """
+
+        """
+        return {'zlib': True}
+
+    def ncattrs(self):
+        """
+        attributes other than the dimension names, plus the fill value as NetCDF reports it
+        """
+        attrs = [attr for attr in self.array.attrs.keys() if attr != DIMS_ATTR]
+        if self._fill_value() is not None:
+            attrs.append('_FillValue')
+        return attrs
+
+    def getncattr(self, attr):
+        """
+
+        """
+        if attr == '_FillValue':
+            return self._fill_value()
+        return self.array.attrs[attr]
+
+    def setncattr(self, attr, val):
+        """
+
+        """
+        self.array.attrs[attr] = _json_attr(val)
+
+    def __getattr__(self, attr):
+        """
+        attributes such as missing_value are accessible as on a netCDF4 variable
+        """
+        if attr in ('array', 'name'):
+            raise AttributeError(attr)
+        try:
+            return self.array.attrs[attr]
+        except KeyError:
+            raise AttributeError(attr)
+
+    def set_auto_maskandscale(self, flag):
+        """
+
+        """
+        self.auto_mask = flag
+
+    def __getitem__(self, key):
+        """
+
+        """
+        key, orthogonal = _expand_key(key, self.shape)
+        vals = self.array.oindex[key] if orthogonal else self.array[key]
+
+        # as netCDF4 does, values equal to either the fill value or the missing_value attribute are masked
+        # ===============================================================================================
+        missing_vals = [val for val in (self._fill_value(), self.array.attrs.get('missing_value')) if val is not None]
+        if not self.auto_mask or len(missing_vals) == 0:
+            return vals
+
+        vals = asarray(vals)
+        mask = zeros(vals.shape, dtype=bool)
+        for missing_val in missing_vals:
+            if issubdtype(vals.dtype, floating) and isnan(missing_val):
+                mask |= isnan(vals)
+            else:
+                mask |= vals == missing_val
+
+        return masked_array(vals, mask = mask)
+
+    def __setitem__(self, key, vals):
+        """
+
+        """
+        key, orthogonal = _expand_key(key, self.shape)
+        if isinstance(vals, MaskedArray):
+            vals = vals.filled(self._fill_value())
+        else:
+            vals = asarray(vals)
+
+        if orthogonal:
+            self.array.oindex[key] = vals
+        else:
+            self.array[key] = vals
+
+class _Dimension(object, ):
+    '''
+    size of a dimension of a store
+    '''
+    def __init__(self, size):
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def isunlimited(self):
+        return False
+
+class ZarrDataset(object, ):
+    '''
+    netCDF4.Dataset-like view of a Zarr group
+    '''
+    def __init__(self, store_path, mode = 'r'):
+        """
+        mode is r or a; use create_zarr to create a store
+        """
+        zarr = _import_zarr()
+        self.store_path = store_path
+        self.group = zarr.open_group(store_path, mode = 'r' if mode == 'r' else 'r+')
+        self.data_model = 'ZARR'
+
+        self.variables = {}
+        self.dimensions = {}
+        for name, zarr_array in self.group.arrays():
+            var = ZarrVariable(name, zarr_array)
+            self.variables[name] = var
+            for dim_name, size in zip(var.dimensions, var.shape):
+                self.dimensions[dim_name] = _Dimension(size)
+
+    def ncattrs(self):
+        """
+
+        """
+        return list(self.group.attrs.keys())
+
+    def getncattr(self, attr):
+        """
+
+        """
+        return self.group.attrs[attr]
+
+    def setncattr(self, attr, val):
+        """
+
+        """
+        self.group.attrs[attr] = _json_attr(val)
+
+    def sync(self):
+        """
+        every write goes straight to its chunk file
+        """
+        return
+
+    def close(self):
+        """
+
+        """
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+def open_dataset(fname, mode = 'r'):
+    '''
+    open a NetCDF file or a Zarr store with the same interface
+    '''
+    if is_zarr(fname):
+        return ZarrDataset(fname, mode)
+
+    return Dataset(fname, mode)
+
+def _json_attr(val):
+    """
+    NumPy scalars and arrays, as read from NetCDF attributes, cannot be stored as JSON
+    """
+    if hasattr(val, 'tolist'):
+        return val.tolist()
+    return val
+
+def create_zarr(schema, store_path):
+    '''
+    create the store described by an NcSchema and return its path
+    '''
+    zarr = _import_zarr()
+    group = zarr.open_group(store_path, mode = 'w')
+    group.attrs.update({attr: _json_attr(val) for attr, val in schema.global_attrs.items()})
+
+    dim_sizes = dict(schema.dimensions)
+    zarr_v2 = int(zarr.__version__.split('.')[0]) < 3
+    for var_defn in schema.variables:
+        shape = tuple(dim_sizes[dim] or 0 for dim in var_defn['dims'])
+        chunks = schema._chunk_shape(var_defn)
+        if chunks is None:
+            chunks = tuple(max(1, size) for size in shape)
+
+        kwargs = {}
+        if not var_defn['compress']:
+            kwargs = {'compressor': None} if zarr_v2 else {'compressors': None}
+
+        # without a fill value NetCDF uses, and masks, the default for the type; Zarr would use zero
+        # ==========================================================================================
+        fill_value = var_defn['fill_value']
+        if fill_value is None:
+            fill_value = default_fillvals.get(dtype(var_defn['dtype']).str[1:])
+
+        # create_dataset is deprecated from zarr 3 in favour of create_array
+        # ==================================================================
+        create_fn = group.create_dataset if zarr_v2 else group.create_array
+        zarr_array = create_fn(var_defn['name'], shape = shape, chunks = chunks, dtype = var_defn['dtype'],
+                                                                                fill_value = fill_value, **kwargs)
+        zarr_array.attrs.update({attr: _json_attr(val) for attr, val in var_defn['attrs'].items()})
+        zarr_array.attrs[DIMS_ATTR] = list(var_defn['dims'])
+
+        if var_defn['values'] is not None:
+            ZarrVariable(var_defn['name'], zarr_array)[...] = var_defn['values']
+
+    return store_path
+
+def _copy_var(src_var, dst_var, max_bytes):
+    """
+    copy in slabs along the first axis aligned to the chunks of the destination, raw values without masking
+    """
+    src_var.set_auto_maskandscale(False)
+    dst_var.set_auto_maskandscale(False)
+    if src_var.ndim == 0:
+        dst_var[...] = src_var[...]
+        return
+
+    nrows = src_var.shape[0]
+    row_nbytes = src_var.dtype.itemsize*max(1, int(prod(src_var.shape[1:])))
+    chunking = dst_var.chunking()
+    chunk_nrows = 1 if chunking == 'contiguous' or chunking is None else chunking[0]
+    slab_nrows = max(chunk_nrows, (max_bytes // row_nbytes // chunk_nrows)*chunk_nrows)
+
+    for row_strt in range(0, nrows, slab_nrows):
+        row_end = min(row_strt + slab_nrows, nrows)
+        dst_var[row_strt:row_end] = src_var[row_strt:row_end]
+
+    return
+
+def _step_chunks(src_var):
+    """
+    chunk shape of src_var with a single step along the first axis
+    """
+    chunking = src_var.chunking()
+    if chunking == 'contiguous' or chunking is None:
+        chunking = src_var.shape
+
+    return (1,) + tuple(chunking[1:])
+
+def copy_dataset(src_fname, dst_fname, max_mb = MAX_MB, step_vars = None):
+    '''
+    copy a NetCDF file to a Zarr store or vice versa, keeping chunking, compression and attributes
+    variables in step_vars are chunked by single time steps so that separate processes can write each step
+    the destination is built in a temporary file or store which replaces dst_fname when complete
+    '''
+    from nc_schema_writer import schema_from_dset
+    from atomic_output import temp_fname, finalise_output, discard_temp
+
+    src_dset = open_dataset(src_fname, 'r')
+    step_vars = [] if step_vars is None else step_vars
+    chunk_shapes = {var_name: _step_chunks(src_dset.variables[var_name]) for var_name in step_vars}
+    schema = schema_from_dset(src_dset, chunk_shapes, with_values = False)
+
+    tmp_fname = temp_fname(dst_fname)
+    if is_zarr(dst_fname):
+        tmp_fname += ZARR_EXT
+    if schema.create(tmp_fname) is None:
+        src_dset.close()
+        return None
+
+    dst_dset = open_dataset(tmp_fname, 'a')
+    try:
+        for var_name, src_var in src_dset.variables.items():
+            _copy_var(src_var, dst_dset.variables[var_name], int(max_mb*1024*1024))
+    except (OSError, RuntimeError, ValueError) as err:
+        print('*** Error *** copying ' + src_fname + ' to ' + dst_fname + ' ' + str(err))
+        dst_dset.close()
+        src_dset.close()
+        discard_temp(tmp_fname)
+        return None
+
+    dst_dset.close()
+    src_dset.close()
+
+    return finalise_output(tmp_fname, dst_fname, checksum_flag = not is_zarr(dst_fname))
+
+def nc_to_zarr(nc_fname, store_path = None, max_mb = MAX_MB, step_vars = None):
+    '''
+
+    '''
+    return copy_dataset(nc_fname, store_path or backend_fname(nc_fname, 'zarr'), max_mb, step_vars)
+
+def zarr_to_nc(store_path, nc_fname = None, max_mb = MAX_MB):
+    '''
+
+    '''
+    return copy_dataset(store_path, nc_fname or backend_fname(store_path, 'netcdf'), max_mb)
+
+def main():
+    '''
+    convert a Zarr store to a NetCDF file or a NetCDF file to a Zarr store
+    '''
+    parser = ArgumentParser(description='Convert a Zarr store to NetCDF or a NetCDF file to a Zarr store')
+    parser.add_argument('src_fname', help='Zarr store or NetCDF file')
+    parser.add_argument('--out_fname', help='default is the source name with the other extension')
+    parser.add_argument('--max_mb', type=float, default=MAX_MB, help='memory limit for blocks copied')
+    args = parser.parse_args()
+
+    if is_zarr(args.src_fname):
+        zarr_to_nc(args.src_fname, args.out_fname, args.max_mb)
+    else:
+        nc_to_zarr(args.src_fname, args.out_fname, args.max_mb)
+
+if __name__ == '__main__':
+    main()
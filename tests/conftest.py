@@ -0,0 +1,13 @@
+#-------------------------------------------------------------------------------
+# Name:        conftest.py
+# Purpose:     make the NetCdfUtils modules importable by the tests
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+import sys
+from os.path import join, dirname, abspath
+
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'NetCdfUtils'))
@@ -0,0 +1,60 @@
+#-------------------------------------------------------------------------------
+# Name:        test_eclips_bands.py
+# Purpose:     check that the out-of-core band method of ECLIPS regridding matches the cell by cell method
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+from logging import getLogger
+from os.path import join
+
+import pytest
+from netCDF4 import Dataset
+from numpy.ma import getmaskarray
+from numpy.testing import assert_allclose, assert_array_equal
+
+import bench_fixtures as fixtures
+
+eclips_reorg = pytest.importorskip('eclips_reorg')
+from weather_datasets import _fetch_weather_nc_parms
+from eclips_classes import read_land_sea_mask, RegridIndexMap
+
+NLATS, NLONS = 200, 300         # input grid, output grid is a fifth of this in each direction
+NMONTHS = 2
+NYEARS = 3
+STRT_YEAR = 1961
+
+def _regrid(work_dir, inp_fns, out_name, band_nlats):
+    """
+    regrid each monthly input onto a fresh template and return the populated metric
+    """
+    out_fn = fixtures.make_harmonie_template(join(work_dir, out_name), 'Tairalign', NLATS//5, NLONS//5, NYEARS)
+    inpt_wthr_dict = _fetch_weather_nc_parms(inp_fns[0], 'ECLIPS2', 'ECLIPS2TMPLT', 'Monthly')[0]
+    eclips_wthr_dict = _fetch_weather_nc_parms(out_fn, 'HARMONIE', 'ECLIPS2', 'Monthly')[0]
+    eclips_wthr_dict['fn_tas'] = out_fn
+
+    lsmask = read_land_sea_mask(out_fn)
+    index_map = RegridIndexMap(inpt_wthr_dict['grid'], eclips_wthr_dict['grid'])
+    for imnth, inp_fn in enumerate(inp_fns, 1):
+        eclips_reorg._slice_resize(getLogger(__name__), inpt_wthr_dict, inp_fn, eclips_wthr_dict, 'fn_tas',
+                            'Tairalign', imnth, STRT_YEAR, STRT_YEAR, STRT_YEAR + NYEARS - 1, process_data_flag = True,
+                                                band_nlats = band_nlats, lsmask = lsmask, index_map = index_map)
+    with Dataset(out_fn, 'r') as nc_dset:
+        return nc_dset.variables['Tairalign'][:]
+
+@pytest.mark.parametrize('band_nlats', [7, NLATS//5])
+def test_band_method_matches_cell_method(tmp_path, band_nlats):
+    '''
+    bands which do and do not divide the output rows exactly
+    '''
+    work_dir = str(tmp_path)
+    inp_fns = fixtures.make_eclips_input_dir(join(work_dir, 'ECLIPS2_0_196190'), 'Tave', '196190', NLATS, NLONS,
+                                                                                                            NMONTHS)
+    cell_vals = _regrid(work_dir, inp_fns, 'Tairalign_cell.nc', None)
+    band_vals = _regrid(work_dir, inp_fns, 'Tairalign_band.nc', band_nlats)
+
+    assert getmaskarray(cell_vals).sum() < cell_vals.size       # some cells were populated
+    assert_array_equal(getmaskarray(band_vals), getmaskarray(cell_vals))
+    assert_allclose(band_vals.filled(0.0), cell_vals.filled(0.0), rtol = 1.0e-5)
@@ -0,0 +1,120 @@
+#-------------------------------------------------------------------------------
+# Name:        test_osgb.py
+# Purpose:     check the National Grid projection and the CHESS cell lookup computed from it
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+import pytest
+from numpy import arange, array, array_equal, float64, meshgrid, radians
+
+from osgb_fns import national_grid, wgs84_to_osgb, NG_LAT0, NG_LON0, NG_E0, NG_N0
+
+def _dms(degs, mins, secs):
+    """
+
+    """
+    return degs + mins/60.0 + secs/3600.0
+
+def test_national_grid_worked_example():
+    '''
+    worked example of the transverse Mercator projection in "A guide to coordinate systems in Great Britain":
+    OSGB36 52 39 27.2531 N, 1 43 4.5177 E is easting 651409.903, northing 313177.270
+    '''
+    eastings, northings = national_grid(radians(array([_dms(52, 39, 27.2531)])),
+                                                                        radians(array([_dms(1, 43, 4.5177)])))
+
+    assert abs(eastings[0] - 651409.903) < 0.001
+    assert abs(northings[0] - 313177.270) < 0.001
+
+def test_national_grid_true_origin():
+    '''
+    the true origin projects to the false origin
+    '''
+    eastings, northings = national_grid(radians(array([NG_LAT0])), radians(array([NG_LON0])))
+
+    assert abs(eastings[0] - NG_E0) < 1.0e-6
+    assert abs(northings[0] - NG_N0) < 1.0e-6
+
+def test_helmert_agrees_with_pyproj():
+    '''
+    the Helmert transformation is accurate to a few metres across Great Britain
+    '''
+    pytest.importorskip('pyproj')
+    lats = array([50.1, 51.5, 52.66, 54.9, 57.5, 58.6])
+    lons = array([-5.5, -0.1, 1.72, -3.2, -4.2, -3.1])
+
+    helmert = array(wgs84_to_osgb(lats, lons, use_pyproj = False))
+    exact = array(wgs84_to_osgb(lats, lons, use_pyproj = True))
+
+    assert abs(helmert - exact).max() < 5.0
+
+@pytest.fixture
+def meteogrid_df():
+    """
+    4 x 3 grid of 1 km cells whose origin is offset from zero, as a cropped CHESS grid would be, with the
+    cell at xindx 2, yindx 1 not listed
+    """
+    pandas = pytest.importorskip('pandas')
+    yindx, xindx = meshgrid(arange(3), arange(4), indexing='ij')
+    keep = ~((xindx == 2) & (yindx == 1))
+    xindx = xindx[keep]
+    yindx = yindx[keep]
+
+    return pandas.DataFrame({'xindx': xindx, 'yindx': yindx, 'easting': 250500.0 + xindx*1000.0,
+                             'northing': 600500.0 + yindx*1000.0, 'cell_lat': 55.0 + yindx*0.009,
+                             'cell_lon': -2.0 + xindx*0.016})
+
+def test_chess_grid_index_arithmetic(meteogrid_df):
+    '''
+    origin and extent derived from the listed cells; each index pair maps to its CSV record, or -1 if the cell
+    is unlisted or outside the grid
+    '''
+    from make_chess_lookup_fns import ChessGrid
+
+    chess_grid = ChessGrid(meteogrid_df)
+    assert (chess_grid.x0, chess_grid.y0) == (250500.0, 600500.0)
+    assert (chess_grid.nx, chess_grid.ny) == (4, 3)
+
+    recids = chess_grid.record_ids(meteogrid_df['xindx'].values, meteogrid_df['yindx'].values)
+    assert array_equal(recids, arange(len(meteogrid_df)))
+
+    recids = chess_grid.record_ids(array([2, -1, 4, 0, 3]), array([1, 0, 0, 3, 2]))
+    assert array_equal(recids, [-1, -1, -1, -1, len(meteogrid_df) - 1])
+
+def test_chess_grid_nearest_by_search(meteogrid_df):
+    '''
+    nearest in latitude and longitude among all cells or among those given
+    '''
+    from make_chess_lookup_fns import ChessGrid
+
+    chess_grid = ChessGrid(meteogrid_df)
+    recid = chess_grid.nearest_by_search(55.0080, -1.9685)
+    assert (meteogrid_df['xindx'][recid], meteogrid_df['yindx'][recid]) == (2, 0)
+
+    recid = chess_grid.nearest_by_search(55.0080, -1.9685, array([0, 5]))
+    assert recid == 5
+
+def test_osgb_lookup_matches_search(tmp_path, monkeypatch):
+    '''
+    cells computed from eastings and northings are those found by searching the meteogrid
+    '''
+    pytest.importorskip('pandas')
+    from pandas import read_csv
+    from bench_fixtures import make_chess_csvs
+    import make_chess_lookup_fns
+
+    meteo_fn, aoi_fn = make_chess_csvs(str(tmp_path / 'meteogrid.csv'), str(tmp_path / 'aoi_hwsd.csv'), 30, 20, 60)
+    monkeypatch.setattr(make_chess_lookup_fns, 'AOI_FN', aoi_fn)
+    meteogrid_df = read_csv(meteo_fn, sep=',')
+
+    osgb_df = make_chess_lookup_fns._make_lookup_table_from_osgb(make_chess_lookup_fns.ChessGrid(meteogrid_df),
+                                                                                            use_pyproj = False)
+    meteogrid_df['point'] = [(lat, lon) for lat, lon in zip(meteogrid_df['cell_lat'], meteogrid_df['cell_lon'])]
+    search_df = make_chess_lookup_fns._make_lookup_table_from_meteogrid_csv(meteogrid_df)
+
+    assert array_equal(osgb_df['xindx'].values, search_df['xindx'].values)
+    assert array_equal(osgb_df['yindx'].values, search_df['yindx'].values)
+    assert array_equal(osgb_df['easting'].values.astype(float64), search_df['easting'].values.astype(float64))
@@ -0,0 +1,118 @@
+#-------------------------------------------------------------------------------
+# Name:        test_regrid.py
+# Purpose:     check the conservative regridding weights of ConservativeRegridder
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+from types import SimpleNamespace
+
+import pytest
+from numpy import allclose, arange, deg2rad, full, isnan, nan as NaN, outer, sin
+from numpy.random import default_rng
+
+from regrid_fns import ConservativeRegridder, overlap_matrix, cell_edges
+
+def _grid(lat_ll, lat_ur, lon_ll, lon_ur, resol, descending = True):
+    """
+    regular grid with the attributes of WeatherGrid used by the regridder; latitudes are stored north to south
+    as in most of the weather datasets
+    """
+    lats = lat_ll + resol/2.0 + resol*arange(int(round((lat_ur - lat_ll)/resol)))
+    lons = lon_ll + resol/2.0 + resol*arange(int(round((lon_ur - lon_ll)/resol)))
+    if descending:
+        lats = lats[::-1]
+
+    return SimpleNamespace(lats = lats, lons = lons, nlats = len(lats), nlons = len(lons),
+                                                                        resol_lat = resol, resol_lon = resol)
+
+def _cell_areas(grid):
+    """
+    area of each cell in units of sine of latitude times degrees of longitude
+    """
+    lat_lo, lat_hi = cell_edges(grid.lats, grid.resol_lat)
+    lon_lo, lon_hi = cell_edges(grid.lons, grid.resol_lon)
+
+    return outer(sin(deg2rad(lat_hi)) - sin(deg2rad(lat_lo)), lon_hi - lon_lo)
+
+def _regrid(regridder, out_grid, vals):
+    """
+    regrid all output rows in a single band
+    """
+    row_min, row_max = regridder.input_rows(0, out_grid.nlats)
+
+    return regridder.regrid_band(vals[row_min:row_max, :], row_min, 0, out_grid.nlats)
+
+@pytest.fixture
+def grids():
+    """
+    fine input grid of 0.1 degrees regridded to 0.5 degrees over the same extent - the edges coincide
+    """
+    return _grid(50.0, 55.0, -5.0, 0.0, 0.1), _grid(50.0, 55.0, -5.0, 0.0, 0.5)
+
+def test_coincident_edges_have_no_slivers(grids):
+    '''
+    each output cell overlaps exactly 5 input latitudes and longitudes, rounding must not add neighbours
+    '''
+    inpt_grid, out_grid = grids
+    regridder = ConservativeRegridder(inpt_grid, out_grid)
+
+    assert (regridder.lat_wts.getnnz(axis=1) == 5).all()
+    assert (regridder.lon_wts.getnnz(axis=1) == 5).all()
+    assert (regridder.row_hi - regridder.row_lo == 5).all()
+
+def test_overlap_matrix_drops_rounding_overlaps():
+    '''
+    an input interval touching the output interval to within rounding is not a contributor
+    '''
+    out_lo, out_hi = cell_edges(arange(0.25, 2.0, 0.5), 0.5)
+    in_lo = out_lo.copy()
+    in_hi = out_hi.copy()
+    in_lo[1:] -= 1e-14
+    wts = overlap_matrix(out_lo, out_hi, in_lo, in_hi)
+
+    assert (wts.getnnz(axis=1) == 1).all()
+
+def test_constant_is_preserved(grids):
+    '''
+    a constant field regrids to the same constant in every output cell
+    '''
+    inpt_grid, out_grid = grids
+    regridder = ConservativeRegridder(inpt_grid, out_grid)
+    means, wts = _regrid(regridder, out_grid, full((inpt_grid.nlats, inpt_grid.nlons), 7.5))
+
+    assert allclose(means, 7.5)
+    assert (wts > 0).all()
+
+def test_area_integral_is_conserved(grids):
+    '''
+    area weighted sum of the output equals that of the input when the grids cover the same extent
+    '''
+    inpt_grid, out_grid = grids
+    regridder = ConservativeRegridder(inpt_grid, out_grid)
+    vals = default_rng(1).uniform(0.0, 10.0, (inpt_grid.nlats, inpt_grid.nlons))
+    means, wts = _regrid(regridder, out_grid, vals)
+
+    assert allclose(wts, _cell_areas(out_grid))
+    assert allclose((means*wts).sum(), (vals*_cell_areas(inpt_grid)).sum())
+
+def test_missing_values_are_renormalised(grids):
+    '''
+    masked input cells are excluded: the mean is of the valid cells only and a fully masked output cell has
+    no weight
+    '''
+    inpt_grid, out_grid = grids
+    regridder = ConservativeRegridder(inpt_grid, out_grid)
+    vals = full((inpt_grid.nlats, inpt_grid.nlons), 3.0)
+    vals[0:5, 0:5] = NaN            # the whole of the first output cell
+    vals[5:10, 5:7] = NaN           # part of a neighbouring output cell
+    vals[5:10, 7:10] = 6.0
+    means, wts = _regrid(regridder, out_grid, vals)
+
+    assert wts[0, 0] == 0.0
+    assert wts[1, 1] > 0.0 and wts[1, 1] < _cell_areas(out_grid)[1, 1]
+    assert allclose(means[1, 1], 6.0)
+    assert allclose(means[2:, :], 3.0)
+    assert not isnan(means).any()
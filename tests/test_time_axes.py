@@ -0,0 +1,67 @@
+#-------------------------------------------------------------------------------
+# Name:        test_time_axes.py
+# Purpose:     check time_axis bounds and midpoints against netCDF4.date2num
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+from datetime import timedelta
+
+import pytest
+from cftime import datetime as cf_datetime
+from netCDF4 import date2num
+from numpy import allclose
+
+from time_axes import time_axis, date_offsets, ndays_in_years
+
+CALENDARS = ['standard', 'noleap', '360_day']
+UNITS = ['days since 1900-01-01', 'hours since 1961-01-01 12:00:00']
+STRT_YEAR = 1961
+
+def _monthly_edges(nsteps, calendar):
+    """
+    start of each month and of the month following the last
+    """
+    return [cf_datetime(STRT_YEAR + indx // 12, indx % 12 + 1, 1, calendar = calendar) for indx in range(nsteps + 1)]
+
+def _daily_edges(nsteps, calendar):
+    """
+    start of each day and of the day following the last
+    """
+    strt = cf_datetime(STRT_YEAR, 1, 1, calendar = calendar)
+    return [strt + timedelta(days = indx) for indx in range(nsteps + 1)]
+
+@pytest.mark.parametrize('units', UNITS)
+@pytest.mark.parametrize('calendar', CALENDARS)
+@pytest.mark.parametrize('step, nsteps, edges_fn', [('monthly', 1680, _monthly_edges), ('daily', 5000, _daily_edges)])
+def test_time_axis_matches_date2num(step, nsteps, edges_fn, calendar, units):
+    '''
+    bounds are the step edges and midpoints lie half way between them
+    '''
+    midpoints, bounds = time_axis(STRT_YEAR, nsteps, step, units, calendar)
+    edges = date2num(edges_fn(nsteps, calendar), units, calendar = calendar)
+
+    assert bounds.shape == (nsteps, 2)
+    assert allclose(bounds[:, 0], edges[:-1])
+    assert allclose(bounds[:, 1], edges[1:])
+    assert allclose(midpoints, 0.5*(edges[:-1] + edges[1:]))
+
+@pytest.mark.parametrize('calendar', CALENDARS)
+def test_date_offsets_matches_date2num(calendar):
+    '''
+    individual dates, including the end of February in leap and non-leap years
+    '''
+    dates = [(1961, 1, 1), (1964, 2, 28), (1964, 3, 1), (2000, 2, 28), (2100, 12, 30)]
+    years, months, days = zip(*dates)
+    expected = date2num([cf_datetime(*date, calendar = calendar) for date in dates], UNITS[0], calendar = calendar)
+
+    assert allclose(date_offsets(years, months, days, UNITS[0], calendar), expected)
+
+@pytest.mark.parametrize('calendar, expected', [('standard', 14975), ('noleap', 14965), ('360_day', 14760)])
+def test_ndays_in_years(calendar, expected):
+    '''
+    the 41 years 1969 to 2009
+    '''
+    assert ndays_in_years(1969, 41, calendar) == expected
@@ -0,0 +1,123 @@
+#-------------------------------------------------------------------------------
+# Name:        test_zarr_backend.py
+# Purpose:     check the Zarr store backend against the NetCDF files it stands in for
+# Author:      Mike Martin
+# Created:     19/10/2026
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#!/usr/bin/env python
+
+import pytest
+
+zarr = pytest.importorskip('zarr')
+
+from netCDF4 import Dataset
+from numpy import arange, array_equal, float32, ones, zeros
+from numpy.ma import masked_array, is_masked
+
+from atomic_output import is_complete
+from bench_fixtures import make_populated_product
+from nc_schema_writer import NcSchema
+from zarr_backend import create_zarr, open_dataset, nc_to_zarr, zarr_to_nc, ZarrDataset
+
+NLATS, NLONS, NYEARS = 20, 30, 2
+
+def _schema():
+    """
+    small monthly product with coordinates and a compressed metric without a fill value
+    """
+    schema = NcSchema({'title': 'test product'})
+    schema.add_dimension('lat', NLATS)
+    schema.add_dimension('lon', NLONS)
+    schema.add_dimension('time', NYEARS*12)
+    schema.add_variable('lat', 'f4', ('lat',), values = arange(NLATS, dtype=float32))
+    schema.add_variable('lon', 'f4', ('lon',), values = arange(NLONS, dtype=float32))
+    schema.add_variable('Tairalign', 'f4', ('time', 'lat', 'lon'), chunksizes = (1, 8, 64), compress = True,
+                                                                                    attrs = {'units': 'Celsius'})
+    return schema
+
+@pytest.fixture
+def store(tmp_path):
+    """
+
+    """
+    return create_zarr(_schema(), str(tmp_path / 'product.zarr'))
+
+def test_create_zarr_matches_schema(store):
+    '''
+    dimensions, chunking clipped to the dimensions, attributes and coordinate values are as declared
+    '''
+    zdset = ZarrDataset(store)
+    var = zdset.variables['Tairalign']
+
+    assert zdset.getncattr('title') == 'test product'
+    assert {name: len(dim) for name, dim in zdset.dimensions.items()} == {'lat': NLATS, 'lon': NLONS,
+                                                                                            'time': NYEARS*12}
+    assert var.dimensions == ('time', 'lat', 'lon')
+    assert var.chunking() == [1, 8, NLONS]
+    assert var.units == 'Celsius'
+    assert array_equal(zdset.variables['lon'][:], arange(NLONS))
+
+def test_unwritten_values_are_masked(store):
+    '''
+    without a fill value the NetCDF default is used so that, as in a new NetCDF file, nothing is yet valid
+    '''
+    vals = ZarrDataset(store).variables['Tairalign'][0, :, :]
+
+    assert vals.mask.all()
+
+def test_variable_indexing(store):
+    '''
+    strided and masked writes, as made by the populating pipelines, read back as written
+    '''
+    var = ZarrDataset(store, 'a').variables['Tairalign']
+    vals = masked_array(ones((NYEARS, 5, NLONS), dtype=float32), mask = zeros((NYEARS, 5, NLONS), dtype=bool))
+    vals[:, 0, 0] = 7.0
+    vals[:, 1, 1] = 3.0
+    vals.mask[:, 2, 2] = True
+    var[2::12, 5:10, :] = vals
+
+    rslt = var[2::12, 5:10, :]
+    assert rslt.shape == (NYEARS, 5, NLONS)
+    assert (rslt[:, 0, 0] == 7.0).all() and (rslt[:, 1, 1] == 3.0).all()
+    assert rslt.mask[:, 2, 2].all() and not rslt.mask[:, 3, 3].any()
+    assert var[3, 5:10, :].mask.all()
+    assert array_equal(var[[2, 14], 6, [1, 2]], masked_array([[3.0, 1.0], [3.0, 1.0]]))
+    assert is_masked(var[..., 0][2, 4])
+
+def test_round_trip(tmp_path):
+    '''
+    NetCDF to Zarr and back keeps values, masks, chunking, compression and attributes
+    '''
+    nc_fname = make_populated_product(str(tmp_path / 'product.nc'), 'Tairalign', NLATS, NLONS, NYEARS,
+                                                                                chunksizes = (1, 8, 16), seed = 1)
+    with Dataset(nc_fname, 'a') as nc_dset:
+        nc_dset.title = 'test product'
+        nc_dset.variables['Tairalign'].units = 'Celsius'
+
+    store = nc_to_zarr(nc_fname, step_vars = ['Tairalign'])
+    assert is_complete(store)
+    assert open_dataset(store).variables['Tairalign'].chunking() == [1, 8, 16]
+
+    back_fname = zarr_to_nc(store, str(tmp_path / 'back.nc'))
+    with Dataset(nc_fname) as orig_dset, Dataset(back_fname) as back_dset:
+        orig_var = orig_dset.variables['Tairalign']
+        back_var = back_dset.variables['Tairalign']
+        assert back_dset.title == 'test product' and back_var.units == 'Celsius'
+        assert back_var.chunking() == [1, 8, 16] and back_var.filters()['zlib']
+        assert array_equal(back_var[:].mask, orig_var[:].mask)
+        assert array_equal(back_var[:].filled(0), orig_var[:].filled(0))
+        assert array_equal(back_dset.variables['lat'][:], orig_dset.variables['lat'][:])
+
+def test_existing_store_is_replaced(tmp_path):
+    '''
+    converting again replaces the store, which is complete afterwards
+    '''
+    nc_fname = make_populated_product(str(tmp_path / 'product.nc'), 'Tairalign', NLATS, NLONS, 1, seed = 2)
+    store = nc_to_zarr(nc_fname)
+    open_dataset(store, 'a').variables['Tairalign'][0, 0, 0] = -1.0
+
+    store = nc_to_zarr(nc_fname)
+    with Dataset(nc_fname) as nc_dset:
+        assert open_dataset(store).variables['Tairalign'][0, 0, 0] == nc_dset.variables['Tairalign'][0, 0, 0]
+    assert is_complete(store)